@@ -1,5 +1,6 @@
 # Package Imports
 from ..workspace import Block
+from ...data import manipulation
 
 # Twisted Imports
 from twisted.internet import defer
@@ -10,9 +11,6 @@ import math, operator, random, time
 
 now = time.time
 
-# Numpy
-import numpy
-
 
 class math_number (Block):
 	def eval (self):
@@ -218,21 +216,27 @@ class math_random_float (Block):
 
 
 class math_framed (Block):
+	"""
+	The maximum, minimum, average or rate of change of the input over
+	the last TIME seconds. Each evaluation is O(1) (amortised); see
+	octopus.data.manipulation.RollingWindow.
+	"""
+
 	outputType = float
 
 	_map = {
-		"MAX": lambda x, y: max(y),
-		"MIN": lambda x, y: min(y),
-		"AVERAGE": lambda x, y: numpy.mean(y),
-		"CHANGE": lambda x, y: numpy.polyfit(x, y, 1)[0],
+		"MAX": manipulation.RollingMax,
+		"MIN": manipulation.RollingMin,
+		"AVERAGE": manipulation.RollingMean,
+		"CHANGE": manipulation.RollingSlope,
 	}
 
 	def created (self):
 		self.on("connectivity-changed", self._onChange)
 		self.on("value-changed", self._onChange)
 
-		self._x = []
-		self._y = []
+		self._window = None
+		self._start = None
 
 	def disposed (self):
 		self.off("connectivity-changed", self._onChange)
@@ -243,8 +247,8 @@ class math_framed (Block):
 		if 'block' in data and data['block'] is self:
 			return
 
-		self._x = []
-		self._y = []
+		self._window = None
+		self._start = None
 		self.eval()
 
 	@defer.inlineCallbacks
@@ -253,50 +257,76 @@ class math_framed (Block):
 			frameLength = float(self.fields['TIME'])
 			value = yield self.getInputValue("INPUT")
 			time = now()
-			op = self._map[self.fields['OP']]
+			window = self._map[self.fields['OP']]
+
+			# Start again if the operation has changed. A new
+			# frame length applies from the next value.
+			if type(self._window) is not window:
+				self._window = window(frameLength)
+				self._start = None
+
+			self._window.frame = frameLength
 
 			if value is not None:
-				self._x.append(time)
-				self._y.append(float(value))
+				if self._start is None:
+					self._start = time
+
+				framedValue = self._window.push(time, float(value))
 
 				# Don't return a value until there is at least
 				# one frame length worth of data
-				if (time - self._x[0]) < frameLength:
+				if (time - self._start) < frameLength:
 					return
-
-				# Truncate if necessary
-				min_time = time - frameLength
-				if self._x[0] < min_time:
-					self._x = [x for x in self._x if x > min_time]
-					self._y = self._y[-len(self._x):]
-
-			try:
-				framedValue = float(op(self._x, self._y))
-			except:
-				# Emit a warning
-				framedValue = None
+			else:
+				framedValue = self._window.value
 		except:
 			log.err()
 		else:
 			defer.returnValue(framedValue)
 
 
+class _Accumulator (object):
+	# Running aggregates of the values in one throttle period.
+
+	def __init__ (self):
+		self.clear()
+
+	def clear (self):
+		self.count = 0
+		self.total = 0.
+		self.max = None
+		self.min = None
+		self.latest = None
+
+	def push (self, y):
+		if self.count == 0:
+			self.max = self.min = y
+		elif y > self.max:
+			self.max = y
+		elif y < self.min:
+			self.min = y
+
+		self.count += 1
+		self.total += y
+		self.latest = y
+
+
 class math_throttle (Block):
 	outputType = float
 
 	_map = {
-		"MAX": lambda x, y: max(y),
-		"MIN": lambda x, y: min(y),
-		"AVERAGE": lambda x, y: numpy.mean(y),
-		"LATEST": lambda x, y: y[-1]
+		"MAX": lambda a: a.max,
+		"MIN": lambda a: a.min,
+		"AVERAGE": lambda a: a.total / a.count,
+		"LATEST": lambda a: a.latest
 	}
 
 	def created (self):
 		self.on("connectivity-changed", self._onChange)
 		self.on("value-changed", self._onChange)
 
-		self._x = []
-		self._y = []
+		self._values = _Accumulator()
+		self._start = None
 		self._prevValue = None
 
 	def disposed (self):
@@ -308,8 +338,8 @@ class math_throttle (Block):
 		if 'block' in data and data['block'] is self:
 			return
 
-		self._x = []
-		self._y = []
+		self._values.clear()
+		self._start = None
 		self.eval()
 
 	@defer.inlineCallbacks
@@ -323,21 +353,23 @@ class math_throttle (Block):
 			if value is None:
 				return
 
-			self._x.append(time)
-			self._y.append(float(value))
+			if self._start is None:
+				self._start = time
+
+			self._values.push(float(value))
 
 			# Don't return a value until there is at least
 			# one frame length worth of data
-			if (time - self._x[0]) < frameLength:
+			if (time - self._start) < frameLength:
 				framedValue = self._prevValue
 
 			else:
-				framedValue = float(op(self._x, self._y))
+				framedValue = float(op(self._values))
 				self._prevValue = framedValue
 
 				# Truncate
-				self._x = []
-				self._y = []
+				self._values.clear()
+				self._start = None
 
 		except Exception:
 			log.err()
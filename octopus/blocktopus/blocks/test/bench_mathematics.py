@@ -0,0 +1,74 @@
+"""
+Benchmarks for the math_framed and math_throttle blocks: the cost
+of an evaluation should not depend on the number of samples in the
+frame.
+
+Run with: python -m octopus.blocktopus.blocks.test.bench_mathematics
+"""
+
+# System Imports
+from unittest.mock import patch
+import random
+import time
+
+# Twisted Imports
+from twisted.internet import defer
+
+# Package Imports
+from .. import mathematics, variables
+from ...workspace import Workspace
+from .... import data
+
+# The workspace turns on Deferred debugging, which would dominate.
+defer.Deferred.debug = False
+
+
+def _report (name, number, seconds):
+	print("{:<48s} {:>12,.0f} evals/s".format(name, number / seconds))
+
+
+def bench_block (blockType, op, frame, rate = 100., number = 20000):
+	clock = [1000.0]
+	rng = random.Random(0)
+
+	variable = data.Variable(float)
+	workspace = Workspace()
+	workspace.variables.add('global.global::input', variable)
+
+	source = variables.lexical_variable_get(workspace, 2)
+	source.setFieldValue('VAR', 'global.global::input')
+
+	block = blockType(workspace, 1)
+	block.created()
+	block.setFieldValue('TIME', frame)
+	block.setFieldValue('OP', op)
+	block.connectInput('INPUT', source, "value")
+
+	def step ():
+		clock[0] += 1 / rate
+		variable._push(rng.gauss(0, 1), clock[0])
+		block.eval()
+
+	with patch.object(mathematics, "now", lambda: clock[0]):
+		# Fill the frame first
+		for i in range(int(frame * rate)):
+			step()
+
+		t = time.perf_counter()
+
+		for i in range(number):
+			step()
+
+		elapsed = time.perf_counter() - t
+
+	name = "{:s} {:s} ({:,d} samples in frame)".format(blockType.__name__, op, int(frame * rate))
+	_report(name, number, elapsed)
+
+
+if __name__ == "__main__":
+	for frame in (10, 100):
+		for op in ("MAX", "MIN", "AVERAGE", "CHANGE"):
+			bench_block(mathematics.math_framed, op, frame)
+
+	for op in ("MAX", "AVERAGE", "LATEST"):
+		bench_block(mathematics.math_throttle, op, 10)
@@ -0,0 +1,99 @@
+from unittest.mock import patch
+
+from twisted.trial import unittest
+
+from .. import mathematics, variables
+from ...workspace import Workspace
+from .... import data
+
+
+# The input is sampled every 0.5 s, and TIME is 2 s.
+class _FramedMixin (object):
+	blockType = None
+
+	def setUp (self):
+		self.time = 1000.0
+		patcher = patch.object(mathematics, "now", lambda: self.time)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+		self.variable = data.Variable(float)
+		self.workspace = Workspace()
+		self.workspace.variables.add('global.global::input', self.variable)
+
+		self.input = variables.lexical_variable_get(self.workspace, 2)
+		self.input.setFieldValue('VAR', 'global.global::input')
+
+		self.block = self.blockType(self.workspace, 1)
+		self.block.created()
+		self.block.setFieldValue('TIME', 2)
+		self.block.setFieldValue('OP', 'MAX')
+		self.block.connectInput('INPUT', self.input, "value")
+
+	def _eval (self, op, values):
+		self.block.setFieldValue('OP', op)
+		results = []
+
+		for value in values:
+			self.time += 0.5
+			self.variable.set(value)
+			results.append(self.successResultOf(self.block.eval()))
+
+		return results
+
+
+class FramedBlockTestCase (_FramedMixin, unittest.TestCase):
+	blockType = mathematics.math_framed
+
+	def test_max (self):
+		self.assertEqual(
+			self._eval('MAX', [1, 5, 2, 3, 1, 0, 0, 0, 0]),
+			[None, None, None, None, 5, 5, 3, 3, 1]
+		)
+
+	def test_min (self):
+		self.assertEqual(
+			self._eval('MIN', [5, 1, 2, 3, 4, 5, 6]),
+			[None, None, None, None, 1, 1, 2]
+		)
+
+	def test_average (self):
+		self.assertEqual(
+			self._eval('AVERAGE', [1, 2, 3, 4, 5, 6]),
+			[None, None, None, None, 3, 4]
+		)
+
+	def test_change (self):
+		results = self._eval('CHANGE', [i * 3 for i in range(8)])
+		self.assertEqual(results[:4], [None, None, None, None])
+
+		for result in results[4:]:
+			self.assertAlmostEqual(result, 6)
+
+	def test_change_op (self):
+		self._eval('MAX', [1, 5, 2, 3])
+
+		# A new operation starts a new frame
+		self.assertEqual(self._eval('MIN', [4, 6, 8, 9, 10]), [None, None, None, None, 4])
+
+
+class ThrottleBlockTestCase (_FramedMixin, unittest.TestCase):
+	blockType = mathematics.math_throttle
+
+	def test_average (self):
+		self.assertEqual(
+			self._eval('AVERAGE', [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]),
+			[None, None, None, None, 3, 3, 3, 3, 3, 8]
+		)
+
+	def test_max (self):
+		self.assertEqual(
+			self._eval('MAX', [1, 5, 2, 3, 1, 0, 0, 0, 0, 0]),
+			[None, None, None, None, 5, 5, 5, 5, 5, 0]
+		)
+
+	def test_latest (self):
+		self.assertEqual(
+			self._eval('LATEST', [1, 5, 2, 3, 1, 0]),
+			[None, None, None, None, 1, 1]
+		)
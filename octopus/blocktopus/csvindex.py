@@ -0,0 +1,131 @@
+""" Sparse time indexes for experiment variable CSV files.
+
+An index is stored next to each CSV file (as <file>.csv.idx) and lists
+the time and byte offset of a data row every indexRows rows or every
+indexInterval seconds, whichever is sooner. Reading a time range can
+then seek to the nearest indexed row before the start time,
+instead of parsing the file from the beginning.
+
+Indexes are built when an experiment finishes, or lazily on the first
+range read. To (re)index the experiments in a data directory, run:
+
+    python -m octopus.blocktopus.csvindex <directory> """
+
+# Python Imports
+from bisect import bisect_left
+import json
+
+# Twisted Imports
+from twisted.python import log
+from twisted.python.filepath import FilePath
+
+
+indexRows = 1000
+indexInterval = 60.
+
+
+def indexFileFor (dataFile):
+	return dataFile.siblingExtension(".idx")
+
+
+def buildIndex (dataFile):
+	""" Scan {dataFile} and write its index. Returns the index. """
+
+	times = []
+	offsets = []
+	rows = 0
+	last = None
+	offset = 0
+
+	with dataFile.open() as fp:
+		for line in fp:
+			lineOffset = offset
+			offset += len(line)
+
+			# Skip comments
+			if line[0] == 35:
+				continue
+
+			try:
+				time = float(line.split(b',', 1)[0])
+			except ValueError:
+				continue
+
+			if last is None or rows >= indexRows or time - last >= indexInterval:
+				times.append(time)
+				offsets.append(lineOffset)
+				last = time
+				rows = 0
+
+			rows += 1
+
+	index = { "size": offset, "times": times, "offsets": offsets }
+
+	with indexFileFor(dataFile).open("w") as fp:
+		fp.write(json.dumps(index).encode('utf-8'))
+
+	return index
+
+
+def loadIndex (dataFile, build = True):
+	""" Return the index for {dataFile}, building it if it is missing
+	or out of date (and {build} is True). Returns None if there is no
+	usable index. """
+
+	indexFile = indexFileFor(dataFile)
+
+	try:
+		index = json.loads(indexFile.getContent())
+
+		if index["size"] == dataFile.getsize():
+			return index
+	except (IOError, OSError, ValueError, KeyError):
+		pass
+
+	if build:
+		return buildIndex(dataFile)
+
+	return None
+
+
+def seekOffset (index, start):
+	""" Return the offset of the last indexed row before {start}.
+
+	An indexed row at {start} itself may be preceded by other rows
+	with the same time, so the search stops short of it. """
+
+	i = bisect_left(index["times"], start) - 1
+
+	if i < 0:
+		return 0
+
+	return index["offsets"][i]
+
+
+def reindex (directory):
+	""" (Re)build the indexes of all CSV files under {directory}. """
+
+	count = 0
+
+	for dataFile in directory.walk():
+		if dataFile.isfile() and dataFile.basename().endswith(".csv"):
+			try:
+				buildIndex(dataFile)
+				count += 1
+			except:
+				log.err(None, "Unable to index " + dataFile.path)
+
+	return count
+
+
+if __name__ == "__main__":
+	import click
+
+	@click.command()
+	@click.argument('directory', type=click.Path(exists=True, file_okay=False, dir_okay=True))
+	def reindex_cli (directory):
+		""" Build time indexes for all experiment CSV files in DIRECTORY. """
+		count = reindex(FilePath(directory))
+		click.echo(f"Indexed {count} files.")
+
+	reindex_cli()
@@ -0,0 +1,303 @@
+""" Single-file binary storage for experiment variable data.
+
+All variables of an experiment are written to one append-only file as
+a sequence of records. Each record is a one-byte type and a four-byte
+payload length, followed by the payload:
+
+V - variable definition: id, type code, name.
+C - chunk: variable id, point count, first and last time, then a
+    float64 time column and a value column.
+F - footer: JSON index of the variables and the offset, length and
+    time range of each of their chunks.
+
+The file ends with the offset of the footer record and the magic
+string. If the file was not closed properly (e.g. after a crash), the
+index is rebuilt by scanning the records.
+
+Values are read back as they are from experiment CSV files (see
+experiment.iterVariable): ints and floats as numbers, and any other
+value as its str(), so bools are "True" or "False". """
+
+# Python Imports
+import json
+import struct
+
+# NumPy
+import numpy as np
+
+
+MAGIC = b"OCTDATA1"
+
+_record = struct.Struct("<cI")
+_variable = struct.Struct("<Hc")
+_chunk = struct.Struct("<HIdd")
+_tail = struct.Struct("<Q")
+
+_types = {
+	"float": (b"f", np.float64),
+	"int": (b"i", np.int64),
+	"bool": (b"b", np.bool_),
+	"str": (b"s", None),
+}
+_typeNames = dict((code, name) for name, (code, dtype) in _types.items())
+
+
+def _encode (typeName, values):
+	code, dtype = _types[typeName]
+
+	if dtype is None:
+		return json.dumps([str(v) for v in values]).encode('utf-8')
+
+	return np.asarray(values, dtype = dtype).tobytes()
+
+
+def _decode (typeName, data, count):
+	code, dtype = _types[typeName]
+
+	if dtype is None:
+		return json.loads(data.decode('utf-8'))
+
+	values = np.frombuffer(data, dtype, count).tolist()
+
+	# Stored natively, but read as from a CSV file.
+	if typeName == "bool":
+		return [str(v) for v in values]
+
+	return values
+
+
+def isDataStore (path):
+	try:
+		with open(path, "rb") as fp:
+			return fp.read(len(MAGIC)) == MAGIC
+	except IOError:
+		return False
+
+
+class DataStoreWriter (object):
+	""" Writes variable data to a single binary file. Values are
+	buffered per variable and written in chunks of chunkSize points,
+	or when flush() is called.
+
+	If a LogWriter is given as {writer}, records are written from its
+	thread (in order) while it is running, so that the reactor does
+	not wait on the disk. """
+
+	chunkSize = 4096
+
+	def __init__ (self, path, writer = None):
+		self._fp = open(path, "wb")
+		self._fp.write(MAGIC)
+		self._offset = len(MAGIC)
+		self._channels = []
+		self._index = {}
+		self._writer = writer
+
+	def channel (self, name, type):
+		""" Define a variable called {name}, with values of {type}
+		(float, int, bool or str). Returns a channel object whose
+		append(time, value) method records data. """
+
+		typeName = type.__name__ if type.__name__ in _types else "str"
+		id = len(self._channels)
+
+		channel = _Channel(self, id, name, typeName)
+		self._channels.append(channel)
+		self._index[name] = { "type": typeName, "chunks": [] }
+
+		self._writeRecord(
+			b"V",
+			_variable.pack(id, _types[typeName][0]) + name.encode('utf-8')
+		)
+
+		return channel
+
+	def flush (self):
+		""" Write all buffered values to disk (or queue them to be
+		written by the writer thread). """
+
+		for channel in self._channels:
+			channel.seal()
+
+		if not self._threaded:
+			self._fp.flush()
+
+	def close (self):
+		""" Write the footer and close the file. The writer (if any)
+		should be stopped first, so that all queued records have been
+		written. """
+
+		self._writer = None
+		self.flush()
+
+		footer = self._offset
+		self._writeRecord(b"F", json.dumps(self._index).encode('utf-8'))
+		self._fp.write(_tail.pack(footer) + MAGIC)
+		self._fp.close()
+
+	def _writeChunk (self, channel, times, values):
+		payload = _chunk.pack(channel.id, len(times), times[0], times[-1]) \
+			+ np.asarray(times, dtype = np.float64).tobytes() \
+			+ _encode(channel.typeName, values)
+
+		self._index[channel.name]["chunks"].append(
+			[self._offset + _record.size, len(payload), times[0], times[-1]]
+		)
+		self._writeRecord(b"C", payload)
+
+	@property
+	def _threaded (self):
+		return self._writer is not None and self._writer.running
+
+	def _writeRecord (self, type, payload):
+		record = _record.pack(type, len(payload)) + payload
+
+		if self._threaded:
+			self._writer.write(self._fp, record)
+		else:
+			self._fp.write(record)
+
+		self._offset += _record.size + len(payload)
+
+
+class _Channel (object):
+	def __init__ (self, store, id, name, typeName):
+		self.store = store
+		self.id = id
+		self.name = name
+		self.typeName = typeName
+
+		self._times = []
+		self._values = []
+
+	def append (self, time, value):
+		self._times.append(time)
+		self._values.append(value)
+
+		if len(self._times) >= self.store.chunkSize:
+			self.seal()
+
+	def seal (self):
+		if len(self._times):
+			self.store._writeChunk(self, self._times, self._values)
+			self._times = []
+			self._values = []
+
+	def close (self):
+		self.seal()
+
+
+class DataStoreReader (object):
+	""" Reads variable data from a file written by DataStoreWriter. """
+
+	def __init__ (self, path):
+		self._fp = open(path, "rb")
+
+		if self._fp.read(len(MAGIC)) != MAGIC:
+			self._fp.close()
+			raise ValueError(f"{path} is not an experiment data file")
+
+		self._index = self._readFooter() or self._scan()
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, *args):
+		self.close()
+
+	def close (self):
+		self._fp.close()
+
+	def variables (self):
+		""" Return a dict of variable name: type name. """
+		return dict((name, v["type"]) for name, v in self._index.items())
+
+	def read (self, name, start = None, end = None):
+		""" Return a list of (time, value) pairs for variable {name},
+		optionally only those between {start} and {end}. Only the
+		chunks that overlap the requested range are read. """
+
+		return list(self.iterRead(name, start, end))
+
+	def iterRead (self, name, start = None, end = None):
+		""" As read, but yields the (time, value) pairs one chunk
+		at a time. """
+
+		variable = self._index[name]
+		bounded = start is not None or end is not None
+		start = float('-inf') if start is None else start
+		end = float('inf') if end is None else end
+
+		for offset, length, t_min, t_max in variable["chunks"]:
+			if t_max < start or t_min > end:
+				continue
+
+			self._fp.seek(offset)
+			payload = self._fp.read(length)
+
+			id, count, t_min, t_max = _chunk.unpack_from(payload)
+			values_at = _chunk.size + 8 * count
+			times = np.frombuffer(payload, np.float64, count, _chunk.size).tolist()
+			values = _decode(variable["type"], payload[values_at:], count)
+
+			chunk = zip(times, values)
+
+			if bounded:
+				chunk = [(t, v) for t, v in chunk if start <= t <= end]
+
+			for point in chunk:
+				yield point
+
+	def _readFooter (self):
+		self._fp.seek(0, 2)
+		size = self._fp.tell()
+
+		if size < len(MAGIC) + _tail.size:
+			return None
+
+		self._fp.seek(size - len(MAGIC) - _tail.size)
+		tail = self._fp.read(_tail.size + len(MAGIC))
+
+		if tail[_tail.size:] != MAGIC:
+			return None
+
+		offset, = _tail.unpack_from(tail)
+		self._fp.seek(offset)
+		type, length = _record.unpack(self._fp.read(_record.size))
+
+		return json.loads(self._fp.read(length).decode('utf-8'))
+
+	def _scan (self):
+		index = {}
+		names = {}
+		offset = len(MAGIC)
+
+		self._fp.seek(offset)
+
+		while True:
+			header = self._fp.read(_record.size)
+
+			if len(header) < _record.size:
+				break
+
+			type, length = _record.unpack(header)
+			payload = self._fp.read(length)
+			offset += _record.size
+
+			# Truncated record at the end of the file
+			if len(payload) < length:
+				break
+
+			if type == b"V":
+				id, code = _variable.unpack_from(payload)
+				name = payload[_variable.size:].decode('utf-8')
+				names[id] = name
+				index[name] = { "type": _typeNames[code], "chunks": [] }
+
+			elif type == b"C":
+				id, count, t_min, t_max = _chunk.unpack_from(payload)
+				index[names[id]]["chunks"].append([offset, length, t_min, t_max])
+
+			offset += length
+
+		return index
@@ -1,9 +1,9 @@
 # Python Imports
 import uuid
-import os
 import json
 import time
 import re
+from math import sqrt
 import numpy as np
 
 now = time.time # shortcut
@@ -20,6 +20,10 @@ from octopus.events import EventEmitter
 
 # Package Imports
 from .database.dbutil import makeFinder
+from .logwriter import LogWriter
+from .datastore import DataStoreWriter, DataStoreReader
+from .export import exports
+from . import csvindex
 
 
 class Experiment (EventEmitter):
@@ -30,6 +34,21 @@ class Experiment (EventEmitter):
 	dataDir = None
 	log = Logger()
 
+	# Store the archives of numeric variables in the experiment
+	# directory rather than in memory for the duration of the run.
+	archiveToDisk = False
+
+	# Log records are written in batches of up to logBatchSize,
+	# at least every logFlushInterval seconds. This is the most
+	# data that can be lost if the process crashes.
+	logBatchSize = 1000
+	logFlushInterval = 1.0
+
+	# Variable data are stored in one CSV file per variable ("csv"),
+	# or all together in a single binary file ("binary", see datastore).
+	dataFormat = "csv"
+	dataStoreFileName = "data.bin"
+
 	@classmethod
 	def exists (cls, id):
 		d = cls.db.runQuery("SELECT guid FROM experiments WHERE guid = ?", (id,))
@@ -134,6 +153,19 @@ class Experiment (EventEmitter):
 		varsFile = self._experimentDir.child("variables")
 		openFiles = { "_events": eventFile, "_sketch": sketchFile }
 		usedFiles = {}
+		archivedVariables = []
+
+		logWriter = LogWriter(self.logBatchSize, self.logFlushInterval)
+		logWriter.start()
+		self.logWriter = logWriter
+
+		if self.dataFormat == "binary":
+			dataStore = DataStoreWriter(
+				self._experimentDir.child(self.dataStoreFileName).path,
+				logWriter
+			)
+		else:
+			dataStore = None
 
 		self.log.debug(
 			"Experiment {log_source.short_id!s} log files created."
@@ -151,8 +183,9 @@ class Experiment (EventEmitter):
 		# Log events emitted by the sketch (block changes, etc.)
 		# The idea is that with the snapshot and change log, the
 		# layout of the sketch could be replayed over the period
-		# of the experiment.
-		def onSketchEvent (protocol, topic, data):
+		# of the experiment. ({encoded} is the shared encoding cache
+		# passed to all subscribers, see Sketch.notifySubscribers.)
+		def onSketchEvent (protocol, topic, data, encoded = None):
 			self.log.debug(
 				"Experiment {log_source.short_id!s}: sketch event: {protocol}, {topic}, {data}",
 				protocol = protocol,
@@ -187,7 +220,7 @@ class Experiment (EventEmitter):
 				"data": data
 			}
 
-			file.write((json.dumps(event) + "\n").encode('utf-8'))
+			logWriter.write(file, json.dumps(event) + "\n")
 
 		sketch.subscribe(self, onSketchEvent)
 
@@ -245,15 +278,43 @@ class Experiment (EventEmitter):
 			except KeyError:
 				varName = unusedVarName(data['name'])
 				fileName = fileNameFor(varName)
-				logFile = self._experimentDir.child(fileName).create()
+				variable = workspace.variables.get(data['name'])
+
+				if dataStore is None:
+					logFile = self._experimentDir.child(fileName).create()
+					addUsedFile(varName, fileName, variable)
+
+					logWriter.write(
+						logFile,
+						f"# name:{data['name']}\n# type:{type(data['value']).__name__} \n# start:{self.startTime:.2f}\n"
+					)
+				else:
+					logFile = dataStore.channel(varName, type(data['value']))
+					addUsedFile(varName, self.dataStoreFileName, variable, "binary")
+
 				openFiles[varName] = logFile
-				addUsedFile(varName, fileName, workspace.variables.get(data['name']))
 
-				logFile.write(
-					f"# name:{data['name']}\n# type:{type(data['value']).__name__} \n# start:{self.startTime:.2f}\n".encode('utf-8')
-				)
+				if self.archiveToDisk:
+					try:
+						variable.setArchiveFile(
+							self._experimentDir.child(fileName[:-4] + '.archive').path
+						)
+						archivedVariables.append(variable)
+					except AttributeError:
+						pass
+
+			# Blocks of samples (see Variable.push_many) come with
+			# arrays of all their times and values.
+			if 'times' in data:
+				points = zip((data['times'] - self.startTime).tolist(), data['values'].tolist())
+			else:
+				points = ((data['time'] - self.startTime, data['value']), )
 
-			logFile.write(f"{data['time'] - self.startTime:.2f}, {data['value']}\n".encode('utf-8'))
+			for t, value in points:
+				if dataStore is None:
+					logWriter.writeValue(logFile, t, value)
+				else:
+					logFile.append(t, value)
 
 		# Update the open files list if a variable is renamed.
 		#
@@ -286,7 +347,7 @@ class Experiment (EventEmitter):
 		# Build a list of files and variables to be written to the variables
 		# list file, which is used to generate the var list
 		# when the experiment results are being displayed.
-		def addUsedFile (varName, fileName, variable):
+		def addUsedFile (varName, fileName, variable, format = "csv"):
 			try:
 				unit = str(variable.unit)
 			except AttributeError:
@@ -297,26 +358,34 @@ class Experiment (EventEmitter):
 					"name": varName,
 					"type": variable.type.__name__,
 					"unit": unit,
-					"file": fileName
+					"file": fileName,
+					"format": format
 				}
 			else:
 				usedFiles[varName] = {}
 
-		# Write all file data. This is called periodically during the
-		# experiment so that data variables that do not change very
-		# often is still written to disk, and will not be lost if the
-		# program crashes.
+		# Sync all file data to disk. Queued records are written by
+		# logWriter at least every logFlushInterval seconds; this is
+		# called periodically during the experiment so that the data
+		# will also survive an OS crash.
 		def flushFiles ():
-			try:
-				for file in openFiles.values():
-					file.flush()
-					os.fsync(file.fileno())
-			except:
-				log.err()
+			if dataStore is not None:
+				dataStore.flush()
+
+			logWriter.sync()
 
 		flushFilesLoop = task.LoopingCall(flushFiles)
 		flushFilesLoop.start(5 * 60, False).addErrback(log.err)
 
+		# Binary data are buffered per variable: hand them to logWriter
+		# as often as it writes, so that the same period of data can
+		# be lost in a crash as for CSV files.
+		if dataStore is not None:
+			flushDataLoop = task.LoopingCall(dataStore.flush)
+			flushDataLoop.start(self.logFlushInterval, False).addErrback(log.err)
+		else:
+			flushDataLoop = None
+
 		# Attempt to run the experiment. Make sure that eveything is
 		# cleaned up after the experiment, even in the event of an error.
 		try:
@@ -337,12 +406,50 @@ class Experiment (EventEmitter):
 
 			try:
 				flushFilesLoop.stop()
+
+				if flushDataLoop is not None:
+					flushDataLoop.stop()
 			except:
 				log.err()
 
+			if dataStore is not None:
+				dataStore.flush()
+
+			try:
+				yield logWriter.stop()
+			except:
+				log.err()
+
+			self.log.info(
+				"Experiment {log_source.short_id!s}: {records_written} log records written "
+				"in {flush_count} batches (max queue depth {max_queue_depth}, "
+				"max flush latency {max_flush_latency:.3f} s)",
+				**logWriter.metrics()
+			)
+
 			for file in openFiles.values():
 				file.close()
 
+			if dataStore is not None:
+				dataStore.close()
+
+			# Stop archiving variables into the experiment directory.
+			for variable in archivedVariables:
+				try:
+					variable.closeArchiveFile()
+				except:
+					log.err()
+
+			# Index the variable files for fast range reads.
+			threads.deferToThread(
+				indexFiles,
+				[
+					self._experimentDir.child(f["file"])
+					for f in usedFiles.values()
+					if f.get("format") == "csv"
+				]
+			).addErrback(log.err)
+
 			# Store completed time for experiment.
 			self.db.runOperation("""
 				UPDATE experiments SET finished_date = ? WHERE guid = ?
@@ -449,23 +556,53 @@ class CompletedExperiment (object):
 		]
 
 	@defer.inlineCallbacks
-	def loadData (self, variables, start, end):
+	def loadData (self, variables, start, end, method = "rdp", points = 400):
+		"""
+		Load the data of {variables} between {start} and {end}.
+
+		Series with more than {points} points are simplified using
+		{method}: "rdp" (Ramer-Douglas-Peucker, with a tolerance
+		derived from the range of the data) or "lttb" (Largest-
+		Triangle-Three-Buckets, down to {points} points). If {method}
+		is "none", all points are returned.
+		"""
+
+		loaders = yield self.dataLoaders(variables, start, end, method, points)
+		data = yield defer.gatherResults([load() for load in loaders])
+
+		defer.returnValue(data)
+
+	@defer.inlineCallbacks
+	def dataLoaders (self, variables, start, end, method = "rdp", points = 400):
+		"""
+		As loadData, but returns a list of functions which each load
+		the data of one variable (returning a Deferred) when called,
+		so that variables can be loaded and sent one at a time.
+
+		If {method} is "none", the data of each variable are not
+		loaded but returned as an iterator of points, read from the
+		file as they are consumed.
+		"""
+
 		date = yield self._fetchDateFromDb(self.id)
 		experimentDir = self._getExperimentDir(self.id, date)
 		storedVariablesData = yield self._getVariables(experimentDir)
 
-		data = yield defer.gatherResults(map(
-			lambda variable: self._getData(
-				experimentDir.child(variable["file"]),
-				variable["name"],
-				variable["type"],
+		def _loader (variable):
+			return lambda: self._getData(
+				experimentDir,
+				variable,
 				start,
-				end
-			),
-			map(lambda name: storedVariablesData[name], variables)
-		))
+				end,
+				method,
+				points,
+				iterate = True
+			)
 
-		defer.returnValue(data)
+		defer.returnValue([
+			_loader(storedVariablesData[name])
+			for name in variables
+		])
 
 	@defer.inlineCallbacks
 	def buildExcelFile (self, variables, time_divisor, time_dp):
@@ -495,16 +632,24 @@ class CompletedExperiment (object):
 
 			return name + unit
 
-		# Read data for each requested variable
-		cols = yield defer.gatherResults(map(
-			lambda variable: threads.deferToThread(
-				pd.read_csv,
+		def readColumn (variable):
+			if variable.get("format", "csv") == "binary":
+				return pd.DataFrame(
+					readVariable(experimentDir, variable),
+					columns = ["Time", varName(variable)]
+				).set_index("Time")
+
+			return pd.read_csv(
 				experimentDir.child(variable["file"]).path,
 				comment = '#',
 				index_col = 0,
 				usecols = [0, 1],
 				names = ["Time", varName(variable)]
-			),
+			)
+
+		# Read data for each requested variable
+		cols = yield defer.gatherResults(map(
+			lambda variable: threads.deferToThread(readColumn, variable),
 			map(lambda name: storedVariablesData[name.decode('ascii')], variables)
 		))
 
@@ -535,6 +680,45 @@ class CompletedExperiment (object):
 		bio.seek(0)
 		defer.returnValue(bio.read())
 
+	@defer.inlineCallbacks
+	def export (self, variables, time_divisor, time_dp, format = "xlsx"):
+		"""
+		Queue an export of {variables} to a file of {format} (csv,
+		xlsx or parquet), which is built in a worker process. Returns
+		an ExportJob (see export.py), which is already done if the
+		same export has been made before.
+		"""
+
+		expt = yield self._fetchFromDb(self.id)
+		experimentDir = self._getExperimentDir(self.id, expt['started_date'])
+		storedVariablesData = yield self._getVariables(experimentDir)
+
+		job = exports.submit(
+			self.id,
+			experimentDir,
+			[storedVariablesData[name] for name in variables],
+			time_divisor,
+			time_dp,
+			format,
+			title = expt['sketch_title'],
+			duration = expt['finished_date'] - expt['started_date']
+		)
+
+		defer.returnValue(job)
+
+	@defer.inlineCallbacks
+	def reindex (self):
+		"""
+		Rebuild the time indexes of the experiment's CSV files,
+		e.g. for experiments recorded before indexes were written.
+		"""
+
+		date = yield self._fetchDateFromDb(self.id)
+		experimentDir = self._getExperimentDir(self.id, date)
+		count = yield threads.deferToThread(csvindex.reindex, experimentDir)
+
+		defer.returnValue(count)
+
 	def _fetchFromDb (self, id):
 		def _done (rows):
 			try:
@@ -594,7 +778,9 @@ class CompletedExperiment (object):
 		defer.returnValue(variables)
 
 	@defer.inlineCallbacks
-	def _getData (self, dataFile, name, var_type, start = None, end = None):
+	def _getData (self, experimentDir, variable, start = None, end = None, method = "rdp", points = 400, iterate = False):
+		name = variable["name"]
+		var_type = variable["type"]
 
 		if var_type == "int":
 			cast = int
@@ -606,25 +792,37 @@ class CompletedExperiment (object):
 		if end is None:
 			start = None
 
+		if method not in simplifiers:
+			raise ValueError("Unknown simplification method: " + str(method))
+
+		# Without simplification, the data can be streamed from the file.
+		if iterate and method == "none":
+			defer.returnValue({
+				'name': name,
+				'type': var_type,
+				'data': iterVariable(experimentDir, variable, start, end)
+			})
+
 		def _readFile ():
-			data = []
-			with dataFile.open() as fp:
-				for line in fp:
-					# Skip comments
-					if line[0] == 35:  
-						# b'#' == 35
-						continue
+			data = readVariable(experimentDir, variable, start, end)
+
+			if method == "none":
+				return data
 
-					time, value = line.split(b',')
-					time = float(time)
+			if len(data) > points and cast in (int, float):
+				if method == "lttb":
+					return lttb(data, points)
 
-					if start is not None:
-						if time < start:
-							continue
-						if time > end:
-							break
+				if end is None:
+					try:
+						interval = data[-1][0] - data[0][0]
+					except IndexError:
+						interval = 0
+				else:
+					interval = end - start
 
-					data.append((time, cast(value.decode())))
+				spread = max(data, key = lambda x: x[1])[1] - min(data, key = lambda x: x[1])[1]
+				return rdp(data, epsilon = min(interval / 200., spread / 50.))
 
 			return data
 
@@ -634,26 +832,6 @@ class CompletedExperiment (object):
 			log.err()
 			defer.returnValue({})
 
-		# Make a readable variable name
-		#var_name = '.'.join(name.split('::')[1:])
-
-		if len(data) > 400 and cast in (int, float):
-			if end is None:
-				try:
-					interval = data[-1][0] - data[0][0]
-				except IndexError:
-					interval = 0
-			else:
-				interval = end - start
-
-			spread = max(data, key = lambda x: x[1])[1] - min(data, key = lambda x: x[1])[1]
-			print ("Simplifying data with interval " + str(interval) + " (currently %s points)" % len(data))
-			print ("Spread: %s" % spread)
-			print ("Epsilon: %s" % min(interval / 200., spread / 50.))
-			data = rdp(data, epsilon = min(interval / 200., spread / 50.))
-
-		print (" -> %s points" % len(data))
-
 		defer.returnValue({
 			'name': name,
 			'type': var_type,
@@ -661,37 +839,172 @@ class CompletedExperiment (object):
 		})
 
 
-from math import sqrt
+def indexFiles (dataFiles):
+	for dataFile in dataFiles:
+		csvindex.buildIndex(dataFile)
+
+
+def readVariable (experimentDir, variable, start = None, end = None):
+	"""
+	Read (time, value) pairs for a variable of a completed experiment
+	(as listed in the experiment's variables file), from either its
+	CSV file or the experiment's binary data file.
+	"""
+
+	return list(iterVariable(experimentDir, variable, start, end))
 
-def distance(a, b):
-	return  sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
 
-def point_line_distance(point, start, end):
-	if (start == end):
-		return distance(point, start)
+def iterVariable (experimentDir, variable, start = None, end = None):
+	"""
+	As readVariable, but yields the (time, value) pairs one at a time
+	so that a whole variable need not be held in memory.
+	"""
+
+	if variable.get("format", "csv") == "binary":
+		with DataStoreReader(experimentDir.child(variable["file"]).path) as store:
+			for point in store.iterRead(variable["name"], start, end):
+				yield point
+		return
+
+	if variable["type"] == "int":
+		cast = int
+	elif variable["type"] == "float":
+		cast = float
 	else:
-		n = abs(
-			(end[0] - start[0]) * (start[1] - point[1]) - (start[0] - point[0]) * (end[1] - start[1])
-		)
-		d = sqrt(
-			(end[0] - start[0]) ** 2 + (end[1] - start[1]) ** 2
-		)
-		return n / d
+		cast = str
+
+	for point in iterData(experimentDir.child(variable["file"]), cast, start, end):
+		yield point
+
+
+def readData (dataFile, cast, start = None, end = None):
+	"""
+	Read (time, value) pairs from a variable CSV file, optionally
+	only those between {start} and {end}. Range reads use the
+	file's time index (see csvindex), building it if necessary.
+	"""
+
+	return list(iterData(dataFile, cast, start, end))
+
+
+def iterData (dataFile, cast, start = None, end = None):
+	""" As readData, but yields the (time, value) pairs one at a time. """
+
+	with dataFile.open() as fp:
+		# Seek to the indexed row nearest to the start of the range.
+		if start is not None:
+			try:
+				fp.seek(csvindex.seekOffset(csvindex.loadIndex(dataFile), start))
+			except:
+				log.err()
+				fp.seek(0)
+
+		for line in fp:
+			# Skip comments
+			if line[0] == 35:
+				# b'#' == 35
+				continue
+
+			# Lines are written as "time, value\n"
+			time, value = line.rstrip(b'\r\n').split(b',', 1)
+			time = float(time)
+
+			if start is not None:
+				if time < start:
+					continue
+				if time > end:
+					break
+
+			yield (time, cast(value.decode().removeprefix(" ")))
 
-def rdp(points, epsilon):
+
+def rdp (points, epsilon):
 	"""
 	Reduces a series of points to a simplified version that loses detail, but
 	maintains the general shape of the series.
+
+	Ramer-Douglas-Peucker, using a stack of segments rather than recursion.
+	The distances of all points in a segment from its chord are computed
+	in one array operation.
 	"""
-	dmax = 0.0
-	index = 0
-	for i in range(1, len(points) - 1):
-		d = point_line_distance(points[i], points[0], points[-1])
-		if d > dmax:
-			index = i
-			dmax = d
-	if dmax >= epsilon:
-		results = rdp(points[:index+1], epsilon)[:-1] + rdp(points[index:], epsilon)
-	else:
-		results = [points[0], points[-1]]
-	return results
+	n = len(points)
+
+	if n < 3:
+		return list(points)
+
+	xy = np.asarray(points, dtype = float)
+	keep = np.zeros(n, dtype = bool)
+	keep[0] = keep[-1] = True
+	segments = [(0, n - 1)]
+
+	while len(segments):
+		first, last = segments.pop()
+
+		if last - first < 2:
+			continue
+
+		x0, y0 = xy[first]
+		dx, dy = xy[last] - xy[first]
+		inner = xy[first + 1:last]
+		norm = sqrt(dx * dx + dy * dy)
+
+		if norm == 0:
+			d = np.hypot(inner[:, 0] - x0, inner[:, 1] - y0)
+		else:
+			d = np.abs(dx * (y0 - inner[:, 1]) - (x0 - inner[:, 0]) * dy) / norm
+
+		i = int(np.argmax(d))
+
+		if d[i] > 0 and d[i] >= epsilon:
+			index = first + 1 + i
+			keep[index] = True
+			segments.append((first, index))
+			segments.append((index, last))
+
+	return [points[i] for i in np.flatnonzero(keep)]
+
+def lttb (points, threshold):
+	"""
+	Reduces a series of points to {threshold} points using the
+	Largest-Triangle-Three-Buckets algorithm.
+
+	The first and last points are kept. The points in between are
+	divided into threshold - 2 buckets, and from each bucket the point
+	forming the largest triangle with the previously selected point
+	and the average of the next bucket is chosen.
+	"""
+	n = len(points)
+
+	if threshold >= n or threshold < 3:
+		return list(points)
+
+	xy = np.asarray(points, dtype = float)
+	x = xy[:, 0]
+	y = xy[:, 1]
+	edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+
+	selected = [0]
+	a = 0
+
+	for i in range(threshold - 2):
+		lo, hi = edges[i], edges[i + 1]
+
+		if i + 2 < len(edges):
+			avg_x = x[hi:edges[i + 2]].mean()
+			avg_y = y[hi:edges[i + 2]].mean()
+		else:
+			avg_x = x[-1]
+			avg_y = y[-1]
+
+		area = np.abs(
+			(x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+		)
+
+		a = lo + int(np.argmax(area))
+		selected.append(a)
+
+	selected.append(n - 1)
+
+	return [points[i] for i in selected]
+
+simplifiers = ("rdp", "lttb", "none")
@@ -0,0 +1,422 @@
+""" Background export of completed experiment data to CSV, Excel or
+Parquet files.
+
+Exports run in a pool of worker processes. The data of each variable is
+read from disk in time order and the series are merged by time, one row
+at a time, so that the whole table is never held in memory. Rows are
+grouped in the same way as the original Excel download: times are
+divided by time_divisor and rounded to time_dp places, and the first
+row of each group is kept, with empty values taken from later rows in
+the group. Missing values are filled from the previous row.
+
+Finished files are kept in an "exports" directory inside the experiment
+directory, named by a hash of the export parameters, so a repeated
+request for the same export is served from the file on disk. """
+
+# Python Imports
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha1
+import multiprocessing
+import heapq
+import json
+import csv
+import os
+import re
+
+# Twisted Imports
+from twisted.internet import reactor, defer
+from twisted.python import log
+from twisted.python.filepath import FilePath
+
+
+formats = {
+	"csv": ".csv",
+	"xlsx": ".xlsx",
+	"parquet": ".parquet"
+}
+
+# How often (in rows) workers record their progress
+progressInterval = 10000
+
+
+def columnName (variable):
+	""" Generates a column title from a variable name """
+
+	if variable.get("unit", "") != '':
+		unit = ' (' + variable["unit"] + ')'
+	else:
+		unit = ''
+
+	if '::' in variable["name"]:
+		name = '.'.join(variable["name"].split('::')[1:])
+	else:
+		name = variable["name"]
+
+	return name + unit
+
+
+def exportKey (experimentId, variables, time_divisor, time_dp, format):
+	""" Returns the cache key for an export. """
+
+	key = json.dumps([experimentId, list(variables), time_divisor, time_dp, format])
+	return sha1(key.encode('utf-8')).hexdigest()
+
+
+def _tag (index, series):
+	for time, value in series:
+		yield (time, index, value)
+
+
+def mergeRows (series, time_divisor = 1, time_dp = None):
+	"""
+	Merge {series} (a list of iterables of (time, value) pairs, each
+	in time order) into rows of [time, value, value, ...].
+
+	Values are carried forward from earlier rows. Rows are grouped by
+	their time divided by {time_divisor} and rounded to {time_dp}
+	places, and one row is generated for each group.
+	"""
+
+	width = len(series)
+	current = [None] * width
+	row = None
+	key = None
+	rowTime = None
+
+	for time, index, value in heapq.merge(*[_tag(i, s) for i, s in enumerate(series)]):
+		rowKey = round(float(time) / time_divisor, time_dp)
+		current[index] = value
+
+		if rowKey != key:
+			if row is not None:
+				yield row
+
+			key = rowKey
+			rowTime = time
+			row = [key] + current
+
+		elif time == rowTime or row[index + 1] is None:
+			# Values at the time of the group's first row belong to that
+			# row; otherwise keep the first non-empty value in the group.
+			row[index + 1] = value
+
+	if row is not None:
+		yield row
+
+
+class CSVExporter (object):
+	def __init__ (self, path, columns, types, title):
+		self._fp = open(path, "w", newline = '')
+		self._writer = csv.writer(self._fp)
+		self._writer.writerow(["Time"] + columns)
+
+	def writeRow (self, row):
+		self._writer.writerow(["" if v is None else v for v in row])
+
+	def close (self):
+		self._fp.close()
+
+
+class ExcelExporter (object):
+	""" Writes an xlsx file in xlsxwriter's constant memory mode,
+	in which each row is written to disk once the next is started. """
+
+	def __init__ (self, path, columns, types, title):
+		import xlsxwriter
+
+		self._workbook = xlsxwriter.Workbook(path, { 'constant_memory': True })
+
+		# Remove invalid chars from expt title for Excel sheet title
+		sheet_title = re.sub(r'[\[\]\*\/\\\?]+', '', title)[0:30] or None
+		self._sheet = self._workbook.add_worksheet(sheet_title)
+		self._sheet.write_row(0, 0, ["Time"] + columns)
+		self._row = 1
+
+	def writeRow (self, row):
+		self._sheet.write_row(self._row, 0, row)
+		self._row += 1
+
+	def close (self):
+		self._workbook.close()
+
+
+class ParquetExporter (object):
+	""" Writes a Parquet file in row groups of {rowGroupSize} rows.
+	Requires pyarrow. """
+
+	rowGroupSize = 65536
+
+	def __init__ (self, path, columns, types, title):
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+
+		self._pa = pa
+		arrowTypes = {
+			"float": pa.float64(),
+			"int": pa.int64(),
+			"bool": pa.bool_()
+		}
+
+		self._schema = pa.schema(
+			[("Time", pa.float64())] +
+			[(c, arrowTypes.get(t, pa.string())) for c, t in zip(columns, types)]
+		)
+		self._casts = [None] + [None if t in arrowTypes else str for t in types]
+		self._writer = pq.ParquetWriter(path, self._schema)
+		self._rows = []
+
+	def writeRow (self, row):
+		self._rows.append(row)
+
+		if len(self._rows) >= self.rowGroupSize:
+			self._writeGroup()
+
+	def close (self):
+		self._writeGroup()
+		self._writer.close()
+
+	def _writeGroup (self):
+		if len(self._rows) == 0:
+			return
+
+		arrays = []
+		for i, (field, cast) in enumerate(zip(self._schema, self._casts)):
+			column = [row[i] for row in self._rows]
+
+			if cast is not None:
+				column = [None if v is None else cast(v) for v in column]
+
+			arrays.append(self._pa.array(column, type = field.type))
+
+		self._writer.write_table(self._pa.Table.from_arrays(arrays, schema = self._schema))
+		self._rows = []
+
+
+exporters = {
+	"csv": CSVExporter,
+	"xlsx": ExcelExporter,
+	"parquet": ParquetExporter
+}
+
+
+def progressFileFor (path):
+	return path + ".progress"
+
+
+def readProgress (path):
+	""" Returns the progress (0 - 1) recorded by the worker writing
+	to {path}, or 0 if none has been recorded yet. """
+
+	try:
+		with open(progressFileFor(path)) as fp:
+			return float(fp.read())
+	except (IOError, OSError, ValueError):
+		return 0.
+
+
+def runExport (experimentDir, variables, time_divisor, time_dp, format, path, title = "", duration = None):
+	"""
+	Write the data of {variables} (entries from the experiment's
+	variables file) to {path}. Runs in a worker process.
+
+	Progress is written to a file next to {path}, as the fraction of
+	{duration} (the length of the experiment in seconds) exported.
+	The output is written to a temporary file which is renamed when
+	complete, so {path} only exists once the export has finished.
+	"""
+
+	from .experiment import iterVariable
+
+	experimentDir = FilePath(experimentDir)
+	partial = path + ".part"
+	progressFile = progressFileFor(path)
+
+	def _progress (value):
+		with open(progressFile, "w") as fp:
+			fp.write(str(value))
+
+	exporter = exporters[format](
+		partial,
+		[columnName(v) for v in variables],
+		[v["type"] for v in variables],
+		title
+	)
+
+	try:
+		series = [iterVariable(experimentDir, v) for v in variables]
+		rows = mergeRows(series, time_divisor or 1, time_dp)
+
+		for count, row in enumerate(rows):
+			exporter.writeRow(row)
+
+			if duration and count % progressInterval == 0:
+				_progress(min(1., row[0] * (time_divisor or 1) / duration))
+
+	finally:
+		exporter.close()
+
+	os.replace(partial, path)
+
+	try:
+		os.remove(progressFile)
+	except OSError:
+		pass
+
+	return path
+
+
+class ExportJob (object):
+	""" An export that has been requested. {status} is one of
+	"queued", "running", "done" or "error". """
+
+	def __init__ (self, id, path, format):
+		self.id = id
+		self.path = path
+		self.format = format
+		self.status = "queued"
+		self.error = None
+		self._waiting = []
+
+	@property
+	def progress (self):
+		if self.status == "done":
+			return 1.
+		if self.status == "running":
+			return readProgress(self.path)
+		return 0.
+
+	def wait (self):
+		""" Returns a Deferred which fires with the job when it has
+		finished (successfully or not). """
+
+		if self.status in ("done", "error"):
+			return defer.succeed(self)
+
+		d = defer.Deferred()
+		self._waiting.append(d)
+		return d
+
+	def serialize (self):
+		return {
+			"id": self.id,
+			"format": self.format,
+			"status": self.status,
+			"progress": self.progress,
+			"error": self.error
+		}
+
+	def _started (self):
+		if self.status == "queued":
+			self.status = "running"
+
+	def _finished (self, error = None):
+		if error is None:
+			self.status = "done"
+		else:
+			self.status = "error"
+			self.error = str(error)
+
+		waiting, self._waiting = self._waiting, []
+		for d in waiting:
+			d.callback(self)
+
+
+class ExportQueue (object):
+	""" Runs exports in a pool of up to {maxWorkers} processes.
+	Jobs are identified by their cache key, so a request for an
+	export that is queued, running or finished returns the existing
+	job. """
+
+	maxWorkers = 2
+
+	def __init__ (self, maxWorkers = None):
+		if maxWorkers is not None:
+			self.maxWorkers = maxWorkers
+
+		self._jobs = {}
+		self._pool = None
+
+	def get (self, id):
+		return self._jobs.get(id, None)
+
+	def submit (self, experimentId, experimentDir, variables, time_divisor, time_dp, format, title = "", duration = None):
+		"""
+		Queue an export of {variables} (entries from the variables
+		file of the experiment in {experimentDir}) to {format}.
+		Returns an ExportJob.
+		"""
+
+		if format not in formats:
+			raise ValueError("Unknown export format: " + str(format))
+
+		id = exportKey(experimentId, [v["name"] for v in variables], time_divisor, time_dp, format)
+		job = self._jobs.get(id, None)
+
+		if job is not None and job.status != "error":
+			if job.status != "done" or os.path.exists(job.path):
+				return job
+
+		exportsDir = experimentDir.child("exports")
+		if not exportsDir.exists():
+			exportsDir.makedirs()
+
+		path = exportsDir.child(id + formats[format]).path
+		job = self._jobs[id] = ExportJob(id, path, format)
+
+		if os.path.exists(path):
+			job._finished()
+			return job
+
+		future = self._getPool().submit(
+			runExport,
+			experimentDir.path,
+			variables,
+			time_divisor,
+			time_dp,
+			format,
+			path,
+			title,
+			duration
+		)
+
+		# Futures can't report when a job starts, so it is marked as
+		# running when the pool picks it up (see _started).
+		future.add_done_callback(
+			lambda f: reactor.callFromThread(self._done, job, f)
+		)
+		reactor.callLater(0, self._poll, job, future)
+
+		return job
+
+	def shutdown (self):
+		if self._pool is not None:
+			self._pool.shutdown(wait = False, cancel_futures = True)
+			self._pool = None
+
+	def _getPool (self):
+		if self._pool is None:
+			self._pool = ProcessPoolExecutor(
+				self.maxWorkers,
+				mp_context = multiprocessing.get_context("spawn")
+			)
+			reactor.addSystemEventTrigger('during', 'shutdown', self.shutdown)
+
+		return self._pool
+
+	def _poll (self, job, future):
+		if future.running():
+			job._started()
+		elif not future.done():
+			reactor.callLater(0.5, self._poll, job, future)
+
+	def _done (self, job, future):
+		try:
+			future.result()
+		except Exception as e:
+			log.err(None, "Export " + job.id + " failed")
+			job._finished(e)
+		else:
+			job._finished()
+
+
+exports = ExportQueue()
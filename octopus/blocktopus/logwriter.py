@@ -0,0 +1,180 @@
+# Python Imports
+import os
+import time
+
+# Twisted Imports
+from twisted.internet import reactor, defer, task, threads
+from twisted.python import log
+from twisted.python.threadpool import ThreadPool
+
+
+class LogWriter (object):
+	""" Buffers records for experiment log files and writes them
+	in batches from a dedicated writer thread.
+
+	Records are queued in memory and flushed when {batchSize} records
+	are waiting, or every {flushInterval} seconds, whichever is sooner.
+	{flushInterval} is therefore the longest period of data that can
+	be lost if the process crashes.
+
+	All writes happen on a single thread, in the order that they
+	were queued. """
+
+	def __init__ (self, batchSize = 1000, flushInterval = 1.0):
+		self.batchSize = batchSize
+		self.flushInterval = flushInterval
+
+		self._queue = []
+		self._files = set()
+		self._pool = None
+		self._loop = None
+		self._shutdownTrigger = None
+
+		self.flushCount = 0
+		self.recordsWritten = 0
+		self.lastFlushLatency = 0.
+		self.maxFlushLatency = 0.
+		self.maxQueueDepth = 0
+
+	@property
+	def running (self):
+		return self._pool is not None
+
+	@property
+	def queueDepth (self):
+		return len(self._queue)
+
+	def metrics (self):
+		return {
+			"queue_depth": self.queueDepth,
+			"max_queue_depth": self.maxQueueDepth,
+			"flush_count": self.flushCount,
+			"records_written": self.recordsWritten,
+			"last_flush_latency": self.lastFlushLatency,
+			"max_flush_latency": self.maxFlushLatency
+		}
+
+	def start (self):
+		if self.running:
+			return
+
+		self._pool = ThreadPool(1, 1, "LogWriter")
+		self._pool.start()
+		self._shutdownTrigger = reactor.addSystemEventTrigger(
+			'during', 'shutdown', self._pool.stop
+		)
+
+		self._loop = task.LoopingCall(self.flush)
+		self._loop.start(self.flushInterval, False).addErrback(log.err)
+
+	@defer.inlineCallbacks
+	def stop (self):
+		""" Write any queued records and stop the writer thread.
+		Does nothing if the writer is not running, or is already
+		stopping. """
+
+		if self._loop is None:
+			return
+
+		loop, self._loop = self._loop, None
+
+		if loop.running:
+			loop.stop()
+
+		yield self.flush()
+
+		reactor.removeSystemEventTrigger(self._shutdownTrigger)
+		self._pool.stop()
+		self._pool = None
+
+	def write (self, file, text):
+		""" Queue {text} to be written to {file}. {text} may be str
+		or bytes, but each file must be given only one of these. """
+		self._append((file, None, text))
+
+	def writeValue (self, file, time, value):
+		""" Queue a "time, value" line to be written to {file}.
+		Formatting is done on the writer thread. """
+		self._append((file, time, value))
+
+	def _append (self, record):
+		self._queue.append(record)
+		self._files.add(record[0])
+
+		depth = len(self._queue)
+		if depth > self.maxQueueDepth:
+			self.maxQueueDepth = depth
+
+		if depth >= self.batchSize:
+			self.flush()
+
+	def flush (self):
+		""" Hand all queued records to the writer thread. Returns a
+		Deferred which fires once they have been written. """
+
+		if len(self._queue) == 0 or self._pool is None:
+			return defer.succeed(None)
+
+		batch = self._queue
+		self._queue = []
+
+		queued = time.perf_counter()
+
+		def _done (result):
+			self.flushCount += 1
+			self.recordsWritten += len(batch)
+			self.lastFlushLatency = time.perf_counter() - queued
+			self.maxFlushLatency = max(self.maxFlushLatency, self.lastFlushLatency)
+
+		d = threads.deferToThreadPool(reactor, self._pool, _writeBatch, batch)
+		d.addCallback(_done)
+		d.addErrback(log.err)
+
+		return d
+
+	def sync (self):
+		""" Flush and fsync all files that have been written to. """
+
+		files = list(self._files)
+		d = self.flush()
+
+		if self._pool is not None:
+			d.addCallback(lambda _: threads.deferToThreadPool(
+				reactor, self._pool, _syncFiles, files
+			))
+			d.addErrback(log.err)
+
+		return d
+
+
+def _writeBatch (batch):
+	# Join the lines for each file so that each file gets one write().
+	lines = {}
+
+	for file, t, value in batch:
+		try:
+			fileLines = lines[file]
+		except KeyError:
+			fileLines = lines[file] = []
+
+		if t is None:
+			fileLines.append(value)
+		else:
+			fileLines.append(f"{t:.2f}, {value}\n")
+
+	for file, fileLines in lines.items():
+		if isinstance(fileLines[0], bytes):
+			file.write(b"".join(fileLines))
+		else:
+			file.write("".join(fileLines).encode('utf-8'))
+
+		file.flush()
+
+
+def _syncFiles (files):
+	for file in files:
+		try:
+			os.fsync(file.fileno())
+		except ValueError:
+			# File has been closed
+			pass
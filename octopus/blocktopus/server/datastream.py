@@ -0,0 +1,132 @@
+# Twisted Imports
+from twisted.internet import defer, threads
+from twisted.internet.interfaces import IPushProducer
+from twisted.python import log
+
+# Zope Imports
+from zope.interface import implementer
+
+# System Imports
+from itertools import islice
+import json
+
+
+@implementer(IPushProducer)
+class DataStreamProducer (object):
+	""" Writes experiment data to a request as it is loaded.
+
+	Variables are loaded one at a time and their points written in
+	chunks of {chunkSize}. If the transport's buffers fill up, the
+	request pauses the producer and writing waits until it is resumed.
+
+	The data of a variable may be a list, or an iterator of points
+	(see CompletedExperiment.dataLoaders). An iterator is read one
+	chunk at a time in a thread, so that memory use stays flat
+	however many points there are.
+
+	The output is the same JSON list as a non-streamed response. """
+
+	chunkSize = 5000
+
+	def __init__ (self, request, loaders):
+		self._request = request
+		self._loaders = loaders
+		self._paused = False
+		self._stopped = False
+		self._resume = None
+
+	def pauseProducing (self):
+		self._paused = True
+
+	def resumeProducing (self):
+		self._paused = False
+
+		if self._resume is not None:
+			d, self._resume = self._resume, None
+			d.callback(None)
+
+	def stopProducing (self):
+		self._stopped = True
+		self.resumeProducing()
+
+	def _ready (self):
+		if self._paused:
+			self._resume = defer.Deferred()
+			return self._resume
+
+		return defer.succeed(None)
+
+	@defer.inlineCallbacks
+	def start (self):
+		""" Write all data to the request, then finish it.
+		Returns a Deferred which fires when done. """
+
+		request = self._request
+		request.setHeader(b"Content-Type", b"application/json")
+		request.registerProducer(self, True)
+
+		try:
+			request.write(b"[")
+
+			for i, load in enumerate(self._loaders):
+				result = yield load()
+
+				yield self._ready()
+				if self._stopped:
+					return
+
+				if i > 0:
+					request.write(b",")
+
+				if "data" not in result:
+					request.write(json.dumps(result).encode('utf-8'))
+					continue
+
+				request.write((
+					'{"name": ' + json.dumps(result["name"]) +
+					', "type": ' + json.dumps(result["type"]) +
+					', "data": ['
+				).encode('utf-8'))
+
+				data = result["data"]
+				points = iter(data)
+				first = True
+
+				try:
+					while True:
+						yield self._ready()
+						if self._stopped:
+							return
+
+						if isinstance(data, list):
+							chunk = list(islice(points, self.chunkSize))
+						else:
+							chunk = yield threads.deferToThread(list, islice(points, self.chunkSize))
+
+						if len(chunk) == 0:
+							break
+
+						chunk = json.dumps(chunk)[1:-1]
+						request.write(((", " if not first else "") + chunk).encode('utf-8'))
+						first = False
+				finally:
+					# Close the file of a partly read iterator
+					try:
+						points.close()
+					except AttributeError:
+						pass
+
+				request.write(b"]}")
+
+			request.write(b"]")
+
+		except:
+			# Headers have already been sent, so the error can
+			# only be logged, and the response cut short.
+			log.err()
+
+		finally:
+			request.unregisterProducer()
+
+			if not self._stopped:
+				request.finish()
@@ -0,0 +1,88 @@
+""" Encoding of messages sent over the editor websocket.
+
+Messages are JSON text frames unless the client negotiates the
+"octopus.msgpack" subprotocol. Then the high-rate topics (streams and
+properties) are sent as binary frames of MessagePack, and control
+messages stay as JSON. Clients may send either kind of frame.
+
+In binary stream messages the points of each stream are packed: "t"
+holds the times (relative to "zero") as little-endian float32 values
+and "v" the values as little-endian float64 values. Series that are
+not all numeric are sent as lists of points, as in JSON. """
+
+# System Imports
+import json
+
+# Package Imports
+import msgpack
+import numpy as np
+
+
+binaryTopics = ("streams", "properties")
+
+
+def packSeries (points):
+	""" Returns a {t, v} dict of packed arrays for a list of (time,
+	value) points, or None if they can't be packed. """
+
+	if not all(type(point) in (tuple, list) for point in points):
+		return None
+
+	try:
+		array = np.asarray(points, dtype = '<f8').reshape(-1, 2)
+	except (TypeError, ValueError):
+		return None
+
+	return {
+		"t": array[:, 0].astype('<f4').tobytes(),
+		"v": array[:, 1].tobytes()
+	}
+
+
+def unpackSeries (series):
+	""" Returns the list of (time, value) points of a packed series. """
+
+	return list(zip(
+		np.frombuffer(series["t"], '<f4').astype(float).tolist(),
+		np.frombuffer(series["v"], '<f8').tolist()
+	))
+
+
+def encodeJSON (message):
+	return json.dumps(message).encode('utf-8')
+
+
+def encodeBinary (message):
+	if message["command"] == "streams":
+		payload = dict(message["payload"])
+		payload["data"] = [_packStream(stream) for stream in payload["data"]]
+		message = dict(message, payload = payload)
+
+	return msgpack.packb(message, use_bin_type = True)
+
+
+def _packStream (stream):
+	packed = packSeries(stream["data"])
+
+	if packed is None:
+		return stream
+
+	packed["name"] = stream["name"]
+	return packed
+
+
+def encode (message, binary = False):
+	""" Returns the encoded message, and whether it is binary. Only
+	binaryTopics are sent as binary frames. """
+
+	if binary and message["command"] in binaryTopics:
+		return encodeBinary(message), True
+
+	return encodeJSON(message), False
+
+
+def decode (payload, isBinary):
+	if isBinary:
+		return msgpack.unpackb(payload, raw = False)
+
+	return json.loads(payload)
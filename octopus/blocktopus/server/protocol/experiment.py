@@ -1,4 +1,5 @@
 from time import time as now
+from twisted.internet import reactor
 from octopus.data import Variable
 
 def _format (variable):
@@ -14,7 +15,19 @@ def _format (variable):
 
 	return str(variable)
 
+def _get (variable, start, interval, max_points):
+	# Not all variable types can summarise their data.
+	if max_points is None or not getattr(variable, "summarises", False):
+		return variable.get(start, interval)
+
+	return variable.get(start, interval, max_points = max_points)
+
 class ExperimentProtocol (object):
+
+	# Default and minimum period (s) of subscribed stream updates
+	streamPushInterval = 1.0
+	minStreamPushInterval = 0.1
+
 	def __init__ (self, transport):
 		self.transport = transport
 
@@ -61,7 +74,19 @@ class ExperimentProtocol (object):
 				else:
 					end = now()
 
-				return self.sendStreams(sketch, experiment, streams, payload['start'], end, context, oneoff)
+				maxPoints = payload.get('maxPoints', None)
+
+				return self.sendStreams(sketch, experiment, streams, payload['start'], end, context, oneoff, maxPoints)
+
+			if topic == 'subscribe-streams':
+				return self.subscribeStreams(sketch, experiment, payload, context)
+			if topic == 'unsubscribe-streams':
+				return context.stopExperimentStreams(experiment)
+
+			if topic == 'subscribe-properties':
+				return self.subscribeProperties(sketch, experiment, payload, context)
+			if topic == 'unsubscribe-properties':
+				return context.stopExperimentProperties(experiment)
 
 			if topic == 'set-property':
 				return self.setProperty(sketch, experiment, payload['variable'], payload['value'], context)
@@ -142,7 +167,25 @@ class ExperimentProtocol (object):
 			context
 		)
 
-	def sendStreams (self, sketch, experiment, streams, start, end, context, oneoff = False):
+	def subscribeProperties (self, sketch, experiment, payload, context):
+		"""
+		Send the chosen properties to {context}, then send those that
+		change as they change, at most every {interval} seconds.
+		"""
+
+		if 'properties' in payload:
+			properties = payload['properties']
+		else:
+			properties = context.getExperimentProperties(experiment)
+
+		channel = PropertyChannel(
+			self, sketch, experiment, properties, context,
+			payload.get('interval', 0)
+		)
+
+		context.pushExperimentProperties(experiment, properties, channel)
+
+	def sendStreams (self, sketch, experiment, streams, start, end, context, oneoff = False, maxPoints = None):
 		variables = experiment.variables()
 		interval = end - start
 
@@ -160,7 +203,7 @@ class ExperimentProtocol (object):
 			"data": [
 				{
 					"name": name,
-					"data": list(map(_compress, variables[name].get(start, interval)))
+					"data": list(map(_compress, _get(variables[name], start, interval, maxPoints)))
 				}
 				for name in streams
 			]
@@ -176,5 +219,205 @@ class ExperimentProtocol (object):
 		)
 
 
+	def subscribeStreams (self, sketch, experiment, payload, context):
+		"""
+		Push new points of the chosen streams to {context} every
+		{interval} seconds, starting with the data since {start}.
+		"""
+
+		if 'streams' in payload:
+			streams = payload['streams']
+		else:
+			streams = context.getExperimentStreams(experiment)
+
+		start = payload.get('start', now())
+		if start < 0:
+			start = now() + start
+
+		interval = max(
+			payload.get('interval', self.streamPushInterval),
+			self.minStreamPushInterval
+		)
+		maxPoints = payload.get('maxPoints', None)
+
+		context.pushExperimentStreams(
+			experiment,
+			streams,
+			start,
+			interval,
+			lambda: self.sendStreamUpdate(sketch, experiment, context, maxPoints)
+		)
+
+	def sendStreamUpdate (self, sketch, experiment, context, maxPoints = None):
+		"""
+		Send the points of each subscribed stream that are newer than
+		the last point sent to {context}.
+
+		If the connection cannot keep up (its transport has paused
+		sending), no update is sent. The marks are not moved, so the
+		next update contains all of the points since the last one.
+		"""
+
+		if context.paused:
+			return
+
+		try:
+			subscription = context.subscribedExperiments[experiment.id]
+		except KeyError:
+			return
+
+		variables = experiment.variables()
+		marks = subscription['marks']
+		start = subscription['start']
+		end = now()
+		data = []
+
+		def _compress (point):
+			try:
+				return (round(point[0] - start, 1), round(point[1], 2))
+			except TypeError:
+				return 0
+
+		for name in subscription['streams']:
+			try:
+				variable = variables[name]
+			except KeyError:
+				continue
+
+			mark = marks.get(name, None)
+
+			# The first update for a stream includes the point at start,
+			# later ones only points after the last one sent. Points at
+			# the end time may be filled in (see Variable.get), so are
+			# left for the next update.
+			if mark is None:
+				points = _get(variable, start, end - start, maxPoints)
+				points = [p for p in points if start <= p[0] < end]
+			else:
+				points = _get(variable, mark, end - mark, None)
+				points = [p for p in points if mark < p[0] < end]
+
+			if len(points) == 0:
+				continue
+
+			marks[name] = points[-1][0]
+			data.append({
+				"name": name,
+				"data": list(map(_compress, points))
+			})
+
+		if len(data) == 0:
+			return
+
+		return self.send(
+			'streams',
+			{
+				"sketch": sketch.id,
+				"experiment": experiment.id,
+				"zero": round(start, 1),
+				"max": round(end, 1),
+				"delta": True,
+				"data": data
+			},
+			context
+		)
+
+
+class PropertyChannel (object):
+	"""
+	Sends the changes of an experiment's properties to a connection.
+
+	Changes are collected from the "variable-changed" events of the
+	workspace variables and sent together, at the end of the reactor
+	tick (if interval is 0) or after {interval} seconds. Only properties
+	whose formatted value differs from the value last sent to the
+	connection are included.
+
+	While the connection is paused, changes are held and sent once it
+	can accept them.
+	"""
+
+	pausedInterval = 0.5
+
+	def __init__ (self, protocol, sketch, experiment, properties, context, interval = 0):
+		self.protocol = protocol
+		self.sketch = sketch
+		self.experiment = experiment
+		self.properties = set(properties)
+		self.context = context
+		self.interval = interval
+
+		self._variables = experiment.sketch.workspace.variables
+		self._sent = {}
+		self._pending = set()
+		self._call = None
+
+	def start (self):
+		self._variables.on("variable-changed", self._onChange)
+
+		# Send all values first
+		self._pending.update(self.properties)
+		self.flush()
+
+	def stop (self):
+		# May be called more than once, or after the workspace
+		# has removed its listeners.
+		if self._onChange in self._variables.listeners("variable-changed"):
+			self._variables.off("variable-changed", self._onChange)
+
+		if self._call is not None and self._call.active():
+			self._call.cancel()
+
+		self._call = None
+
+	def _onChange (self, data):
+		if data["name"] not in self.properties:
+			return
+
+		self._pending.add(data["name"])
+
+		if self._call is None:
+			self._call = reactor.callLater(self.interval, self.flush)
+
+	def flush (self):
+		self._call = None
+
+		if len(self._pending) == 0:
+			return
+
+		if self.context.paused:
+			self._call = reactor.callLater(max(self.interval, self.pausedInterval), self.flush)
+			return
+
+		variables = self.experiment.variables()
+		sent = self._sent
+		data = {}
+
+		for name in self._pending:
+			try:
+				value = _format(variables[name])
+			except KeyError:
+				value = None
+
+			if name not in sent or sent[name] != value:
+				data[name] = sent[name] = value
+
+		self._pending.clear()
+
+		if len(data) == 0:
+			return
+
+		self.protocol.send(
+			'properties',
+			{
+				"sketch": self.sketch.id,
+				"experiment": self.experiment.id,
+				"delta": True,
+				"data": data
+			},
+			self.context
+		)
+
+
 class Error (Exception):
 	pass
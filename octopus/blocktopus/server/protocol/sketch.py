@@ -31,10 +31,9 @@ class SketchProtocol (object):
 
 		id = payload["sketch"]
 
-		def _onEvent (protocol, topic, payload):
-			# is id already in the data?
-			payload['sketch'] = id
-			self.transport.send(protocol, topic, payload, context)
+		def _onEvent (protocol, topic, payload, encoded = None):
+			# The sketch id is set in the payload by Sketch.notifySubscribers
+			self.transport.send(protocol, topic, payload, context, encoded)
 
 		def _sendData (sketch):
 			blockStates = {
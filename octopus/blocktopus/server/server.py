@@ -23,6 +23,8 @@ import click
 # Sibling Imports
 from octopus.blocktopus import sketch, experiment
 from octopus.blocktopus.server import websocket, template
+from octopus.blocktopus.server.datastream import DataStreamProducer
+from octopus.blocktopus.export import exports
 
 # System Imports
 import sys, os
@@ -401,6 +403,8 @@ class ShowExperiment (resource.Resource):
 			return GetExperimentData(self._id)
 		elif action == b"download":
 			return DownloadExperimentData(self._id)
+		elif action == b"export":
+			return ExportExperimentData(self._id)
 		elif action == b"delete":
 			return DeleteExperiment(self._id)
 		elif action == b"restore":
@@ -423,9 +427,21 @@ class GetExperimentData (resource.Resource):
 
 		start = _getArg(request, b'start', float)
 		end = _getArg(request, b'end', float)
+		method = _getArg(request, b'method', bytes.decode, 'rdp')
+		points = _getArg(request, b'points', int, 400)
+		stream = _getArg(request, b'stream', int, 0)
 
 		expt = experiment.CompletedExperiment(self._id)
-		expt.loadData(variables, start, end)\
+
+		# Streaming mode writes each variable as it is loaded.
+		if stream:
+			expt.dataLoaders(variables, start, end, method, points)\
+				.addCallback(lambda loaders: DataStreamProducer(request, loaders).start())\
+				.addErrback(_error, request)
+
+			return server.NOT_DONE_YET
+
+		expt.loadData(variables, start, end, method, points)\
 			.addCallback(_respondWithJSON, request)\
 			.addErrback(_error, request)
 
@@ -512,6 +528,105 @@ class DownloadExperimentData (resource.Resource):
 		request.finish()
 
 
+class ExportExperimentData (resource.Resource):
+	""" POST to start an export of experiment data (vars, time_divisor,
+	time_dp and format: csv, xlsx or parquet), which responds with
+	the job's status. GET /<job> for the status of the export, and
+	/<job>/file to download the finished file. """
+
+	def __init__ (self, id):
+		resource.Resource.__init__(self)
+		self._id = id
+
+	def getChild (self, jobId: bytes, request):
+		job = exports.get(jobId.decode())
+
+		if job is None:
+			return NoResource()
+
+		return ExportJob(self._id, job)
+
+	def render_POST (self, request):
+		self._render_POST(request)
+		return server.NOT_DONE_YET
+
+	@defer.inlineCallbacks
+	def _render_POST (self, request):
+		try:
+			expt = next((expt for expt in running_experiments() if expt.id == self._id), None)
+
+			if expt is not None:
+				raise Exception("Cannot download from running experiment.")
+
+			variables = [v.decode() for v in request.args[b'vars']]
+			time_divisor = _getArg(request, b'time_divisor', int, None)
+			time_dp = _getArg(request, b'time_dp', int, None)
+			format = _getArg(request, b'format', bytes.decode, 'xlsx')
+
+			job = yield experiment.CompletedExperiment(self._id).export(
+				variables, time_divisor, time_dp, format
+			)
+
+		except Exception as e:
+			_error(e, request)
+			return
+
+		_respondWithJSON(job.serialize(), request)
+
+
+class ExportJob (resource.Resource):
+
+	def __init__ (self, id, job):
+		resource.Resource.__init__(self)
+		self._id = id
+		self._job = job
+
+	def getChild (self, action: bytes, request):
+		if action == b"file" and self._job.status == "done":
+			return ExportFile(self._id, self._job)
+
+		return NoResource()
+
+	def render_GET (self, request):
+		request.setHeader('Content-Type', 'application/json')
+		return json.dumps(self._job.serialize()).encode('utf-8')
+
+
+class ExportFile (static.File):
+
+	contentTypes = dict(static.File.contentTypes, **{
+		".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+		".parquet": "application/octet-stream"
+	})
+
+	def __init__ (self, id, job):
+		static.File.__init__(self, job.path)
+		self._id = id
+		self._job = job
+
+	@defer.inlineCallbacks
+	def _getFilename (self):
+		expt = experiment.CompletedExperiment(self._id)
+		yield expt.load()
+
+		return '.'.join([
+			re.sub(r'[^a-zA-Z0-9]+', '_', expt.title).strip('_'),
+			time.strftime(
+				'%Y%m%d_%H%M%S',
+				time.gmtime(expt.finished_date)
+			),
+			self._job.format
+		])
+
+	def render_GET (self, request):
+		def _done (filename):
+			request.setHeader('Content-Disposition', 'attachment; filename=' + filename + ';')
+			static.File.render_GET(self, request)
+
+		self._getFilename().addCallbacks(_done, _error, errbackArgs = (request, ))
+		return server.NOT_DONE_YET
+
+
 class DeleteExperiment (resource.Resource):
 
 	isLeaf = True
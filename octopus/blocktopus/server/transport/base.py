@@ -16,16 +16,20 @@ class BaseTransport (object):
 
 		self.sketches = {}
 
-	def send (self, protocol, topic, payload, context):
+	def send (self, protocol, topic, payload, context, encoded = None):
 		"""Send a message back to the user via the transport protocol.
 		Each transport implementation should provide their own implementation
 		of this method.
 		The context is usually the context originally received from the
 		transport with the request. For example, a specific socket connection.
+		When the same message is sent to several contexts, the same encoded
+		dict is passed with each, in which the transport may keep the encoded
+		message to be reused.
 		@param [str] Name of the protocol
 		@param [str] Topic of the message
 		@param [dict] Message payload
 		@param [Object] Message context, dependent on the transport
+		@param [dict] Cache of the encoded message, or None
 		"""
 
 		raise NotImplementedError
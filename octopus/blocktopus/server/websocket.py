@@ -1,11 +1,15 @@
 from autobahn.twisted.websocket import WebSocketServerProtocol, WebSocketServerFactory
 from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+from autobahn.websocket.protocol import PreparedMessage
 from twisted.python import log
-from twisted.internet import reactor
+from twisted.internet import reactor, task
+from twisted.internet.interfaces import IPushProducer
+from zope.interface import implementer
 
-import json
+from collections import deque
 
 from .transport.base import BaseTransport
+from . import encoding
 
 
 class WebSocketRuntime (BaseTransport):
@@ -18,7 +22,7 @@ class WebSocketRuntime (BaseTransport):
 			]
 		})
 
-	def send (self, protocol, topic, payload, context):
+	def send (self, protocol, topic, payload, context, encoded = None):
 		if isinstance(payload, Exception):
 			payload = {
 				"type": payload.__class__.__name__,
@@ -35,25 +39,182 @@ class WebSocketRuntime (BaseTransport):
 			log.err("Response Error: " + str(payload))
 		# log.msg("Response", response)
 
-		context.sendMessage(json.dumps(response).encode('utf-8'))
+		if encoded is None:
+			context.queueMessage(protocol, topic, payload, encoding.encode(response, context.binary))
+			return
 
+		# A message that is being sent to several connections is encoded
+		# and framed once for each encoding. Connections using compression
+		# compress the prepared message themselves.
+		try:
+			prepared = encoded[context.binary]
+		except KeyError:
+			message, isBinary = encoding.encode(response, context.binary)
+			prepared = encoded[context.binary] = context.factory.prepareMessage(message, isBinary)
+
+		context.queueMessage(protocol, topic, payload, prepared)
+
+
+def _experimentKey (payload):
+	# Incremental updates can't replace each other.
+	if payload.get("delta", False):
+		return None
 
+	return payload.get("experiment", None)
+
+def _blockKey (payload):
+	return payload.get("id", None)
+
+
+@implementer(IPushProducer)
 class OctopusEditorProtocol (WebSocketServerProtocol):
+	""" An editor connection.
+
+	Messages are sent straight away unless the transport has paused
+	the connection because the client is not keeping up. Then they
+	are queued until it is resumed. Messages of the topics in
+	{latestOnly} replace any queued message with the same key, so only
+	the latest value is sent. Log messages are never dropped. Any other
+	message is dropped if {maxQueueLength} messages are queued. """
+
+	# Set if the client accepts binary frames (see encoding.py)
+	binary = False
+
+	maxQueueLength = 1000
+
+	# (protocol, topic): function returning the key of a message
+	# from its payload, or None if it can't be replaced.
+	latestOnly = {
+		("experiment", "properties"): _experimentKey,
+		("experiment", "streams"): _experimentKey,
+		("block", "state"): _blockKey
+	}
+
+	neverDrop = (
+		("experiment", "log"),
+	)
+
+	def __init__ (self):
+		WebSocketServerProtocol.__init__(self)
+
+		self.subscribedExperiments = {}
+		self.paused = False
+
+		self._queue = deque()
+		self._latest = {}
+
+		self.messagesSent = 0
+		self.messagesDropped = 0
+		self.messagesCoalesced = 0
+		self.maxQueueDepth = 0
+
+	@property
+	def queueLength (self):
+		return len(self._queue)
+
+	def metrics (self):
+		return {
+			"queue_length": self.queueLength,
+			"max_queue_length": self.maxQueueDepth,
+			"sent": self.messagesSent,
+			"dropped": self.messagesDropped,
+			"coalesced": self.messagesCoalesced
+		}
+
 	def onConnect (self, request):
+		if 'octopus.msgpack' in request.protocols:
+			self.binary = True
+			return 'octopus.msgpack'
+
 		return 'octopus'
 
 	def onOpen (self):
-		self.subscribedExperiments = {}
+		# The transport pauses the connection (see pauseProducing)
+		# when the client is not keeping up with the data sent.
+		self.registerProducer(self, True)
 		self.sendPing()
 
 	def onClose (self, wasClean, code, reason):
+		for subscription in self.subscribedExperiments.values():
+			self._stopPush(subscription)
+			self._stopChannel(subscription)
+
+		if self.messagesDropped or self.messagesCoalesced:
+			log.msg("Connection closed: {sent} messages sent, {dropped} dropped, {coalesced} replaced".format(**self.metrics()))
+
 		self.factory.runtime.disconnected(self)
 
-	def onMessage (self, payload, isBinary):
-		if isBinary:
-			raise ValueError("WebSocket message must be UTF-8")
+	def pauseProducing (self):
+		self.paused = True
+
+	def resumeProducing (self):
+		self.paused = False
+
+		# Sending may pause the connection again.
+		while len(self._queue) and not self.paused:
+			key, message = self._queue.popleft()
+
+			if key is not None:
+				del self._latest[key]
+
+			self._send(message)
+
+	def stopProducing (self):
+		self.paused = True
 
-		cmd = json.loads(payload)
+	def queueMessage (self, protocol, topic, payload, message):
+		""" Send {message}, either a PreparedMessage or a tuple of
+		(payload bytes, isBinary), or queue it if the connection is
+		paused. {protocol}, {topic} and {payload} are those of the
+		message before it was encoded. """
+
+		if not self.paused and len(self._queue) == 0:
+			return self._send(message)
+
+		key = None
+
+		try:
+			keyFn = self.latestOnly[(protocol, topic)]
+		except KeyError:
+			pass
+		else:
+			key = keyFn(payload)
+
+		if key is not None:
+			key = (protocol, topic, key)
+
+			try:
+				self._latest[key][1] = message
+			except KeyError:
+				pass
+			else:
+				self.messagesCoalesced += 1
+				return
+
+		elif len(self._queue) >= self.maxQueueLength \
+		and (protocol, topic) not in self.neverDrop:
+			self.messagesDropped += 1
+			return
+
+		item = [key, message]
+		self._queue.append(item)
+
+		if key is not None:
+			self._latest[key] = item
+
+		if len(self._queue) > self.maxQueueDepth:
+			self.maxQueueDepth = len(self._queue)
+
+	def _send (self, message):
+		self.messagesSent += 1
+
+		if isinstance(message, PreparedMessage):
+			self.sendPreparedMessage(message)
+		else:
+			self.sendMessage(*message)
+
+	def onMessage (self, payload, isBinary):
+		cmd = encoding.decode(payload, isBinary)
 
 		# log.msg("Command", cmd)
 
@@ -65,10 +226,20 @@ class OctopusEditorProtocol (WebSocketServerProtocol):
 		)
 
 	def subscribeExperiment (self, experiment):
+		try:
+			self._stopPush(self.subscribedExperiments[experiment.id])
+			self._stopChannel(self.subscribedExperiments[experiment.id])
+		except KeyError:
+			pass
+
 		self.subscribedExperiments[experiment.id] = {
 			"experiment": experiment,
 			"streams": [],
-			"properties": []
+			"properties": [],
+			"start": None,
+			"marks": {},
+			"push": None,
+			"channel": None
 		}
 
 	def chooseExperimentProperties (self, experiment, properties):
@@ -88,3 +259,52 @@ class OctopusEditorProtocol (WebSocketServerProtocol):
 			return self.subscribedExperiments[experiment.id]['streams']
 		except KeyError:
 			return []
+
+	def pushExperimentStreams (self, experiment, streams, start, interval, update):
+		""" Call {update} every {interval} seconds to send new points
+		of {streams}. The time of the last point sent of each stream
+		is kept in the subscription's "marks". """
+
+		subscription = self.subscribedExperiments[experiment.id]
+		self._stopPush(subscription)
+
+		subscription['streams'] = streams
+		subscription['start'] = start
+		subscription['marks'] = {}
+		subscription['push'] = task.LoopingCall(update)
+		subscription['push'].start(interval).addErrback(log.err)
+
+	def stopExperimentStreams (self, experiment):
+		try:
+			self._stopPush(self.subscribedExperiments[experiment.id])
+		except KeyError:
+			pass
+
+	def pushExperimentProperties (self, experiment, properties, channel):
+		""" Start {channel} (a PropertyChannel), which sends changes
+		to {properties} to this connection. """
+
+		subscription = self.subscribedExperiments[experiment.id]
+		self._stopChannel(subscription)
+
+		subscription['properties'] = properties
+		subscription['channel'] = channel
+		channel.start()
+
+	def stopExperimentProperties (self, experiment):
+		try:
+			self._stopChannel(self.subscribedExperiments[experiment.id])
+		except KeyError:
+			pass
+
+	def _stopPush (self, subscription):
+		if subscription['push'] is not None:
+			if subscription['push'].running:
+				subscription['push'].stop()
+
+			subscription['push'] = None
+
+	def _stopChannel (self, subscription):
+		if subscription['channel'] is not None:
+			subscription['channel'].stop()
+			subscription['channel'] = None
@@ -208,9 +208,15 @@ class Sketch (EventEmitter):
 			self.close()
 
 	def notifySubscribers (self, protocol, topic, payload, source = None):
-		for subscriber, notifyFn in self.subscribers.items():
+		# All subscribers are passed the same payload and the same
+		# {encoded} dict, so that the transport can encode the message
+		# once and send the same bytes to each (see WebSocketRuntime.send).
+		payload = dict(payload, sketch = self.id)
+		encoded = {}
+
+		for subscriber, notifyFn in list(self.subscribers.items()):
 			if subscriber is not source:
-				notifyFn(protocol, topic, payload)
+				notifyFn(protocol, topic, payload, encoded)
 
 	#
 	# Experiment
@@ -0,0 +1,51 @@
+"""
+Benchmarks for simplification of completed experiment data.
+
+Run with: python -m octopus.blocktopus.test.bench_experiment
+"""
+
+# System Imports
+import math
+import random
+import tempfile
+import time
+
+# Twisted Imports
+from twisted.python.filepath import FilePath
+
+# Package Imports
+from .. import experiment
+
+
+def _writeCSV (path, n):
+	# A slow sine wave with noise, at 10 Hz
+	with open(path, "w") as fp:
+		fp.write("# name:trace\n# type:float \n# start:0.00\n")
+		for i in range(n):
+			fp.write(f"{i * 0.1:.2f}, {math.sin(i / 5000.) + random.gauss(0, 0.05)}\n")
+
+
+def _time (name, fn, *args):
+	t = time.perf_counter()
+	result = fn(*args)
+	print("{:<40s} {:>8.3f} s {:>10,d} points".format(name, time.perf_counter() - t, len(result)))
+
+	return result
+
+
+def bench_simplify (n = 1000000):
+	with tempfile.TemporaryDirectory() as tmp:
+		dataFile = FilePath(tmp).child("trace.csv")
+		_writeCSV(dataFile.path, n)
+
+		data = _time("readData ({:,d} points)".format(n), experiment.readData, dataFile, float)
+
+	spread = max(y for x, y in data) - min(y for x, y in data)
+	epsilon = min((data[-1][0] - data[0][0]) / 200., spread / 50.)
+
+	_time("rdp", experiment.rdp, data, epsilon)
+	_time("lttb (400 points)", experiment.lttb, data, 400)
+
+
+if __name__ == "__main__":
+	bench_simplify()
@@ -0,0 +1,88 @@
+"""
+Benchmarks for encoding of websocket stream messages: bytes on the
+wire and server CPU per update, for JSON with permessage-deflate
+(as negotiated with browsers) and for binary frames.
+
+Run with: python -m octopus.blocktopus.test.bench_websocket
+"""
+
+# System Imports
+import math
+import random
+import time
+import zlib
+
+# Package Imports
+from ..server import encoding
+
+
+def _message (streams, points, start = 0):
+	return {
+		"protocol": "experiment",
+		"command": "streams",
+		"payload": {
+			"sketch": "sketch",
+			"experiment": "experiment",
+			"zero": 1600000000.0,
+			"max": 1600000000.0 + (start + points) * 0.1,
+			"data": [
+				{
+					"name": "stream" + str(s),
+					"data": [
+						(round((start + i) * 0.1, 1), round(math.sin((start + i) / 50.) * 10 + random.gauss(0, 0.1), 2))
+						for i in range(points)
+					]
+				}
+				for s in range(streams)
+			]
+		}
+	}
+
+
+class _Deflate (object):
+	# permessage-deflate with context takeover, as autobahn sends it.
+	def __init__ (self):
+		self._compress = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+	def __call__ (self, data):
+		return self._compress.compress(data) + self._compress.flush(zlib.Z_SYNC_FLUSH)[:-4]
+
+
+def _bench (name, messages, encode):
+	size = 0
+	t = time.perf_counter()
+
+	for message in messages:
+		size += len(encode(message))
+
+	elapsed = time.perf_counter() - t
+
+	print("{:<32s} {:>10,.0f} bytes/update {:>10.1f} us/update".format(
+		name, size / len(messages), elapsed / len(messages) * 1e6
+	))
+
+
+def bench_encoding (streams = 10, points = 10, updates = 500):
+	print(f"{streams} streams, {points} points per stream per update")
+
+	messages = [_message(streams, points, i * points) for i in range(updates)]
+
+	def _binary (message):
+		return encoding.encode(message, True)[0]
+
+	jsonDeflate = _Deflate()
+	binaryDeflate = _Deflate()
+
+	_bench("JSON", messages, encoding.encodeJSON)
+	_bench("JSON + permessage-deflate", messages, lambda m: jsonDeflate(encoding.encodeJSON(m)))
+	_bench("binary", messages, _binary)
+	_bench("binary + permessage-deflate", messages, lambda m: binaryDeflate(_binary(m)))
+	print()
+
+
+if __name__ == "__main__":
+	# Incremental updates
+	bench_encoding(10, 10, 500)
+
+	# Full windows (e.g. get-streams)
+	bench_encoding(10, 3000, 20)
@@ -0,0 +1,62 @@
+from twisted.trial import unittest
+from twisted.python.filepath import FilePath
+
+from unittest.mock import patch
+
+from .. import csvindex, experiment
+
+
+class CSVIndexTestCase (unittest.TestCase):
+	def setUp (self):
+		self.dataFile = FilePath(self.mktemp() + ".csv")
+		self.dataFile.parent().makedirs(ignoreExistingDirectory = True)
+
+		with self.dataFile.open("w") as fp:
+			fp.write(b"# name:temp\n# type:float \n# start:0.00\n")
+			for i in range(5000):
+				fp.write(f"{i * 0.1:.2f}, {i}\n".encode('utf-8'))
+
+	def test_build (self):
+		index = csvindex.buildIndex(self.dataFile)
+
+		# Every 60 s (600 rows) or 1000 rows
+		self.assertEqual(index["times"][:3], [0, 60, 120])
+		self.assertEqual(index["size"], self.dataFile.getsize())
+
+		with self.dataFile.open() as fp:
+			fp.seek(csvindex.seekOffset(index, 130))
+			self.assertEqual(fp.readline(), b"120.00, 1200\n")
+
+		self.assertEqual(csvindex.seekOffset(index, -1), 0)
+
+	def test_repeated_times (self):
+		# Rows before an indexed row may have the same time
+		with self.dataFile.open("w") as fp:
+			fp.write(b"3.31, 0\n3.32, 1\n3.33, 2\n3.33, 3\n3.33, 4\n3.34, 5\n")
+
+		with patch.object(csvindex, "indexRows", 2):
+			index = csvindex.buildIndex(self.dataFile)
+
+		self.assertEqual(index["times"], [3.31, 3.33, 3.33])
+
+		data = experiment.readData(self.dataFile, int, 3.33, 3.34)
+		self.assertEqual(data, [(3.33, 2), (3.33, 3), (3.33, 4), (3.34, 5)])
+
+	def test_lazy (self):
+		self.assertFalse(csvindex.indexFileFor(self.dataFile).exists())
+
+		data = experiment.readData(self.dataFile, int, 400, 400.2)
+		self.assertEqual(data, [(400.0, 4000), (400.1, 4001), (400.2, 4002)])
+		self.assertTrue(csvindex.indexFileFor(self.dataFile).exists())
+
+		# A stale index is rebuilt
+		with self.dataFile.open("a") as fp:
+			fp.write(b"500.00, 5000\n")
+
+		with patch.object(csvindex, "buildIndex", wraps = csvindex.buildIndex) as build:
+			self.assertEqual(experiment.readData(self.dataFile, int, 500, 600), [(500.0, 5000)])
+			self.assertEqual(build.call_count, 1)
+
+	def test_reindex (self):
+		self.assertEqual(csvindex.reindex(self.dataFile.parent()), 1)
+		self.assertTrue(csvindex.indexFileFor(self.dataFile).exists())
@@ -0,0 +1,137 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+from twisted.python.filepath import FilePath
+
+from decimal import Decimal
+
+from .. import datastore, experiment, logwriter
+from ..logwriter import LogWriter
+
+
+class DataStoreTestCase (unittest.TestCase):
+	def setUp (self):
+		self.path = self.mktemp()
+
+		store = datastore.DataStoreWriter(self.path)
+		store.chunkSize = 10
+
+		temp = store.channel("temp", float)
+		state = store.channel("state", str)
+		count = store.channel("count", int)
+
+		for i in range(25):
+			temp.append(i * 1.0, i * 0.5)
+			count.append(i * 2.0, i)
+		state.append(3.0, "on")
+		state.append(7.5, "off")
+
+		self.store = store
+
+	def test_read (self):
+		self.store.close()
+
+		with datastore.DataStoreReader(self.path) as reader:
+			self.assertEqual(reader.variables(), { "temp": "float", "state": "str", "count": "int" })
+			self.assertEqual(len(reader.read("temp")), 25)
+			self.assertEqual(reader.read("temp", 9, 11), [(9.0, 4.5), (10.0, 5.0), (11.0, 5.5)])
+			self.assertEqual(reader.read("count", 44), [(44.0, 22), (46.0, 23), (48.0, 24)])
+			self.assertEqual(reader.read("state"), [(3.0, "on"), (7.5, "off")])
+
+			# Only the overlapping chunk is read
+			self.assertEqual(len(reader._index["temp"]["chunks"]), 3)
+
+	def test_unclosed (self):
+		# No footer: the index is rebuilt by scanning records
+		self.store.flush()
+
+		with datastore.DataStoreReader(self.path) as reader:
+			self.assertEqual(reader.read("temp", 20), [(t * 1.0, t * 0.5) for t in range(20, 25)])
+			self.assertEqual(reader.read("state"), [(3.0, "on"), (7.5, "off")])
+
+		self.store.close()
+
+	def test_readVariable (self):
+		self.store.close()
+		directory = FilePath(self.path).parent()
+		variable = {
+			"name": "count",
+			"type": "int",
+			"file": FilePath(self.path).basename(),
+			"format": "binary"
+		}
+
+		self.assertEqual(experiment.readVariable(directory, variable, 0, 4), [(0.0, 0), (2.0, 1), (4.0, 2)])
+
+
+class FormatTestCase (unittest.TestCase):
+	def test_same_as_csv (self):
+		# Values read back from a data store are the same as those
+		# read back from CSV files, for each type of variable.
+		fixture = {
+			"float": (float, [1.5, 0.1, -2.0, 1e-9]),
+			"int": (int, [3, -1, 2 ** 40]),
+			"bool": (bool, [True, False, True]),
+			"str": (str, ["on", "off"]),
+			"decimal": (Decimal, [Decimal("1.50"), Decimal("2")])
+		}
+
+		directory = FilePath(self.mktemp())
+		directory.makedirs()
+		store = datastore.DataStoreWriter(directory.child("data.bin").path)
+
+		for name, (type, values) in fixture.items():
+			channel = store.channel(name, type)
+
+			with directory.child(name + ".csv").open("w") as fp:
+				fp.write(f"# name:{name}\n# type:{type.__name__} \n# start:0.00\n".encode('utf-8'))
+				logwriter._writeBatch([
+					(fp, float(t), value) for t, value in enumerate(values)
+				])
+
+			for t, value in enumerate(values):
+				channel.append(float(t), value)
+
+		store.close()
+
+		for name, (type, values) in fixture.items():
+			csv = experiment.readVariable(directory, {
+				"name": name, "type": type.__name__, "file": name + ".csv"
+			})
+			binary = experiment.readVariable(directory, {
+				"name": name, "type": type.__name__, "file": "data.bin", "format": "binary"
+			})
+
+			self.assertEqual(binary, csv)
+			self.assertEqual([v for t, v in csv], [v if type in (int, float) else str(v) for v in values])
+
+
+class ThreadedDataStoreTestCase (unittest.TestCase):
+	@defer.inlineCallbacks
+	def test_writer (self):
+		path = self.mktemp()
+		writer = LogWriter(flushInterval = 60)
+		writer.start()
+
+		store = datastore.DataStoreWriter(path, writer)
+		store.chunkSize = 10
+		temp = store.channel("temp", float)
+
+		for i in range(25):
+			temp.append(i * 1.0, i * 0.5)
+
+		# Records are queued for the writer thread
+		store.flush()
+		self.assertEqual(writer.queueDepth, 4)
+
+		yield writer.flush()
+
+		with datastore.DataStoreReader(path) as reader:
+			self.assertEqual(len(reader.read("temp")), 25)
+
+		# Once the writer has stopped, records are written directly
+		yield writer.stop()
+		temp.append(25.0, 12.5)
+		store.close()
+
+		with datastore.DataStoreReader(path) as reader:
+			self.assertEqual(reader.read("temp", 24), [(24.0, 12.0), (25.0, 12.5)])
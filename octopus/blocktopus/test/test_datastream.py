@@ -0,0 +1,101 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+
+import json
+
+from ..server.datastream import DataStreamProducer
+
+
+class _Request (object):
+	def __init__ (self):
+		self.written = []
+		self.producer = None
+		self.finished = False
+		self.headers = {}
+
+	def setHeader (self, name, value):
+		self.headers[name] = value
+
+	def registerProducer (self, producer, streaming):
+		self.producer = producer
+
+	def unregisterProducer (self):
+		self.producer = None
+
+	def write (self, data):
+		self.written.append(data)
+
+	def finish (self):
+		self.finished = True
+
+
+class DataStreamTestCase (unittest.TestCase):
+	def setUp (self):
+		self.results = [
+			{ "name": "a", "type": "float", "data": [(i, i * 0.5) for i in range(12)] },
+			{},
+			{ "name": "b", "type": "int", "data": [] },
+		]
+		self.loads = [defer.Deferred() for r in self.results]
+		self.request = _Request()
+		self.producer = DataStreamProducer(self.request, [lambda d = d: d for d in self.loads])
+		self.producer.chunkSize = 5
+
+	def test_stream (self):
+		d = self.producer.start()
+		self.assertIs(self.request.producer, self.producer)
+		self.assertEqual(self.request.headers[b"Content-Type"], b"application/json")
+
+		# Nothing written until data is loaded
+		self.assertEqual(self.request.written, [b"["])
+
+		# Pausing stops the output
+		self.producer.pauseProducing()
+		self.loads[0].callback(self.results[0])
+		self.assertEqual(self.request.written, [b"["])
+
+		self.producer.resumeProducing()
+		for load, result in zip(self.loads[1:], self.results[1:]):
+			load.callback(result)
+
+		self.assertTrue(self.request.finished)
+		self.assertIs(self.request.producer, None)
+
+		output = json.loads(b"".join(self.request.written).decode('utf-8'))
+		self.assertEqual(output, [
+			{ "name": "a", "type": "float", "data": [[i, i * 0.5] for i in range(12)] },
+			{},
+			{ "name": "b", "type": "int", "data": [] },
+		])
+
+		return d
+
+	def test_stop (self):
+		d = self.producer.start()
+		self.producer.stopProducing()
+		self.loads[0].callback(self.results[0])
+
+		self.assertEqual(self.request.written, [b"["])
+		self.assertFalse(self.request.finished)
+
+		return d
+
+	@defer.inlineCallbacks
+	def test_iterator (self):
+		# Iterators are read a chunk at a time
+		def points ():
+			for i in range(12):
+				yield (i, i * 0.5)
+
+		request = _Request()
+		result = { "name": "a", "type": "float", "data": points() }
+		producer = DataStreamProducer(request, [lambda: defer.succeed(result)])
+		producer.chunkSize = 5
+
+		yield producer.start()
+
+		self.assertTrue(request.finished)
+		self.assertEqual(
+			json.loads(b"".join(request.written).decode('utf-8')),
+			[{ "name": "a", "type": "float", "data": [[i, i * 0.5] for i in range(12)] }]
+		)
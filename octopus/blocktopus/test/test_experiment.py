@@ -0,0 +1,100 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from unittest.mock import Mock
+
+import json
+import math
+import os
+import sys
+
+from .. import experiment, sketch, workspace
+
+
+def _trace (n):
+	return [(i * 0.1, math.sin(i / 50.) + (i % 7) * 0.01) for i in range(n)]
+
+
+class SimplifyTestCase (unittest.TestCase):
+	def test_rdp (self):
+		line = [(float(i), 2. * i) for i in range(100)]
+		self.assertEqual(experiment.rdp(line, 0.1), [line[0], line[-1]])
+
+		points = [(0, 0), (1, 0), (2, 5), (3, 0), (4, 0)]
+		self.assertEqual(experiment.rdp(points, 1), [(0, 0), (2, 5), (4, 0)])
+		self.assertEqual(experiment.rdp(points, 0.5), points)
+		self.assertEqual(experiment.rdp(points, 10), [(0, 0), (4, 0)])
+
+	def test_rdp_long (self):
+		# Would exceed the recursion limit if implemented recursively
+		points = [(float(i), float(i % 2)) for i in range(3 * sys.getrecursionlimit())]
+		self.assertEqual(len(experiment.rdp(points, 0.5)), len(points))
+
+	def test_lttb (self):
+		points = _trace(10000)
+		result = experiment.lttb(points, 200)
+
+		self.assertEqual(len(result), 200)
+		self.assertEqual(result[0], points[0])
+		self.assertEqual(result[-1], points[-1])
+		self.assertEqual(result, sorted(result))
+
+		# Fewer points than the threshold
+		self.assertEqual(experiment.lttb(points[:10], 200), points[:10])
+
+
+class RunTestCase (unittest.TestCase):
+	def setUp (self):
+		self.workspace = workspace.Workspace()
+		self.workspace.run = lambda: self.running
+
+		self.running = defer.Deferred()
+
+		self.sketch = Mock(id = "s1", title = "Sketch", workspace = self.workspace, subscribers = {})
+		self.sketch.subscribe = lambda s, fn: sketch.Sketch.subscribe(self.sketch, s, fn)
+		self.sketch.unsubscribe = lambda s: sketch.Sketch.unsubscribe(self.sketch, s)
+
+		self.db = Mock()
+		self.db.runOperation.return_value = defer.succeed(None)
+
+		dataDir = self.mktemp()
+		os.makedirs(dataDir)
+
+		self.expt = experiment.Experiment(self.sketch)
+		self.expt.db = self.db
+		self.expt.dataDir = dataDir
+
+	def _finish (self, d):
+		# End the experiment (also on failure, to stop its writer thread).
+		if not self.running.called:
+			self.running.callback(None)
+
+		return d
+
+	@defer.inlineCallbacks
+	def test_sketch_events (self):
+		# Sketch events are passed to all subscribers, including
+		# the running experiment, with the shared encoding cache.
+		received = []
+		self.sketch.subscribe("editor", lambda *args: received.append(args))
+
+		d = self.expt.run()
+		self.addCleanup(self._finish, d)
+		self.assertEqual(len(self.sketch.subscribers), 2)
+
+		sketch.Sketch.notifySubscribers(self.sketch, "sketch", "renamed", { "title": "Renamed" })
+
+		self.assertEqual(len(received), 1)
+		self.assertIn(
+			("UPDATE experiments SET title = ? WHERE guid = ?", ("Renamed", self.expt.id)),
+			[(c[0][0].strip(), c[0][1]) for c in self.db.runOperation.call_args_list]
+		)
+
+		yield self._finish(d)
+
+		with open(self.expt._experimentDir.child("sketch.log").path) as fp:
+			events = [json.loads(line) for line in fp]
+
+		self.assertEqual([(e["protocol"], e["topic"], e["data"]["title"]) for e in events], [
+			("sketch", "renamed", "Renamed")
+		])
@@ -0,0 +1,121 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+from twisted.python.filepath import FilePath
+
+import csv
+import zipfile
+
+from .. import export
+
+
+class MergeRowsTestCase (unittest.TestCase):
+	def test_merge (self):
+		a = [(0, 1), (1, 2), (3, 3)]
+		b = [(0.5, "x"), (3, "y")]
+
+		self.assertEqual(list(export.mergeRows([a, b], 1, 1)), [
+			[0, 1, None],
+			[0.5, 1, "x"],
+			[1, 2, "x"],
+			[3, 3, "y"],
+		])
+
+	def test_grouped (self):
+		a = [(0, 1), (1, 2), (3, 3)]
+		b = [(0.5, "x"), (3, "y")]
+
+		# Times in seconds -> minutes to 0 dp, as DataFrame.groupby().first()
+		self.assertEqual(list(export.mergeRows([a, b], 60, 0)), [
+			[0, 1, "x"],
+		])
+
+		# Empty values are taken from later rows in the group
+		self.assertEqual(list(export.mergeRows([a, b], 2, 0)), [
+			[0, 1, "x"],
+			[2, 3, "y"],
+		])
+
+
+class ExportTestCase (unittest.TestCase):
+	def setUp (self):
+		self.dir = FilePath(self.mktemp())
+		self.dir.makedirs()
+
+		self.variables = [
+			{ "name": "a", "type": "float", "unit": "C", "file": "a.csv" },
+			{ "name": "sketch::b", "type": "int", "unit": "", "file": "b.csv" },
+		]
+
+		with self.dir.child("a.csv").open("w") as fp:
+			fp.write(b"# name:a\n")
+			for i in range(100):
+				fp.write(f"{i:.2f}, {i * 0.5}\n".encode('utf-8'))
+
+		with self.dir.child("b.csv").open("w") as fp:
+			fp.write(b"# name:b\n")
+			for i in range(0, 100, 10):
+				fp.write(f"{i + 0.5:.2f}, {i}\n".encode('utf-8'))
+
+	def _export (self, format):
+		path = self.dir.child("out." + format).path
+		result = export.runExport(self.dir.path, self.variables, 10, 0, format, path, "Test [1]", 100)
+
+		self.assertEqual(result, path)
+		self.assertFalse(FilePath(path + ".part").exists())
+		self.assertFalse(FilePath(export.progressFileFor(path)).exists())
+
+		return path
+
+	def test_csv (self):
+		with open(self._export("csv"), newline = '') as fp:
+			rows = list(csv.reader(fp))
+
+		self.assertEqual(rows[0], ["Time", "a (C)", "b"])
+		self.assertEqual(len(rows), 12)
+		self.assertEqual(rows[1], ["0.0", "0.0", "0"])
+		self.assertEqual(rows[2], ["1.0", "3.0", "0"])
+		self.assertEqual(rows[-1], ["10.0", "47.5", "90"])
+
+	def test_xlsx (self):
+		with zipfile.ZipFile(self._export("xlsx")) as xlsx:
+			workbook = xlsx.read("xl/workbook.xml").decode('utf-8')
+			sheet = xlsx.read("xl/worksheets/sheet1.xml").decode('utf-8')
+
+		self.assertIn('name="Test 1"', workbook)
+		self.assertIn('<dimension ref="A1:C12"/>', sheet)
+
+	def test_parquet (self):
+		try:
+			import pyarrow.parquet as pq
+		except ImportError:
+			raise unittest.SkipTest("pyarrow is not installed")
+
+		table = pq.read_table(self._export("parquet"))
+		self.assertEqual(table.column_names, ["Time", "a (C)", "b"])
+		self.assertEqual(table.num_rows, 10)
+
+	@defer.inlineCallbacks
+	def test_queue (self):
+		queue = export.ExportQueue(1)
+		self.addCleanup(queue.shutdown)
+
+		job = queue.submit("1", self.dir, self.variables, 10, 0, "csv")
+		self.assertIn(job.status, ("queued", "running"))
+
+		# The same request returns the same job
+		self.assertIs(queue.submit("1", self.dir, self.variables, 10, 0, "csv"), job)
+
+		yield job.wait()
+		self.assertEqual(job.status, "done")
+		self.assertEqual(job.progress, 1.)
+		self.assertTrue(FilePath(job.path).exists())
+		self.assertEqual(job.path, self.dir.child("exports").child(job.id + ".csv").path)
+
+		# A finished export is served from disk by a new queue
+		cached = export.ExportQueue(1)
+		job = cached.submit("1", self.dir, self.variables, 10, 0, "csv")
+		self.assertEqual(job.status, "done")
+		self.assertIsNone(cached._pool)
+
+	def test_unknown_format (self):
+		self.assertRaises(ValueError, export.ExportQueue().submit, "1", self.dir, self.variables, 10, 0, "doc")
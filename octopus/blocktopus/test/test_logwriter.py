@@ -0,0 +1,67 @@
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from ..logwriter import LogWriter
+
+
+class LogWriterTestCase (unittest.TestCase):
+	def setUp (self):
+		self.path = self.mktemp()
+		self.file = open(self.path, "wb")
+		self.writer = LogWriter(batchSize = 3, flushInterval = 60)
+		self.writer.start()
+
+	def tearDown (self):
+		self.file.close()
+
+	def _content (self):
+		with open(self.path, "r") as fp:
+			return fp.read()
+
+	@defer.inlineCallbacks
+	def test_batch (self):
+		self.writer.write(self.file, "# header\n")
+		self.writer.writeValue(self.file, 1, 2.5)
+		self.assertEqual(self.writer.queueDepth, 2)
+
+		# Third record reaches the batch size
+		self.writer.writeValue(self.file, 2.125, "a")
+		self.assertEqual(self.writer.queueDepth, 0)
+
+		self.writer.writeValue(self.file, 3, 4)
+		yield self.writer.stop()
+
+		self.assertEqual(self._content(), "# header\n1.00, 2.5\n2.12, a\n3.00, 4\n")
+
+		metrics = self.writer.metrics()
+		self.assertEqual(metrics["flush_count"], 2)
+		self.assertEqual(metrics["records_written"], 4)
+		self.assertEqual(metrics["max_queue_depth"], 3)
+
+	@defer.inlineCallbacks
+	def test_sync (self):
+		self.writer.writeValue(self.file, 1, 1)
+		yield self.writer.sync()
+		self.assertEqual(self._content(), "1.00, 1\n")
+
+		yield self.writer.stop()
+
+	@defer.inlineCallbacks
+	def test_start_stop (self):
+		# Starting again does nothing
+		pool = self.writer._pool
+		self.writer.start()
+		self.assertIs(self.writer._pool, pool)
+
+		# Stopping twice, also while the first stop is in progress
+		self.writer.writeValue(self.file, 1, 1)
+		d = self.writer.stop()
+		yield self.writer.stop()
+		yield d
+		yield self.writer.stop()
+
+		self.assertFalse(self.writer.running)
+		self.assertEqual(self._content(), "1.00, 1\n")
+
+		# Stopping before starting
+		yield LogWriter().stop()
@@ -0,0 +1,435 @@
+from twisted.internet import task
+from twisted.trial import unittest
+
+from unittest.mock import Mock, patch
+
+import json
+
+from octopus.data import data, manipulation
+
+from .. import sketch, workspace
+
+from ..server import websocket, encoding
+from ..server.protocol import experiment as experiment_protocol
+
+
+class StreamSubscriptionTestCase (unittest.TestCase):
+	def setUp (self):
+		self.time = 1000.
+		self.variable = data.Variable(float)
+
+		self.experiment = Mock(id = "e1")
+		self.experiment.variables.return_value = { "a": self.variable }
+		self.sketch = Mock(id = "s1")
+
+		self.runtime = websocket.WebSocketRuntime()
+		self.protocol = self.runtime.experimentProtocol
+
+		self.context = websocket.OctopusEditorProtocol()
+		self.context.sendMessage = Mock()
+		self.context.subscribeExperiment(self.experiment)
+
+		patcher = patch.object(experiment_protocol, "now", lambda: self.time)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self.addCleanup(self.context.stopExperimentStreams, self.experiment)
+
+	def _sent (self):
+		messages = [json.loads(c[0][0]) for c in self.context.sendMessage.call_args_list]
+		self.context.sendMessage.reset_mock()
+		return messages
+
+	def test_delta (self):
+		self.variable._push(1., 990.)
+		self.variable._push(2., 995.)
+
+		self.protocol.receive("subscribe-streams", {
+			"streams": ["a"], "start": 990., "interval": 60
+		}, self.sketch, self.experiment, self.context)
+
+		# The first update is sent immediately, with the data since start
+		messages = self._sent()
+		self.assertEqual(len(messages), 1)
+		self.assertEqual(messages[0]["command"], "streams")
+		self.assertTrue(messages[0]["payload"]["delta"])
+		self.assertEqual(messages[0]["payload"]["data"], [
+			{ "name": "a", "data": [[0, 1.], [5, 2.]] }
+		])
+
+		# Nothing new: nothing is sent
+		self.time = 1001.
+		self.protocol.sendStreamUpdate(self.sketch, self.experiment, self.context)
+		self.assertEqual(self._sent(), [])
+
+		# Only new points are sent
+		self.variable._push(3., 1002.)
+		self.variable._push(4., 1003.)
+		self.time = 1004.
+		self.protocol.sendStreamUpdate(self.sketch, self.experiment, self.context)
+		self.assertEqual(self._sent()[0]["payload"]["data"], [
+			{ "name": "a", "data": [[12, 3.], [13, 4.]] }
+		])
+
+	def test_coalesce (self):
+		self.context.pushExperimentStreams(
+			self.experiment, ["a"], 991., 60,
+			lambda: None
+		)
+
+		self.context.pauseProducing()
+
+		self.variable._push(1., 991.)
+		self.protocol.sendStreamUpdate(self.sketch, self.experiment, self.context)
+		self.variable._push(2., 992.)
+		self.protocol.sendStreamUpdate(self.sketch, self.experiment, self.context)
+		self.assertEqual(self._sent(), [])
+
+		# Once the client catches up, one update has all of the points
+		self.context.resumeProducing()
+		self.protocol.sendStreamUpdate(self.sketch, self.experiment, self.context)
+
+		messages = self._sent()
+		self.assertEqual(len(messages), 1)
+		self.assertEqual(messages[0]["payload"]["data"], [
+			{ "name": "a", "data": [[0, 1.], [1, 2.]] }
+		])
+
+	def test_unsubscribe (self):
+		self.protocol.receive("subscribe-streams", {
+			"streams": ["a"], "interval": 60
+		}, self.sketch, self.experiment, self.context)
+
+		push = self.context.subscribedExperiments["e1"]["push"]
+		self.assertTrue(push.running)
+
+		self.protocol.receive("unsubscribe-streams", {}, self.sketch, self.experiment, self.context)
+		self.assertFalse(push.running)
+		self.assertIsNone(self.context.subscribedExperiments["e1"]["push"])
+
+	def test_max_points (self):
+		self.variable._archive._zero = 0
+		self.variable._archive.min_delta = 0
+		self.variable.push_many([i * 0.5 for i in range(2000)], [float(i % 7) for i in range(2000)])
+
+		points = experiment_protocol._get(self.variable, 0., 900, 20)
+		self.assertTrue(0 < len(points) <= 20)
+
+		# Variables which cannot summarise are asked for all points
+		mean = manipulation.Mean(self.variable, 1)
+		self.assertEqual(
+			experiment_protocol._get(mean, 990., 10, 20),
+			mean.get(990., 10)
+		)
+
+		# Errors in get() are not retried without max_points
+		with patch.object(self.variable, "get", side_effect = TypeError) as get:
+			self.assertRaises(TypeError, experiment_protocol._get, self.variable, 0., 900, 20)
+			get.assert_called_once_with(0., 900, max_points = 20)
+
+
+class EncodingTestCase (unittest.TestCase):
+	def _message (self, command, payload):
+		return { "protocol": "experiment", "command": command, "payload": payload }
+
+	def test_json (self):
+		message = self._message("streams", { "data": [] })
+
+		self.assertEqual(encoding.encode(message), (json.dumps(message).encode('utf-8'), False))
+
+		# Control messages are always JSON
+		message = self._message("load", { "title": "x" })
+		self.assertEqual(encoding.encode(message, True)[1], False)
+
+	def test_streams (self):
+		message = self._message("streams", {
+			"sketch": "s1",
+			"zero": 100.,
+			"data": [
+				{ "name": "a", "data": [(0, 1.5), (0.5, 2.25)] },
+				{ "name": "b", "data": [0, 0] }
+			]
+		})
+
+		data, isBinary = encoding.encode(message, True)
+		self.assertTrue(isBinary)
+
+		decoded = encoding.decode(data, True)
+		self.assertEqual(decoded["command"], "streams")
+		self.assertEqual(decoded["payload"]["zero"], 100.)
+
+		a, b = decoded["payload"]["data"]
+		self.assertEqual(a["name"], "a")
+		self.assertEqual(encoding.unpackSeries(a), [(0, 1.5), (0.5, 2.25)])
+
+		# Series that can't be packed are sent as lists
+		self.assertEqual(b, { "name": "b", "data": [0, 0] })
+
+		# The original message is unchanged
+		self.assertEqual(message["payload"]["data"][0]["data"], [(0, 1.5), (0.5, 2.25)])
+
+	def test_properties (self):
+		message = self._message("properties", { "data": { "a": 1.5, "b": "text" } })
+
+		data, isBinary = encoding.encode(message, True)
+		self.assertTrue(isBinary)
+		self.assertEqual(encoding.decode(data, True), message)
+
+	def test_receive_binary (self):
+		context = websocket.OctopusEditorProtocol()
+		context.factory = Mock()
+
+		context.onMessage(encoding.encodeBinary(self._message("get-properties", { "sketch": "s1" })), True)
+		context.factory.runtime.receive.assert_called_once_with("experiment", "get-properties", { "sketch": "s1" }, context)
+
+
+class FanOutTestCase (unittest.TestCase):
+	def setUp (self):
+		self.runtime = websocket.WebSocketRuntime()
+		self.factory = websocket.WebSocketServerFactory()
+
+		self.sketch = Mock(id = "s1", subscribers = {})
+
+	def _connect (self, binary = False):
+		context = websocket.OctopusEditorProtocol()
+		context.factory = self.factory
+		context.binary = binary
+		context.sendPreparedMessage = Mock()
+
+		notifyFn = lambda protocol, topic, payload, encoded = None: \
+			self.runtime.send(protocol, topic, payload, context, encoded)
+		self.sketch.subscribers[context] = notifyFn
+
+		return context
+
+	def _notify (self, *args):
+		sketch.Sketch.notifySubscribers(self.sketch, *args)
+
+	def test_encode_once (self):
+		contexts = [self._connect() for i in range(3)]
+		binary = self._connect(True)
+		payload = { "id": "b1", "state": "running" }
+
+		with patch.object(encoding, "encode", wraps = encoding.encode) as encode:
+			self._notify("block", "state", payload, contexts[0])
+
+			# Once per encoding
+			self.assertEqual(encode.call_count, 2)
+
+		self.assertFalse(contexts[0].sendPreparedMessage.called)
+
+		first = contexts[1].sendPreparedMessage.call_args[0][0]
+		self.assertIs(contexts[2].sendPreparedMessage.call_args[0][0], first)
+		self.assertEqual(json.loads(first.payload), {
+			"protocol": "block",
+			"command": "state",
+			"payload": { "id": "b1", "state": "running", "sketch": "s1" }
+		})
+
+		# Binary connections get their own message (block states
+		# are not a binary topic, so it is also JSON)
+		other = binary.sendPreparedMessage.call_args[0][0]
+		self.assertIsNot(other, first)
+		self.assertEqual(json.loads(other.payload), json.loads(first.payload))
+
+		# The caller's payload is not changed
+		self.assertEqual(payload, { "id": "b1", "state": "running" })
+
+	def test_separate_broadcasts (self):
+		context = self._connect()
+
+		self._notify("block", "state", { "id": "b1", "state": "running" })
+		self._notify("block", "state", { "id": "b1", "state": "complete" })
+
+		first, second = [c[0][0] for c in context.sendPreparedMessage.call_args_list]
+		self.assertEqual(json.loads(second.payload)["payload"]["state"], "complete")
+
+
+class SendQueueTestCase (unittest.TestCase):
+	def setUp (self):
+		self.runtime = websocket.WebSocketRuntime()
+		self.context = websocket.OctopusEditorProtocol()
+		self.context.maxQueueLength = 3
+		self.context.sendMessage = Mock()
+
+	def _send (self, protocol, topic, payload):
+		self.runtime.send(protocol, topic, payload, self.context)
+
+	def _sent (self):
+		messages = [json.loads(c[0][0]) for c in self.context.sendMessage.call_args_list]
+		self.context.sendMessage.reset_mock()
+		return [(m["command"], m["payload"]) for m in messages]
+
+	def test_unpaused (self):
+		self._send("experiment", "properties", { "experiment": "e1", "data": 1 })
+		self._send("experiment", "properties", { "experiment": "e1", "data": 2 })
+
+		self.assertEqual(len(self._sent()), 2)
+		self.assertEqual(self.context.queueLength, 0)
+
+	def test_latest (self):
+		self.context.pauseProducing()
+
+		self._send("block", "state", { "id": "b1", "state": "running" })
+		self._send("block", "state", { "id": "b2", "state": "running" })
+		self._send("experiment", "properties", { "experiment": "e1", "data": 1 })
+		self._send("block", "state", { "id": "b1", "state": "complete" })
+		self._send("experiment", "properties", { "experiment": "e1", "data": 2 })
+
+		self.assertEqual(self._sent(), [])
+		self.assertEqual(self.context.queueLength, 3)
+
+		self.context.resumeProducing()
+
+		# Only the latest values are sent, in the order first queued
+		self.assertEqual(self._sent(), [
+			("state", { "id": "b1", "state": "complete" }),
+			("state", { "id": "b2", "state": "running" }),
+			("properties", { "experiment": "e1", "data": 2 }),
+		])
+
+		metrics = self.context.metrics()
+		self.assertEqual(metrics["coalesced"], 2)
+		self.assertEqual(metrics["dropped"], 0)
+		self.assertEqual(metrics["queue_length"], 0)
+		self.assertEqual(metrics["max_queue_length"], 3)
+
+	def test_drop (self):
+		self.context.pauseProducing()
+
+		for i in range(5):
+			self._send("experiment", "load", { "i": i })
+			self._send("experiment", "log", { "i": i })
+
+		# Log messages are kept
+		self.assertEqual(self.context.metrics()["dropped"], 3)
+
+		self.context.resumeProducing()
+		self.assertEqual([c for c, p in self._sent()], ["load", "log", "load"] + ["log"] * 4)
+
+	def test_pause_while_sending (self):
+		self.context.pauseProducing()
+
+		for i in range(3):
+			self._send("experiment", "log", { "i": i })
+
+		# The transport pauses the connection again after the first message
+		self.context.sendMessage.side_effect = lambda *a: self.context.pauseProducing()
+		self.context.resumeProducing()
+
+		self.assertEqual(self.context.sendMessage.call_count, 1)
+		self.assertEqual(self.context.queueLength, 2)
+
+
+class PropertyChannelTestCase (unittest.TestCase):
+	def setUp (self):
+		self.clock = task.Clock()
+		patcher = patch.object(experiment_protocol, "reactor", self.clock)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+		self.a = data.Variable(float, 1.)
+		self.b = data.Variable(str, "x")
+		self.c = data.Variable(int, 0)
+
+		self.variables = workspace.Variables()
+		for name, variable in (("a", self.a), ("b", self.b), ("c", self.c)):
+			self.variables.add(name, variable)
+
+		self.experiment = Mock(id = "e1")
+		self.experiment.sketch.workspace.variables = self.variables
+		self.experiment.variables.return_value = { "a": self.a, "b": self.b, "c": self.c }
+		self.sketch = Mock(id = "s1")
+
+		self.runtime = websocket.WebSocketRuntime()
+		self.context = websocket.OctopusEditorProtocol()
+		self.context.sendMessage = Mock()
+		self.context.subscribeExperiment(self.experiment)
+		self.addCleanup(self.context.stopExperimentProperties, self.experiment)
+
+	def _sent (self):
+		messages = [json.loads(c[0][0]) for c in self.context.sendMessage.call_args_list]
+		self.context.sendMessage.reset_mock()
+		return [m["payload"]["data"] for m in messages]
+
+	def _subscribe (self, **payload):
+		self.runtime.experimentProtocol.receive("subscribe-properties", dict(
+			{ "properties": ["a", "b"] }, **payload
+		), self.sketch, self.experiment, self.context)
+
+	def test_changes (self):
+		self._subscribe()
+		self.assertEqual(self._sent(), [{ "a": 1., "b": "x" }])
+
+		# Changes in one tick are sent together
+		self.a.set(2.)
+		self.a.set(3.)
+		self.b.set("y")
+		self.c.set(5)
+		self.assertEqual(self._sent(), [])
+
+		self.clock.advance(0)
+		self.assertEqual(self._sent(), [{ "a": 3., "b": "y" }])
+
+		# Only changes to the formatted value are sent
+		self.a.set(3.001)
+		self.b.set("z")
+		self.clock.advance(0)
+		self.assertEqual(self._sent(), [{ "b": "z" }])
+
+		self.a.set(3.002)
+		self.clock.advance(0)
+		self.assertEqual(self._sent(), [])
+
+	def test_interval (self):
+		self._subscribe(interval = 0.5)
+		self._sent()
+
+		self.a.set(2.)
+		self.clock.advance(0.25)
+		self.b.set("y")
+		self.assertEqual(self._sent(), [])
+
+		self.clock.advance(0.25)
+		self.assertEqual(self._sent(), [{ "a": 2., "b": "y" }])
+
+	def test_paused (self):
+		self._subscribe()
+		self._sent()
+
+		self.context.pauseProducing()
+		self.a.set(2.)
+		self.clock.advance(0)
+		self.a.set(4.)
+		self.clock.advance(1)
+		self.assertEqual(self._sent(), [])
+
+		self.context.resumeProducing()
+		self.clock.advance(1)
+		self.assertEqual(self._sent(), [{ "a": 4. }])
+
+	def test_unsubscribe (self):
+		self._subscribe()
+		self._sent()
+
+		self.runtime.experimentProtocol.receive("unsubscribe-properties", {}, self.sketch, self.experiment, self.context)
+
+		self.a.set(2.)
+		self.clock.advance(0)
+		self.assertEqual(self._sent(), [])
+		self.assertEqual(self.variables.listeners("variable-changed"), [])
+
+	def test_stop_twice (self):
+		self._subscribe()
+		channel = self.context.subscribedExperiments["e1"]["channel"]
+		channel.stop()
+		channel.stop()
+
+		# Also after the workspace has removed its listeners
+		self._subscribe()
+		self._sent()
+		self.variables.off("variable-changed")
+		self.context.stopExperimentProperties(self.experiment)
+
+		self.a.set(2.)
+		self.clock.advance(0)
+		self.assertEqual(self._sent(), [])
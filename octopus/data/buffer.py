@@ -0,0 +1,141 @@
+# NumPy
+import numpy as np
+
+
+_dtypes = {
+	float: np.float64,
+	int: np.int64,
+	bool: np.bool_,
+	complex: np.complex128,
+}
+
+def dtype_for (type):
+	return _dtypes.get(type, object)
+
+
+class RingBuffer (object):
+	"""
+	Circular store of (time, value) samples. Once {capacity} samples
+	are held, each new sample overwrites the oldest, unless the buffer
+	is first grown with reserve().
+
+	Times are held in a float64 array and values in an array typed
+	according to the variable type (object for non-numeric types).
+
+	Every sample is written twice, at positions i and i + capacity,
+	so that the retained samples always form one contiguous slice.
+	This means that `times` and `values` are views, never copies.
+	"""
+
+	def __init__ (self, type, capacity = 4096):
+		self.capacity = capacity
+
+		self._t = np.zeros(2 * capacity, dtype = np.float64)
+		self._v = np.zeros(2 * capacity, dtype = dtype_for(type))
+		self._start = 0
+		self._count = 0
+
+	@property
+	def times (self):
+		return self._t[self._start:self._start + self._count]
+
+	@property
+	def values (self):
+		return self._v[self._start:self._start + self._count]
+
+	def __len__ (self):
+		return self._count
+
+	def append (self, time, value):
+		capacity = self.capacity
+		i = (self._start + self._count) % capacity
+
+		self._t[i] = self._t[i + capacity] = time
+		self._v[i] = self._v[i + capacity] = value
+
+		# Overwrite the oldest sample when full.
+		if self._count == capacity:
+			self._start = (self._start + 1) % self.capacity
+		else:
+			self._count += 1
+
+	def reserve (self, count):
+		"""
+		Grow the buffer, if necessary, so that it holds at least
+		{count} samples before overwriting any.
+		"""
+
+		capacity = self.capacity
+
+		if count <= capacity:
+			return
+
+		while capacity < count:
+			capacity *= 2
+
+		n = self._count
+		t = np.zeros(2 * capacity, dtype = self._t.dtype)
+		v = np.zeros(2 * capacity, dtype = self._v.dtype)
+
+		t[:n] = t[capacity:capacity + n] = self.times
+		v[:n] = v[capacity:capacity + n] = self.values
+
+		self._t = t
+		self._v = v
+		self._start = 0
+		self.capacity = capacity
+
+	def extend (self, times, values):
+		"""
+		Append arrays of samples, as if by calling append for each.
+		"""
+
+		capacity = self.capacity
+
+		# Only the most recent samples fit.
+		times = times[-capacity:]
+		values = values[-capacity:]
+		n = len(times)
+
+		i = (self._start + self._count + np.arange(n)) % capacity
+
+		self._t[i] = self._t[i + capacity] = times
+		self._v[i] = self._v[i + capacity] = values
+
+		count = min(self._count + n, capacity)
+		self._start = (self._start + self._count + n - count) % capacity
+		self._count = count
+
+	def pop (self):
+		"""
+		Discard the most recent sample.
+		"""
+
+		if self._count > 0:
+			self._count -= 1
+
+	def set_last_time (self, time):
+		i = (self._start + self._count - 1) % self.capacity
+		self._t[i] = self._t[i + self.capacity] = time
+
+	def drop_before (self, time):
+		"""
+		Discard old samples, keeping the most recent sample at
+		or before {time} so that the window still covers it.
+		"""
+
+		# Each sample is only dropped once, so this is O(1) amortised.
+		t = self._t
+		start = self._start
+		count = self._count
+
+		while count > 1 and t[start + 1] <= time:
+			start = (start + 1) % self.capacity
+			count -= 1
+
+		self._start = start
+		self._count = count
+
+	def clear (self):
+		self._start = 0
+		self._count = 0
@@ -0,0 +1,113 @@
+# System Imports
+from bisect import bisect_left, bisect_right
+import struct
+
+# NumPy
+import numpy as np
+
+
+class ChunkFile (object):
+	"""
+	Append-only columnar store of sealed (time, value) chunks.
+
+	Each chunk is written as a header (first time, last time, length)
+	followed by a time column and a value column. Times are stored as
+	float64, so they are read back exactly however long the chunk.
+
+	The chunk index (offset, length, first and last time) is kept in
+	memory; chunk data are read back through a numpy.memmap of the file.
+	"""
+
+	_header = struct.Struct("<ddI")
+
+	def __init__ (self, path, dtype = np.float64):
+		self.path = path
+		self.dtype = np.dtype(dtype)
+
+		self._fp = open(path, "wb")
+		self._size = 0
+		self._map = None
+		self._offsets = []
+		self._lengths = []
+		self._t_min = []
+		self._t_max = []
+
+	def __len__ (self):
+		return len(self._offsets)
+
+	@property
+	def first_time (self):
+		return self._t_min[0]
+
+	def append (self, x, y):
+		"""
+		Seal a chunk of sorted times {x} and values {y} to the file.
+		"""
+
+		x = np.asarray(x, dtype = np.float64)
+		y = np.asarray(y, dtype = self.dtype)
+		t0 = float(x[0])
+
+		header = self._header.pack(t0, float(x[-1]), len(x))
+		times = x.tobytes()
+		values = y.tobytes()
+
+		self._offsets.append(self._size + len(header))
+		self._lengths.append(len(x))
+		self._t_min.append(t0)
+		self._t_max.append(float(x[-1]))
+
+		self._fp.write(header + times + values)
+		self._fp.flush()
+		self._size += len(header) + len(times) + len(values)
+		self._map = None
+
+	def read (self, start = None, end = None):
+		"""
+		Return (times, values) arrays for all chunks that could contain
+		data between {start} and {end}, including the chunks holding the
+		last point before {start} and the first point after {end}.
+		"""
+
+		if len(self._offsets) == 0:
+			return np.empty(0), np.empty(0, dtype = self.dtype)
+
+		lo = 0 if start is None else max(0, bisect_right(self._t_min, start) - 1)
+		hi = len(self._offsets) if end is None else bisect_left(self._t_max, end) + 1
+
+		if self._map is None:
+			self._map = np.memmap(self.path, dtype = np.uint8, mode = "r")
+
+		times = []
+		values = []
+
+		for offset, length in zip(self._offsets[lo:hi], self._lengths[lo:hi]):
+			times.append(np.frombuffer(self._map, np.float64, length, offset))
+			values.append(np.frombuffer(self._map, self.dtype, length, offset + 8 * length))
+
+		return np.concatenate(times), np.concatenate(values)
+
+	def count (self, start, end):
+		"""
+		Return an upper bound on the number of points between
+		{start} and {end}, from the chunk index.
+		"""
+
+		lo = max(0, bisect_right(self._t_min, start) - 1)
+		hi = bisect_left(self._t_max, end) + 1
+
+		return sum(self._lengths[lo:hi])
+
+	def truncate (self):
+		self._fp.seek(0)
+		self._fp.truncate()
+		self._size = 0
+		self._map = None
+		self._offsets = []
+		self._lengths = []
+		self._t_min = []
+		self._t_max = []
+
+	def close (self):
+		self._map = None
+		self._fp.close()
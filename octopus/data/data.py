@@ -1,4 +1,5 @@
 # System Imports
+from bisect import bisect_left, bisect_right
 from math import ceil
 import operator
 
@@ -8,26 +9,39 @@ from ..events import EventEmitter
 
 # Sibling Imports
 from . import errors
+from .buffer import RingBuffer, dtype_for
+from .chunkfile import ChunkFile
+from .pyramid import Pyramid
+
+# NumPy
+import numpy as np
+
+
+def _search (list, time, side):
+	# Binary search a sorted list or NumPy array of times.
+	try:
+		return int(list.searchsorted(time, side))
+	except AttributeError:
+		if side == 'left':
+			return bisect_left(list, time)
+		else:
+			return bisect_right(list, time)
 
 
 def _upper_bound (list, time):
 	# Return the index of the first item in {list} which
 	# is greater than or equal to {time}.
-	# http://stackoverflow.com/q/2236906/
-	return next((i for i, t in enumerate(list) if t >= time), None)
+	i = _search(list, time, 'left')
 
+	return i if i < len(list) else None
 
-def _lower_bound (list, time):
-	l = len(list)
 
+def _lower_bound (list, time):
 	# Return the index of the last item in {list} which
 	# is less than or equal to {time}.
-	try:
-		return l - 1 - next(
-			(i for i, t in enumerate(reversed(list)) if t <= time)
-		)
-	except StopIteration:
-		return None
+	i = _search(list, time, 'right') - 1
+
+	return i if i >= 0 else None
 
 
 def _interp (x, x0, y0, x1, y1):
@@ -51,27 +65,44 @@ def _prepare (start, interval):
 	return start, interval
 
 
+def _slice (vals, i_start, i_end):
+	# Return a list of Python values from a list or a NumPy array.
+	try:
+		return vals[i_start:i_end].tolist()
+	except AttributeError:
+		return vals[i_start:i_end]
+
+
+def _scalar (val):
+	try:
+		return val.item()
+	except AttributeError:
+		return val
+
+
 def _get (x_vals, y_vals, x_max, x_min, start, interval):
 
 	# Return all data
 	if start is None and interval is None:
-		return list(zip(x_vals, y_vals))
+		return list(zip(_slice(x_vals, None, None), _slice(y_vals, None, None)))
 
 	if interval is None:
 		interval = 0
 
 	# Request range is outside data range
 	if start > x_max:
+		y_last = _scalar(y_vals[-1])
 		if interval == 0:
-			return [(start, y_vals[-1])]
+			return [(start, y_last)]
 		else:
-			return [(start, y_vals[-1]), (start + interval, y_vals[-1])]
+			return [(start, y_last), (start + interval, y_last)]
 	if start + interval < x_min:
 		try:
+			y_first = _scalar(y_vals[0])
 			if interval == 0:
-				return [(start, y_vals[0])]
+				return [(start, y_first)]
 			else:
-				return [(start, y_vals[0]), (start + interval, y_vals[0])]
+				return [(start, y_first), (start + interval, y_first)]
 		except IndexError:
 			if interval == 0:
 				return [(start, 0)]
@@ -85,18 +116,21 @@ def _get (x_vals, y_vals, x_max, x_min, start, interval):
 	if i_end is not None:
 		i_end += 1 # Return the interval length of data
 
-	vals = list(zip(x_vals[i_start:i_end], y_vals[i_start:i_end]))
+	vals = list(zip(
+		_slice(x_vals, i_start, i_end),
+		_slice(y_vals, i_start, i_end)
+	))
 
 	# Fill in the start and end points if necessary.
 	try:
 		if start < x_min:
-			vals.insert(0, (start, y_vals[0]))
+			vals.insert(0, (start, _scalar(y_vals[0])))
 	except IndexError:
 		pass
 
 	try:
 		if start + interval > x_max:
-			vals.append((start + interval, y_vals[-1]))
+			vals.append((start + interval, _scalar(y_vals[-1])))
 	except IndexError:
 		pass
 
@@ -113,21 +147,77 @@ def _at (val, time):
 		return _interp(time, a[0], a[1], b[0], b[1])
 
 
+def _first_exceeding (y, threshold, prev, start):
+	# Index of the first sample from {start} that differs from {prev}
+	# by more than its threshold, or None. Searches in growing windows
+	# so that closely spaced hits do not rescan the whole block.
+	size = 64
+
+	while start < len(y):
+		end = min(len(y), start + size)
+		hits = np.flatnonzero(np.abs(y[start:end] - prev) > threshold[start:end])
+
+		if len(hits):
+			return start + int(hits[0])
+
+		start = end
+		size *= 2
+
+	return None
+
+
 class Archive (object):
 	# Set threshold_factor to None for non-numeric variables
 	threshold_factor = 0.05
 	min_delta = 10
 
+	# Number of points held in memory before a chunk is
+	# sealed to disk (when spilling, see spill()).
+	chunk_size = 4096
+
+	# Bucket widths (in seconds) of the min / max / mean summaries
+	# used to answer get() requests with a max_points limit.
+	levels = (1, 10, 60, 600)
+
 	def __init__ (self):
 		self._prev_x = None
 		self._prev_y = None
+		self._file = None
+		self._pyramid = Pyramid(self.levels)
 		self.truncate()
 
+	def spill (self, path, type):
+		"""
+		Write sealed chunks of the archive to the file at {path}
+		so that memory use stays bounded. Older data are read
+		back from the file as required.
+		"""
+
+		if self._file is not None:
+			self._file.close()
+
+		self._file = ChunkFile(path, dtype_for(type))
+
+	def close (self):
+		"""
+		Stop spilling and close the file. Data that were sealed to
+		the file are no longer part of the archive.
+		"""
+
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
 	def truncate (self):
+		# Spilling continues, into the emptied file.
+		if self._file is not None:
+			self._file.truncate()
+
 		self._zero = now()
 
 		self._x = [self._prev_x] if self._prev_x is not None else []
 		self._y = [self._prev_y] if self._prev_y is not None else []
+		self._pyramid.clear()
 
 		self._y_min = 0
 		self._y_max = 0
@@ -139,6 +229,98 @@ class Archive (object):
 		if x < self._zero:
 			return
 
+		self._pyramid.push(x, y)
+		self._store(x, y)
+
+	def push_many (self, x, y):
+		"""
+		Add arrays of samples {x}, {y} (in time order), as if by
+		calling push for each.
+		"""
+
+		# Ignore data points at times earlier than the most recent reset.
+		start = np.searchsorted(x, self._zero, 'left')
+		x = x[start:]
+		y = y[start:]
+
+		if len(x) == 0:
+			return
+
+		self._pyramid.push_many(x, y)
+
+		if self.threshold_factor is None:
+			self._x.extend(x.tolist())
+			self._y.extend(y.tolist())
+			self._prev_x = self._x[-1]
+			self._prev_y = self._y[-1]
+
+			if self._file is not None and len(self._x) > self.chunk_size:
+				self._seal()
+
+			return
+
+		# Running max and min, and the threshold at each sample.
+		y_max = np.maximum(np.maximum.accumulate(y), self._y_max)
+		y_min = np.minimum(np.minimum.accumulate(y), self._y_min)
+		threshold = np.maximum(
+			self.threshold_factor * (y_max - y_min),
+			self.min_delta
+		)
+		self._y_max = y_max[-1].item()
+		self._y_min = y_min[-1].item()
+
+		xs = x.tolist()
+		ys = y.tolist()
+		i = 0
+
+		# Jump from each stored point to the next sample that
+		# exceeds the threshold, as _store would do one by one.
+		while i < len(xs):
+			if self._prev_y is None:
+				j = i
+			else:
+				j = _first_exceeding(y, threshold, self._prev_y, i)
+
+			end = len(xs) if j is None else j + 1
+			low = i + int(np.argmin(y[i:end]))
+			high = i + int(np.argmax(y[i:end]))
+
+			if self._min_since_last is None \
+			or ys[low] < self._min_since_last[1]:
+				self._min_since_last = (xs[low], ys[low])
+
+			if self._max_since_last is None \
+			or ys[high] > self._max_since_last[1]:
+				self._max_since_last = (xs[high], ys[high])
+
+			if j is None:
+				break
+
+			if self._prev_y is not None:
+				if self._max_since_last[1] > self._prev_y \
+				and self._max_since_last[1] > ys[j]:
+					self._x.append(self._max_since_last[0])
+					self._y.append(self._max_since_last[1])
+				elif self._min_since_last[1] < self._prev_y \
+				and self._min_since_last[1] < ys[j]:
+					self._x.append(self._min_since_last[0])
+					self._y.append(self._min_since_last[1])
+
+				self._min_since_last = (xs[j], ys[j])
+				self._max_since_last = (xs[j], ys[j])
+
+			self._x.append(xs[j])
+			self._y.append(ys[j])
+			self._prev_x = xs[j]
+			self._prev_y = ys[j]
+			i = j + 1
+
+		if self._file is not None and len(self._x) > self.chunk_size:
+			self._seal()
+
+	def _store (self, x, y):
+		# Add a point to the stored data if it is far enough
+		# from the last one stored.
 		if self.threshold_factor is not None:
 			# Update max and min
 			if y > self._y_max:
@@ -187,14 +369,82 @@ class Archive (object):
 			self._prev_x = x
 			self._prev_y = y
 
-	def get (self, start = None, interval = None):
+			if self._file is not None and len(self._x) > self.chunk_size:
+				self._seal()
+
+	def _seal (self):
+		# Write out whole chunks, keeping the latest point in memory.
+		n = self.chunk_size
+		count = (len(self._x) - 1) // n
+
+		for k in range(count):
+			self._file.append(
+				self._x[k * n:(k + 1) * n],
+				self._y[k * n:(k + 1) * n]
+			)
+
+		self._x = self._x[count * n:]
+		self._y = self._y[count * n:]
+
+	def get (self, start = None, interval = None, max_points = None):
+		"""
+		Returns a list of (time, value) pairs between start and
+		start + interval (see Variable.get).
+
+		If max_points is given and the archive holds more points than
+		this in the requested range, the minimum and maximum values
+		of time buckets are returned instead, from the finest bucket
+		size that gives no more than max_points points.
+		"""
+
 		start, interval = _prepare(start, interval)
 
 		# Nothing in archive
 		if self._prev_x is None:
 			return []
 
-		return _get(self._x, self._y, self._prev_x, self._x[0], start, interval)
+		if max_points is not None:
+			# Without a start time, summarise the whole archive.
+			if start is None:
+				first = self._x[0]
+
+				if self._file is not None and len(self._file) > 0:
+					first = self._file.first_time
+
+				last = self._prev_x
+			else:
+				first, last = start, start + (interval or 0)
+
+			if self._count(first, last) > max_points:
+				points = self._pyramid.get(first, last, max_points)
+
+				if len(points) > 0:
+					return points
+
+		if self._file is None or len(self._file) == 0 \
+		or (start is not None and start >= self._x[0]):
+			return _get(self._x, self._y, self._prev_x, self._x[0], start, interval)
+
+		if start is None:
+			end = None
+		else:
+			end = start + (interval or 0)
+
+		x_vals, y_vals = self._file.read(start, end)
+		x_vals = np.concatenate((x_vals, self._x))
+		y_vals = np.concatenate((y_vals, np.asarray(self._y, dtype = y_vals.dtype)))
+
+		return _get(x_vals, y_vals, self._prev_x, self._file.first_time, start, interval)
+
+	def _count (self, start, end):
+		# Number of stored points between start and end.
+		count = _search(self._x, end, 'right') - _search(self._x, start, 'left')
+
+		if self._file is not None and len(self._file) > 0 \
+		and start < self._x[0]:
+			count += self._file.count(start, end)
+
+		return count
 
 	def at (self, time):
 		val = self.get(time, 0)
@@ -214,6 +464,12 @@ class StringArchive (Archive):
 	def push (self, x, y):
 		pass
 
+	def push_many (self, x, y):
+		pass
+
+	def spill (self, path, type):
+		pass
+
 	def at (self, time):
 		return "StringArchive.at not implemented" # _at(self.get(time, 0), time)
 
@@ -233,6 +489,9 @@ def _default_alias (object):
 class BaseVariable (EventEmitter):
 	alias = ""
 
+	# True if get() accepts a max_points argument.
+	summarises = False
+
 	@property
 	def value (self):
 		try:
@@ -250,6 +509,13 @@ class BaseVariable (EventEmitter):
 	def get_value (self):
 		return self._value
 
+	def _stamp (self):
+		# Changes when the variable has new data (see Expression.get_archive)
+		try:
+			return self._time
+		except AttributeError:
+			return None
+
 	def __str__ (self):
 		return str(self.get_value())
 
@@ -278,6 +544,8 @@ _numeric_types = (int, float, complex)
 
 class Variable (BaseVariable):
 	length = 30 # in seconds
+	capacity = 4096 # initial size of the live window (it grows as needed)
+	summarises = True
 
 	def __init__ (self, type, value = None):
 		self.alias = _default_alias(self)
@@ -286,8 +554,7 @@ class Variable (BaseVariable):
 		self._value = None
 		self._type = type
 
-		self._x = []
-		self._y = []
+		self._buffer = RingBuffer(type, self.capacity)
 
 		if type in _numeric_types:
 			self._archive = Archive()
@@ -304,24 +571,29 @@ class Variable (BaseVariable):
 		Empty the variable of all stored data.
 		"""
 
-		if self._value is None:
-			self._x = []
-			self._y = []
-		else:
-			self._time = now()
+		self._buffer.clear()
 
-			self._x = [self._time]
-			self._y = [self._value]
+		if self._value is not None:
+			self._time = now()
+			self._buffer.append(self._time, self._value)
 
 		self._archive.truncate()
 
 		# Trigger clear event
 		self.emit("clear", time = self._time, value = self._value)
 
+	@property
+	def _x (self):
+		return self._buffer.times
+
+	@property
+	def _y (self):
+		return self._buffer.values
+
 	def set (self, value):
 		self._push(value)
 
-	def get (self, start = None, interval = None):
+	def get (self, start = None, interval = None, max_points = None):
 		"""
 		Returns the value of the variable over a particular time period.
 
@@ -336,17 +608,22 @@ class Variable (BaseVariable):
 
 		If start < 0, then this number of seconds is subtracted
 		from the current time.
+
+		If max_points is given, long periods are summarised by the
+		archive so that roughly this number of points is returned.
 		"""
 
 		if start is None and interval is None:
-			return self._archive.get()
+			return self._archive.get(max_points = max_points)
+
+		x_vals = self._buffer.times
 
-		if start < self._x[0]:
-			return self._archive.get(start, interval)
+		if len(x_vals) == 0 or start < x_vals[0]:
+			return self._archive.get(start, interval, max_points)
 
 		start, interval = _prepare(start, interval)
 
-		return _get(self._x, self._y, self._time, self._x[0], start, interval)
+		return _get(x_vals, self._buffer.values, self._time, x_vals[0], start, interval)
 
 	def at (self, time):
 		return _at(self.get(time, 0), time)
@@ -363,23 +640,7 @@ class Variable (BaseVariable):
 		elif self._time is not None and time < self._time:
 			raise Exception("Cannot insert values earlier than latest value")
 
-		# Only store changes
-		if self._value == value \
-		and len(self._x) > 2 \
-		and self._y[-2] == value:
-			self._x[-1] = time
-			changed = False
-		else:
-			self._x.append(time)
-			self._y.append(value)
-
-			changed = True
-
-			# Trim old data
-			mid = len(self._x) // 2
-			if time - self._x[mid] > self.length:
-				self._y = self._y[mid:]
-				self._x = self._x[mid:]
+		changed = self._update_buffer(time, value)
 
 		self._value = value
 		self._time  = time
@@ -391,11 +652,171 @@ class Variable (BaseVariable):
 		if changed:
 			self.emit("change", time = time, value = value)
 
+	def _update_buffer (self, time, value):
+		# Add a sample to the live window. Returns whether it is a
+		# change, i.e. it does not just extend a run of equal values.
+		buffer = self._buffer
+
+		# Only store changes
+		if self._value == value \
+		and len(buffer) > 2 \
+		and buffer.values[-2] == value:
+			buffer.set_last_time(time)
+			return False
+
+		# Grow rather than overwrite samples still in the window.
+		if len(buffer) == buffer.capacity \
+		and buffer.times[1] > time - self.length:
+			buffer.reserve(len(buffer) + 1)
+
+		buffer.append(time, value)
+
+		# Trim old data
+		buffer.drop_before(time - self.length)
+
+		return True
+
+	def push_many (self, times, values):
+		"""
+		Add a block of samples at once, {values} at {times}.
+
+		The result is the same as calling _push for each sample in
+		turn, but the live window is updated in one step and a single
+		"change" event is emitted for the block (see below).
+		"""
+
+		times = np.asarray(times, dtype = np.float64)
+		n = len(times)
+
+		if n != len(values):
+			raise ValueError("times and values must be the same length")
+
+		if n == 0:
+			return
+
+		if np.any(times[1:] < times[:-1]) \
+		or (self._time is not None and times[0] < self._time):
+			raise Exception("Cannot insert values earlier than latest value")
+
+		dtype = dtype_for(self._type)
+
+		if dtype is object:
+			values = np.array([
+				v if type(v) == self._type else self._type(v)
+				for v in values
+			], dtype = object)
+		else:
+			values = np.asarray(values, dtype = dtype)
+
+		if self._windowed(times):
+			appended = self._extend_buffer(times, values)
+		else:
+			appended = []
+
+			for i, (time, value) in enumerate(zip(times.tolist(), values.tolist())):
+				if self._update_buffer(time, value):
+					appended.append(i)
+
+				self._value = value
+
+			appended = np.array(appended, dtype = np.intp)
+
+		changed = len(appended) > 0
+
+		self._archive.push_many(times, values)
+		self._log_many(times, values)
+
+		self._value = values[-1].item() if dtype is not object else values[-1]
+		self._time = times[-1].item()
+
+		# Trigger change event. Listeners that need every sample
+		# rather than the latest can use the "times" and "values"
+		# arrays, of the samples for which _push would have emitted.
+		if changed:
+			self.emit(
+				"change",
+				time = self._time,
+				value = self._value,
+				times = times[appended],
+				values = values[appended]
+			)
+
+	def _windowed (self, times):
+		# Whether the live window holds more than two samples
+		# throughout the block: then runs of equal values can be
+		# found for the whole block at once (see _extend_buffer).
+		# Otherwise, _update_buffer is used for each sample. After
+		# a sample is added, the window holds it, the previous sample
+		# if that is less than {length} older, and one more.
+		return len(self._buffer) > 2 \
+			and times[0] - self._time < self.length \
+			and np.all(np.diff(times) < self.length)
+
+	def _extend_buffer (self, times, values):
+		# Add a block of samples to the live window, as if by calling
+		# _update_buffer for each. Returns the indices of the samples
+		# that are changes.
+		buffer = self._buffer
+
+		# Only store changes: runs of equal values are stored as their
+		# first and last samples. The two most recent buffered samples
+		# may be part of the first run.
+		all_values = np.concatenate((buffer.values[-2:], values))
+
+		same = all_values[1:] == all_values[:-1]
+		run = same[:-1] & same[1:]
+
+		# The last sample of each run is kept, with its time.
+		keep = np.ones(len(all_values), dtype = bool)
+		keep[1:-1] = ~run
+
+		if not keep[1]:
+			buffer.pop()
+
+		# Only changes trim old data.
+		appended = np.flatnonzero(~run)
+		new_times = times[keep[2:]]
+		needed = len(buffer) + len(new_times)
+
+		# Grow rather than overwrite samples still in the window.
+		if len(appended):
+			cutoff = times[appended[-1]] - self.length
+			buffer.drop_before(cutoff)
+			needed = len(buffer) + 1 + np.count_nonzero(new_times > cutoff)
+
+		buffer.reserve(needed)
+		buffer.extend(new_times, values[keep[2:]])
+
+		if len(appended):
+			buffer.drop_before(cutoff)
+
+		return appended
+
+	def setArchiveFile (self, path):
+		"""
+		Store the archive of this variable in the file at {path},
+		keeping only the most recent data in memory.
+		"""
+
+		self._archive.spill(path, self._type)
+
+	def closeArchiveFile (self):
+		"""
+		Stop storing the archive in a file (see setArchiveFile).
+		"""
+
+		self._archive.close()
+
 	# Todo: Put these in event watchers in the experiment.
 	def _log (self, time, value):
 		if self._log_file is not None:
 			self._log_file.write(time, value)
 
+	def _log_many (self, times, values):
+		if self._log_file is not None:
+			for time, value in zip(times.tolist(), values.tolist()):
+				self._log_file.write(time, value)
+
 	def setLogFile (self, logFile):
 		if self._log_file is not None:
 			self._log_file.close()
@@ -435,8 +856,221 @@ class Constant (BaseVariable):
 		return str(self._value)
 
 
+_EMPTY = np.empty(0)
+
+
+def _archive_arrays (variable, store = True):
+	# Return the archive of {variable} as arrays of times and
+	# values, or None if it is a constant.
+	if isinstance(variable, Constant):
+		return None
+
+	if isinstance(variable, Expression):
+		return variable._archive(store)
+
+	points = variable.get()
+
+	if len(points) == 0:
+		return _EMPTY, _EMPTY
+
+	x, y = zip(*points)
+	return np.asarray(x, dtype = np.float64), np.asarray(y)
+
+
+def _step_merge (lhs, rhs, l_const, r_const):
+	# Merge two archives, treating each as a step function: returns
+	# the union of their times (from when both have a value), and the
+	# value of each at those times. A constant (None) archive has the
+	# value {l_const} / {r_const} at all times.
+	if lhs is None:
+		x, r_y = rhs
+		return x, l_const, r_y
+
+	if rhs is None:
+		x, l_y = lhs
+		return x, l_y, r_const
+
+	l_x, l_y = lhs
+	r_x, r_y = rhs
+
+	if len(l_x) == 0 or len(r_x) == 0:
+		return _EMPTY, _EMPTY, _EMPTY
+
+	x = np.union1d(l_x, r_x)
+	x = x[x >= max(l_x[0], r_x[0])]
+
+	l_i = np.searchsorted(l_x, x, 'right') - 1
+	r_i = np.searchsorted(r_x, x, 'right') - 1
+
+	return x, l_y[l_i], r_y[r_i]
+
+
+_numeric_kinds = "biufc"
+
+def _is_numeric (value):
+	if isinstance(value, np.ndarray):
+		return value.dtype.kind in _numeric_kinds
+
+	return isinstance(value, _numeric_types + (np.number, np.bool_))
+
+
+def _apply (fn, *args):
+	# Apply {fn} to arrays of values (or scalars). Operators which
+	# can't be applied to whole arrays (e.g. "and", or operations on
+	# mixed types) are applied to each set of values in turn.
+	length = max(len(a) for a in args if isinstance(a, np.ndarray))
+
+	if length == 0:
+		return _EMPTY
+
+	# Only numeric operands can be handled as whole arrays: an operator
+	# that falls back to str() would turn the whole array into one string.
+	if all(_is_numeric(a) for a in args):
+		try:
+			with np.errstate(all = 'ignore'):
+				result = np.asarray(fn(*args))
+
+			if result.dtype.kind in _numeric_kinds:
+				return np.broadcast_to(result, (length, )).copy()
+		except (TypeError, ValueError):
+			pass
+
+	args = [a.tolist() if isinstance(a, np.ndarray) else [a] * length for a in args]
+	values = [fn(*a) for a in zip(*args)]
+
+	result = np.empty(length, dtype = object)
+	result[:] = values
+	return result
+
+
 class Expression (BaseVariable):
-	pass
+	"""
+	Base class of expressions built from variables with operators.
+
+	By default an expression recalculates its value whenever one of
+	its operands changes. If lazy is True (set Expression.lazy before
+	building expressions, or pass lazy = True), an expression is only
+	marked out of date when an operand changes, and its value is
+	calculated when it is read. A lazy expression still calculates
+	eagerly (to emit "change" events) while it has "change" listeners
+	other than lazy expressions built on it.
+
+	The version of an expression increases every time it becomes out
+	of date (or, if not lazy, every time it changes).
+	"""
+
+	lazy = False
+
+	def _watch (self, operands, lazy):
+		self._dirty = False
+		self._version = 0
+		self._dependents = []
+		self._operands = operands
+
+		if lazy is not None:
+			self.lazy = lazy
+
+		for operand in operands:
+			if self.lazy and isinstance(operand, Expression) and operand.lazy:
+				operand._dependents.append(self)
+			else:
+				operand.on("change", self._changed)
+
+	@property
+	def value (self):
+		if self._dirty:
+			self._update()
+
+		return self._value
+
+	@property
+	def version (self):
+		return self._version
+
+	def get_value (self):
+		return self.value
+
+	def on (self, name, function = None, weak = False):
+		# Listeners expect events for each change, so the value must
+		# be up to date from now on (see _invalidate).
+		if self._dirty:
+			self._update()
+
+		return BaseVariable.on(self, name, function, weak)
+
+	def _update (self):
+		self._value = self._compute()
+		self._dirty = False
+
+	def _changed (self, data):
+		if self.lazy:
+			return self._invalidate(data['time'])
+
+		self._version += 1
+		self._update()
+		self.emit("change", time = data['time'], value = self._value)
+
+	def _invalidate (self, time):
+		if self._dirty:
+			# Dependents are already out of date, and nothing is
+			# listening for changes (or the value would be up to date).
+			return
+
+		self._dirty = True
+		self._version += 1
+
+		for dependent in self._dependents:
+			dependent._invalidate(time)
+
+		try:
+			events = self._events
+		except AttributeError:
+			events = ()
+
+		if "change" in events or "all" in events:
+			self._update()
+			self.emit("change", time = time, value = self._value)
+
+	def _stamp (self):
+		return tuple(operand._stamp() for operand in self._operands)
+
+	def get (self, start = None, interval = None):
+		x, y = self._archive()
+
+		if len(x) == 0:
+			return []
+
+		return _get(x, y, x[-1], x[0], start, interval)
+
+	def at (self, time):
+		return _at(self.get(time, 0), time)
+
+	def get_archive (self, store = True):
+		"""
+		Returns the history of the expression as a list of (time, value)
+		pairs, calculated from the archives of its operands: there is a
+		point at each time that any operand changed.
+
+		The result is kept (if {store}) until an operand has new data.
+		"""
+
+		x, y = self._archive(store)
+		return list(zip(x.tolist(), y.tolist()))
+
+	def _archive (self, store = True):
+		stamp = self._stamp()
+
+		if self._archive_x is not None and self._archive_stamp == stamp:
+			return self._archive_x, self._archive_y
+
+		x, y = self._merge_archives(store)
+
+		if store:
+			self._archive_x = x
+			self._archive_y = y
+			self._archive_stamp = stamp
+
+		return x, y
 
 # Variable should emulate a numerical variable
 _unary_ops = (
@@ -469,7 +1103,7 @@ def _def_binary_op (symbol, operatorFn):
 			attrName = "__" + operatorFn.__name__ + "__"
 			rattrName = "__r" + operatorFn.__name__ + "__"
 
-	def init (self, lhs, rhs):
+	def init (self, lhs, rhs, lazy = None):
 		self.alias = _default_alias(self)
 
 		self._archive_x = None
@@ -481,100 +1115,48 @@ def _def_binary_op (symbol, operatorFn):
 		self._rhs = rhs
 
 		if lhs.value is not None and rhs.value is not None:
-			try:
-				self._value = operatorFn(lhs.value, rhs.value)
-			except TypeError:
-				if lhs.type is str or rhs.type is str:
-					self._value = operatorFn(str(lhs.value), str(rhs.value))
-				else:
-					raise
-
+			self._value = self._compute()
 			self._type = type(self._value)
 		else:
 			self._value = None
 			self._type = None
 
-		lhs.on("change", self._changed)
-		rhs.on("change", self._changed)
+		self._watch((lhs, rhs), lazy)
 
-	def _changed (self, data):
+	def _compute (self):
 		try:
-			self._value = operatorFn(self._lhs.value, self._rhs.value)
+			return operatorFn(self._lhs.value, self._rhs.value)
 		except TypeError:
 			if self._lhs.type is str or self._rhs.type is str:
-				self._value = operatorFn(str(self._lhs.value), str(self._rhs.value))
+				return operatorFn(str(self._lhs.value), str(self._rhs.value))
 			else:
 				raise
 
-		if self._archive_x is not None:
-			self._archive_x.append(data['time'])
-			self._archive_y.append(self._value)
-
-		self.emit("change", time = data['time'], value = self._value)
-
 	def get_type (self):
 		if self._type is None and self._value is not None:
 			self._type = type(self._value)
 
 		return self._type
 
-	def get (self, start = None, interval = None):
-		if self._archive_x is None:
-			self.get_archive()
-
-		return _get(self._archive_x, self._archive_y, self._archive_x[-1], self._archive_x[0], start, interval)
+	def _merge_archives (self, store = True):
+		lhs = _archive_arrays(self._lhs, store)
+		rhs = _archive_arrays(self._rhs, store)
 
-	def at (self, time):
-		return _at(self.get(time, 0), time)
+		if lhs is None and rhs is None:
+			return _EMPTY, _EMPTY
 
-	def get_archive (self, store = True):
-		if self._archive_x is not None:
-			return list(zip(self._archive_x, self._archive_y))
+		x, l_y, r_y = _step_merge(lhs, rhs, self._lhs.value, self._rhs.value)
 
-		x = []
-		y = []
+		return x, _apply(self._compute_values, l_y, r_y)
 
+	def _compute_values (self, l, r):
 		try:
-			lhsa = self._lhs.get_archive(store = False)
-		except AttributeError:
-			lhsa = self._lhs.get()
-
-		try:
-			rhsa = self._rhs.get_archive(store = False)
-		except AttributeError:
-			rhsa = self._rhs.get()
-
-		if self._lhs.type is str or self._rhs.type is str:
-			def op (l, r):
-				return operatorFn(l, r)
-		else:
-			def op (l, r):
+			return operatorFn(l, r)
+		except TypeError:
+			if self._lhs.type is str or self._rhs.type is str:
 				return operatorFn(str(l), str(r))
-
-		r_max = len(rhsa)
-		l_max = len(rhsa)
-		r_i = l_i = 0
-
-		while r_i < r_max and l_i < l_max:
-			l_t, c_l = lhs[l_i]
-
-			while rhs[r_i][0] < l_t:
-				x.append(rhs[r_i][0])
-				y.append(op(c_l, rhs[r_i][0]))
-				r_i += 1
-
-			r_t, c_r = rhs[r_i]
-
-			while lhs[r_i][0] < r_t:
-				x.append(rhs[l_i][0])
-				y.append(op(lhs[l_i][0], c_r))
-				l_i += 1
-
-		if store:
-			self._archive_x = x
-			self._archive_y = y
-
-		return list(zip(x, y))
+			else:
+				raise
 
 	def serialize (self):
 		return "(" + \
@@ -588,10 +1170,9 @@ def _def_binary_op (symbol, operatorFn):
 			"__init__": init,
 			"type": property(get_type),
 			"serialize": serialize,
-			"_changed": _changed,
-			"get_archive": get_archive,
-			"get": get,
-			"at": at
+			"_compute": _compute,
+			"_compute_values": _compute_values,
+			"_merge_archives": _merge_archives
 		}
 	)
 
@@ -607,23 +1188,25 @@ def _def_binary_op (symbol, operatorFn):
 		setattr(BaseVariable, rattrName, op_rfn)
 
 def _def_unary_op (symbol, operatorFn):
-	def init (self, operand):
+	def init (self, operand, lazy = None):
 		self.alias = _default_alias(self)
 
+		self._archive_x = None
+		self._archive_y = None
+
 		self._operand = operand
 
 		if operand.value is not None:
-			self._value = operatorFn(operand.value)
+			self._value = self._compute()
 			self._type = type(self._value)
 		else:
 			self._value = None
 			self._type = None
 
-		operand.on("change", self._changed)
+		self._watch((operand, ), lazy)
 
-	def _changed (self, data):
-		self._value = operatorFn(self._operand.value)
-		self.emit("change", time = data['time'], value = self._value)
+	def _compute (self):
+		return operatorFn(self._operand.value)
 
 	def get_type (self):
 		if self._type is None and self._value is not None:
@@ -631,36 +1214,14 @@ def _def_unary_op (symbol, operatorFn):
 
 		return self._type
 
-	def get (self, start = None, interval = None):
-		if self._archive_x is None:
-			self.get_archive()
+	def _merge_archives (self, store = True):
+		archive = _archive_arrays(self._operand, store)
 
-		return _get(self._archive_x, self._archive_y, self._archive_x[-1], self._archive_x[0], start, interval)
+		if archive is None:
+			return _EMPTY, _EMPTY
 
-	def at (self, time):
-		return _at(self.get(time, 0), time)
-
-	def get_archive (self, store = True):
-		if self._archive_x is not None:
-			return list(zip(self._archive_x, self._archive_y))
-
-		x = []
-		y = []
-
-		try:
-			opa = self._operand.get_archive(store = False)
-		except AttributeError:
-			opa = self._operand.get()
-
-		for o_x, o_y in opa:
-			x.append(o_x)
-			y.append(operatorFn(o_y))
-
-		if store:
-			self._archive_x = x
-			self._archive_y = y
-
-		return list(zip(x, y))
+		x, y = archive
+		return x, _apply(operatorFn, y)
 
 	def serialize (self):
 		return symbol + self._operand.serialize()
@@ -674,15 +1235,13 @@ def _def_unary_op (symbol, operatorFn):
 			"__init__": init,
 			"type": property(get_type),
 			"serialize": serialize,
-			"_changed": _changed,
-			"get_archive": get_archive,
-			"get": get,
-			"at": at
+			"_compute": _compute,
+			"_merge_archives": _merge_archives
 		}
 	)
 
-	def op_fn (self, other):
-		return cls(self, op)
+	def op_fn (self):
+		return cls(self)
 
 	setattr(BaseVariable, op.__name__, op_fn)
 
@@ -1,8 +1,11 @@
 # System Imports
+from collections import deque
 import math
+import operator
 
 # Sibling Imports
 from . import data
+from . import errors
 
 # NumPy
 import numpy as np
@@ -26,14 +29,207 @@ class _Counter (object):
 _counter = _Counter()
 
 
+class RollingWindow (object):
+	"""
+	An aggregate of the (time, value) samples of a variable over a
+	sliding window of {frame} seconds, updated as each sample is
+	pushed. Samples must be pushed in time order.
+	"""
+
+	def __init__ (self, frame):
+		self.frame = float(frame)
+		self.clear()
+
+	def clear (self):
+		raise NotImplementedError
+
+	def push (self, x, y):
+		"""
+		Add a sample, drop samples that have left the window, and
+		return the new value of the aggregate.
+		"""
+
+		self._append(x, y)
+		self._expire(x - self.frame)
+
+		return self.value
+
+	@property
+	def value (self):
+		raise NotImplementedError
+
+
+class _RunningSums (RollingWindow):
+	# Keeps the samples in the window, and running sums which are
+	# recalculated (relative to the oldest time, to keep precision)
+	# after as many removals as there are samples: amortised O(1).
+
+	def clear (self):
+		self._points = deque()
+		self._removed = 0
+		self._x0 = None
+		self._resum()
+
+	def __len__ (self):
+		return len(self._points)
+
+	def _append (self, x, y):
+		if self._x0 is None:
+			self._x0 = x
+
+		self._add(x - self._x0, y, 1)
+		self._points.append((x, y))
+
+	def _expire (self, min_x):
+		points = self._points
+
+		while points[0][0] < min_x:
+			x, y = points.popleft()
+			self._add(x - self._x0, y, -1)
+			self._removed += 1
+
+		if self._removed > len(points):
+			self._x0 = points[0][0]
+			self._resum()
+
+	def _resum (self):
+		self._removed = 0
+		self._n = 0
+		self._sx = self._sy = self._sxx = self._sxy = 0.
+
+		for x, y in self._points:
+			self._add(x - self._x0, y, 1)
+
+	def _add (self, x, y, sign):
+		self._n += sign
+		self._sx += sign * x
+		self._sy += sign * y
+		self._sxx += sign * x * x
+		self._sxy += sign * x * y
+
+
+class RollingMean (_RunningSums):
+	@property
+	def value (self):
+		if self._n == 0:
+			return None
+
+		return self._sy / self._n
+
+
+class RollingSlope (_RunningSums):
+	"""
+	The gradient of the least-squares line through the samples in
+	the window.
+	"""
+
+	@property
+	def value (self):
+		n = self._n
+		d = n * self._sxx - self._sx * self._sx
+
+		if n < 2 or d <= 0:
+			return None
+
+		return (n * self._sxy - self._sx * self._sy) / d
+
+
+class RollingSecondSlope (RollingWindow):
+	"""
+	The gradient of the RollingSlope of the samples.
+	"""
+
+	def clear (self):
+		self._first = RollingSlope(self.frame)
+		self._second = RollingSlope(self.frame)
+		self._value = None
+
+	def push (self, x, y):
+		slope = self._first.push(x, y)
+
+		if slope is not None:
+			self._value = self._second.push(x, slope)
+
+		return self._value
+
+	@property
+	def value (self):
+		return self._value
+
+
+class RollingMax (RollingWindow):
+	# A monotonic deque: each sample is removed once, either when it
+	# leaves the window or when a later sample supersedes it.
+	_supersedes = operator.ge
+
+	def clear (self):
+		self._points = deque()
+
+	def _append (self, x, y):
+		points = self._points
+		supersedes = self._supersedes
+
+		while points and supersedes(y, points[-1][1]):
+			points.pop()
+
+		points.append((x, y))
+
+	def _expire (self, min_x):
+		points = self._points
+
+		# The latest sample is always kept.
+		while points[0][0] < min_x:
+			points.popleft()
+
+	@property
+	def value (self):
+		if len(self._points) == 0:
+			return None
+
+		return self._points[0][1]
+
+
+class RollingMin (RollingMax):
+	_supersedes = operator.le
+
+
+class RollingWeightedMean (RollingWindow):
+	"""
+	The mean of the latest len(weights) samples, weighted by
+	{weights}. The frame is unused; the window is a number of
+	samples.
+	"""
+
+	def __init__ (self, weights):
+		self._weights = np.asarray(weights, dtype = float)
+		self._weights = self._weights / self._weights.sum()
+		RollingWindow.__init__(self, 0)
+
+	def clear (self):
+		self._points = deque(maxlen = len(self._weights))
+
+	def push (self, x, y):
+		self._points.append(y)
+		return self.value
+
+	@property
+	def value (self):
+		if len(self._points) < len(self._weights):
+			return None
+
+		return float(np.dot(self._weights, self._points))
+
+
 class Function (data.Variable):
-	def __init__ (self, expr):
-		if not isinstance(expr, data.Variable):
-			raise data.InvalidType
+	summarises = False
+
+	def __init__ (self, expr, type = None):
+		if not isinstance(expr, data.BaseVariable):
+			raise errors.InvalidType
 
 		self._expr = expr
 
-		data.Variable.__init__(self, expr.type)
+		data.Variable.__init__(self, type or expr.type)
 
 		#if alias is None:
 		self.alias = _counter.alias(self.__class__.__name__)
@@ -66,104 +262,128 @@ class Function (data.Variable):
 
 
 class FramedManipulation (Function):
+	"""
+	A variable holding an aggregate (see RollingWindow) of the
+	values of {expr} over the last {frame} seconds. It is updated
+	each time {expr} changes, so reading it and its history is cheap.
+	"""
+
+	name = None
+
 	def __init__ (self, expr, frame = 1.0, title = "", alias = None):
-		Function.__init__(self, expr)
+		Function.__init__(self, expr, float)
 
 		self.title = title
-		self.alias = alias
+
+		if alias is not None:
+			self.alias = alias
+
 		self._frame = float(frame)
+		self._window = self._createWindow()
 
+		expr.on("change", self._changed)
 
-class Differential (FramedManipulation):
-	def interp (self, start, interval, step):
-		n = max(1, int(self._frame / interval))
-		return np.gradient(self._expr.interp(start, interval, step), n)
+	def _createWindow (self):
+		raise NotImplementedError
+
+	def _changed (self, data):
+		if data['value'] is None:
+			return
+
+		# Blocks of samples (see Variable.push_many)
+		if 'times' in data:
+			for time, value in zip(data['times'].tolist(), data['values'].tolist()):
+				self._update(time, value)
+		else:
+			self._update(data['time'], data['value'])
+
+	def _update (self, time, value):
+		value = self._window.push(time, float(value))
+
+		if value is not None:
+			self._push(value, time)
+
+	def truncate (self):
+		self._window.clear()
+		Function.truncate(self)
 
 	def get_value (self):
-		return self.get(-5, 5, 0.1).tolist().pop()
+		return self._value
+
+	get = data.Variable.get
+	at = data.Variable.at
 
 	def serialize (self):
-		return " Diff (" + self._expr.serialize() + ")"
+		return " " + self.name + " (" + self._expr.serialize() + ", " + str(self._frame) + ")"
+
+
+class Differential (FramedManipulation):
+	name = "Diff"
+
+	def _createWindow (self):
+		return RollingSlope(self._frame)
 
 
 class SecondDifferential (Differential):
-	def interp (self, start, interval, step):
-		n = max(1, int(self._frame / interval))
-		diff1 = np.gradient(self._expr.interp(start, interval, step), n)
-		return np.gradient(diff1, n)
+	name = "2ndDiff"
 
-	def serialize (self):
-		return " 2ndDiff (" + self._expr.serialize() + ")"
+	def _createWindow (self):
+		return RollingSecondSlope(self._frame)
 
 
 class Max (FramedManipulation):
-	def get (self, start, interval, step):
-		new_x = data.timerange(start, interval, step)
-		m = np.max(self._expr.interp(-self._frame, self._frame, step))
-		return np.ones_like(new_x) * m
-
-	def get_value (self):
-		return np.max(self._expr.interp(-self._frame, self._frame, 0.1))
+	name = "Max"
 
-	def serialize (self):
-		return " Max (" + self._expr.serialize() + ", " + str(frame) + ")"
+	def _createWindow (self):
+		return RollingMax(self._frame)
 
 
 class Min (FramedManipulation):
-	def get (self, start, interval, step):
-		new_x = data.timerange(start, interval, step)
-		m = np.min(self._expr.interp(-self._frame, self._frame, step))
-		return np.ones_like(new_x) * m
+	name = "Min"
 
-	def get_value (self):
-		return np.min(self._expr.interp(-self._frame, self._frame, 0.1))
+	def _createWindow (self):
+		return RollingMin(self._frame)
 
-	def serialize (self):
-		return " Min (" + self._expr.serialize() + ", " + str(frame) + ")"
 
+class Mean (FramedManipulation):
+	name = "Mean"
 
-class Smooth (FramedManipulation):
-	def __init__ (self, expr, window, frame = 1.0, title = "", alias = None):
-		FramedManipulation.__init__(self, expr, frame, title, alias)
+	def _createWindow (self):
+		return RollingMean(self._frame)
 
-		self._frame = float(frame)
-		self._window_len = len(window)
-		self._half_window_len = (self._window_len - 1) / 2
-		self._window = window / window.sum() # Normalised
 
-		if int(self._half_window_len) != self._half_window_len:
-			raise Exception ("Smooth(): length of supplied window must be 2n+1")
+class Smooth (FramedManipulation):
+	"""
+	The values of {expr} smoothed by a window of 2n+1 weights. Each
+	smoothed value is given the time of the centre sample.
+	"""
 
-	def get (self, start, interval, step):
+	name = "Smooth"
 
-		new_x = data.timerange(start, interval, step)
+	def __init__ (self, expr, window, frame = 1.0, title = "", alias = None):
+		window = np.asarray(window, dtype = float)
 
-		# Get the slice of y according to frame.
-		# Need to use raw data
-		# TODO: make all manupulations use raw data!
-		x = self._expr._x
-		y = self._expr._y
+		if len(window) % 2 != 1:
+			raise Exception ("Smooth(): length of supplied window must be 2n+1")
 
-		if len(y) > self._window_len:
-			# Extend the slice so that the window can be applied to the edges.
-			s = np.r_[y[self._window_len-1:0:-1], y, y[-1:-self._window_len:-1]]
+		self._weights = window
+		self._times = deque(maxlen = len(window) // 2 + 1)
 
-			y_smooth = np.convolve(self._window, s, mode = 'valid')
-			y = y_smooth[self._half_window_len : len(y_smooth) - self._half_window_len]
+		FramedManipulation.__init__(self, expr, frame, title, alias)
 
-		return np.interp(new_x, x, y)
+	def _createWindow (self):
+		return RollingWeightedMean(self._weights)
 
-	def get_value (self):
-		try:
-			# Cast is required to avoid getting a numpy.float64 result!
-			return float(self.get(-self._frame, self._frame, 0.1)[-1])
-		except IndexError:
-			return None
+	def _update (self, time, value):
+		self._times.append(time)
+		value = self._window.push(time, float(value))
 
-	def serialize (self):
-		return " Smooth (" + self._expr.serialize() + ", " + str(frame) + ")"
+		if value is not None:
+			self._push(value, self._times[0])
 
-## average?
+	def truncate (self):
+		self._times.clear()
+		FramedManipulation.truncate(self)
 
 
 class Square (Function):
@@ -0,0 +1,199 @@
+# System Imports
+from bisect import bisect_right
+from math import floor
+
+# NumPy
+import numpy as np
+
+
+class _Level (object):
+	def __init__ (self, width, limit = None):
+		self.width = width
+		self.limit = limit
+
+		# Start time of each closed bucket, and its summary:
+		# (t_min, y_min, t_max, y_max, total, count)
+		self.t = []
+		self.buckets = []
+
+		# Buckets before this time have been discarded.
+		self.discarded = None
+
+		self._key = None
+		self._open = None
+
+	def add (self, t, t_min, y_min, t_max, y_max, total, count):
+		"""
+		Merge a sample (or a bucket from a finer level) into this level.
+
+		Returns the summary of a bucket that was closed as a result,
+		in the same form as the arguments, or None.
+		"""
+
+		key = floor(t / self.width)
+
+		if key == self._key:
+			b = self._open
+
+			if y_min < b[2]:
+				b[1] = t_min
+				b[2] = y_min
+			if y_max > b[4]:
+				b[3] = t_max
+				b[4] = y_max
+
+			b[5] += total
+			b[6] += count
+
+			return None
+
+		closed = self._close()
+
+		self._key = key
+		self._open = [key * self.width, t_min, y_min, t_max, y_max, total, count]
+
+		return closed
+
+	def _close (self):
+		if self._open is None:
+			return None
+
+		self.t.append(self._open[0])
+		self.buckets.append(tuple(self._open[1:]))
+
+		# Keep at most {limit} closed buckets, discarding the oldest
+		# in batches so that the cost is O(1) amortised.
+		if self.limit is not None and len(self.t) >= 2 * self.limit:
+			n = len(self.t) - self.limit
+			self.discarded = self.t[n]
+			del self.t[:n]
+			del self.buckets[:n]
+
+		return self._open
+
+	def range (self, start, end):
+		"""
+		Return the summaries of all buckets overlapping [start, end].
+		"""
+
+		i_start = max(0, bisect_right(self.t, start) - 1)
+		i_end = bisect_right(self.t, end)
+		buckets = self.buckets[i_start:i_end]
+
+		if self._open is not None and self._open[0] <= end:
+			buckets.append(tuple(self._open[1:]))
+
+		return buckets
+
+
+class Pyramid (object):
+	"""
+	Multi-resolution summary of a numeric series.
+
+	Each level divides time into buckets of fixed width (in seconds)
+	and records the minimum and maximum (with their times) and the mean
+	of each bucket. Raw samples are added to the finest level; whenever
+	a bucket closes it is merged into the next coarser level, so the
+	cost of a push does not depend on the number of levels.
+
+	All but the coarsest level keep only their most recent {limit}
+	to 2 * {limit} buckets, so that memory use is bounded. Older
+	periods are summarised from the coarser levels.
+	"""
+
+	def __init__ (self, widths = (1, 10, 60, 600), limit = 3600):
+		self.widths = widths
+		self.limit = limit
+		self.clear()
+
+	def clear (self):
+		self.levels = [_Level(w, self.limit) for w in self.widths[:-1]]
+		self.levels.append(_Level(self.widths[-1]))
+
+	def push (self, x, y):
+		closed = self.levels[0].add(x, x, y, x, y, y, 1)
+
+		for level in self.levels[1:]:
+			if closed is None:
+				break
+
+			closed = level.add(*closed)
+
+	def push_many (self, x, y):
+		"""
+		Add arrays of samples, as if by calling push for each. The
+		samples are summarised into buckets of the finest level
+		first, so the cost is per bucket rather than per sample.
+		"""
+
+		width = self.widths[0]
+		keys = np.floor(x / width)
+		starts = np.flatnonzero(np.diff(keys, prepend = np.nan))
+		ends = np.append(starts[1:], len(x))
+
+		for i, j in zip(starts.tolist(), ends.tolist()):
+			t = x[i:j]
+			v = y[i:j]
+			i_min = v.argmin()
+			i_max = v.argmax()
+
+			closed = self.levels[0].add(
+				t[0].item(),
+				t[i_min].item(), v[i_min].item(),
+				t[i_max].item(), v[i_max].item(),
+				v.sum().item(), j - i
+			)
+
+			for level in self.levels[1:]:
+				if closed is None:
+					break
+
+				closed = level.add(*closed)
+
+	def get (self, start, end, max_points, mode = "minmax"):
+		"""
+		Return (time, value) pairs between {start} and {end} from the
+		finest level that gives no more than {max_points} points (or
+		from the coarsest level if none does).
+
+		mode = "minmax" returns the minimum and maximum of each bucket,
+		in time order, so that peaks are retained.
+		mode = "mean" returns the mean of each bucket at its centre.
+		"""
+
+		per_bucket = 2 if mode == "minmax" else 1
+
+		for level in self.levels:
+			# Skip levels which no longer cover the start.
+			if level.discarded is not None and start < level.discarded \
+			and level is not self.levels[-1]:
+				continue
+
+			i_start = max(0, bisect_right(level.t, start) - 1)
+			i_end = bisect_right(level.t, end)
+			count = i_end - i_start + 1
+
+			if count * per_bucket <= max_points:
+				break
+
+		buckets = level.range(start, end)
+
+		if mode == "mean":
+			half = level.width / 2
+			return [
+				(floor(t_min / level.width) * level.width + half, total / count)
+				for t_min, y_min, t_max, y_max, total, count in buckets
+			]
+
+		points = []
+		for t_min, y_min, t_max, y_max, total, count in buckets:
+			if t_min < t_max:
+				points.append((t_min, y_min))
+				points.append((t_max, y_max))
+			elif t_max < t_min:
+				points.append((t_max, y_max))
+				points.append((t_min, y_min))
+			else:
+				points.append((t_min, y_min))
+
+		return points
@@ -0,0 +1,106 @@
+"""
+Micro-benchmarks for octopus.data.
+
+Run with: python -m octopus.data.test.bench_data
+"""
+
+# System Imports
+import timeit
+
+# Package Imports
+import numpy as np
+
+from .. import data
+
+
+def _report (name, number, seconds):
+	print("{:<40s} {:>12,.0f} ops/s".format(name, number / seconds))
+
+
+def bench_push (number = 100000):
+	v = data.Variable(float)
+	v._archive.min_delta = 0
+	t = [1000.0]
+
+	def push ():
+		t[0] += 0.1
+		v._push(t[0] % 7, t[0])
+
+	_report("Variable._push (10 Hz)", number, timeit.timeit(push, number = number))
+
+
+def bench_push_many (block = 100, number = 100000):
+	v = data.Variable(float)
+	v._archive.min_delta = 0
+	v.on("change", lambda data: None)
+	t = [1000.0]
+	offsets = np.arange(1, block + 1) * 0.1
+
+	def push ():
+		times = t[0] + offsets
+		t[0] = times[-1]
+		v.push_many(times, times % 7)
+
+	_report(
+		"Variable.push_many ({:d} per block)".format(block),
+		number,
+		timeit.timeit(push, number = number // block)
+	)
+
+
+def bench_window (number = 10000):
+	v = data.Variable(float)
+	v._archive.min_delta = 0
+
+	for i in range(10000):
+		v._push(float(i % 7), 1000.0 + i * 0.1)
+
+	end = v._time
+
+	def window ():
+		v.get(end - 20, 10)
+
+	_report("Variable.get (10 s of live window)", number, timeit.timeit(window, number = number))
+
+
+def bench_archive_get (hours = 8, number = 10000):
+	a = data.Archive()
+	a.threshold_factor = None
+	a._zero = 0
+
+	# Sampled at 10 Hz, every point retained
+	for i in range(hours * 36000):
+		a.push(i * 0.1, float(i % 7))
+
+	def window ():
+		a.get(hours * 1800, 60)
+
+	_report("Archive.get (1 min of {:d} h archive)".format(hours), number, timeit.timeit(window, number = number))
+
+
+def bench_expression_chain (depth = 10, number = 20000):
+	AddExpression = type(data.Constant(0) + 1)
+
+	for lazy in (False, True):
+		v = data.Variable(float)
+		v._archive.min_delta = 0
+		t = [1000.0]
+
+		expr = v
+		for i in range(depth):
+			expr = AddExpression(expr, 1, lazy = lazy)
+
+		def push ():
+			t[0] += 0.1
+			v._push(t[0] % 7, t[0])
+
+		_report("push to {:d} {:s} expressions".format(depth, "lazy" if lazy else "eager"), number, timeit.timeit(push, number = number))
+
+
+if __name__ == "__main__":
+	bench_push()
+	bench_push_many()
+	bench_push_many(1000)
+	bench_window()
+	bench_archive_get()
+	bench_expression_chain()
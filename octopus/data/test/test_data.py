@@ -1,9 +1,13 @@
 from twisted.internet import defer
 from twisted.trial import unittest
 
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
-from .. import data
+import random
+
+import numpy as np
+
+from .. import data, buffer, pyramid, chunkfile
 
 class UtilsTestCase (unittest.TestCase):
 	def setUp (self):
@@ -18,6 +22,26 @@ class UtilsTestCase (unittest.TestCase):
 		self.assertEqual(data._lower_bound(self.x, 3.5), 2)
 		self.assertEqual(data._lower_bound(self.x, 4), 3)
 
+		# Out of range
+		self.assertEqual(data._upper_bound(self.x, 5), None)
+		self.assertEqual(data._lower_bound(self.x, 0), None)
+
+		# NumPy arrays give the same results as lists
+		x = np.array(self.x, dtype = float)
+		for t in (0, 1, 2, 3.5, 4, 5):
+			self.assertEqual(data._upper_bound(x, t), data._upper_bound(self.x, t))
+			self.assertEqual(data._lower_bound(x, t), data._lower_bound(self.x, t))
+
+	def test_get_long_archive (self):
+		# Eight hours at 10 Hz
+		x = [i * 0.1 for i in range(288000)]
+		y = list(range(288000))
+
+		self.assertEqual(
+			data._get(x, y, x[-1], x[0], 3600.05, 0.2),
+			[(x[36000], 36000), (x[36001], 36001), (x[36002], 36002), (x[36003], 36003)]
+		)
+
 	def test_get (self):
 		# Get all data
 		self.assertEqual(
@@ -75,7 +99,7 @@ class VariablesTestCase (unittest.TestCase):
 		self.v.set(3)
 		self.v.set(4)
 		self.v.set(5)
-		self.assertEqual(self.v._y, [2, 3, 4, 5])
+		self.assertEqual(self.v._y.tolist(), [2, 3, 4, 5])
 		self.assertEqual([y for x, y in self.v.get()], [2, 3, 4, 5])
 
 	def test_get (self):
@@ -85,10 +109,430 @@ class VariablesTestCase (unittest.TestCase):
 		v._push(3, 2)
 		v._push(4, 3)
 		v._push(5, 4)
-		self.assertEqual(v._x, [1, 2, 3, 4])
-		self.assertEqual(v._y, [2, 3, 4, 5])
+		self.assertEqual(v._x.tolist(), [1, 2, 3, 4])
+		self.assertEqual(v._y.tolist(), [2, 3, 4, 5])
 		self.assertEqual(v.get(2, 1), [(2, 3), (3, 4)])
 
+	def test_trim (self):
+		v = data.Variable(float)
+		v._archive.min_delta = 0
+		for t in range(100):
+			v._push(float(t), t)
+
+		# The live window keeps one point at or before (latest - length)
+		self.assertEqual(v._x[0], 99 - v.length)
+		self.assertEqual(v.get(80, 2), [(80, 80.0), (81, 81.0), (82, 82.0)])
+
+	def test_window_capacity (self):
+		# The live window covers {length} seconds at any sample rate
+		v = data.Variable(float)
+		v._buffer = buffer.RingBuffer(float, 16)
+		v.length = 1
+
+		for i in range(100):
+			v._push(float(i % 7), i * 0.02)
+
+		self.assertAlmostEqual(v._x[0], 1.98 - 1)
+		self.assertEqual(len(v._x), 51)
+
+		v.push_many(np.arange(100, 400) * 0.02, np.arange(300) % 7.)
+		self.assertAlmostEqual(v._x[0], 7.98 - 1)
+		self.assertEqual(len(v._x), 51)
+
+	def test_push_many (self):
+		v = data.Variable(float)
+		w = data.Variable(float)
+		v._archive.min_delta = w._archive.min_delta = 0
+
+		times = [float(t) for t in range(10)]
+		values = [1., 2., 2., 2., 2., 3., 3., 3., 4., 4.]
+
+		for t, y in zip(times, values):
+			v._push(y, t)
+
+		changed = Mock()
+		w.on("change", changed)
+		w.push_many(times, values)
+
+		# One event, for the latest sample, with the samples for which
+		# _push would have emitted
+		changed.assert_called_once()
+		event = changed.call_args[0][0]
+		self.assertEqual((event["time"], event["value"]), (9., 4.))
+		self.assertEqual(event["times"].tolist(), [0, 1, 2, 5, 6, 8, 9])
+		self.assertEqual(event["values"].tolist(), [1, 2, 2, 3, 3, 4, 4])
+
+		# The same result as pushing each sample
+		self.assertEqual(w._x.tolist(), v._x.tolist())
+		self.assertEqual(w._y.tolist(), v._y.tolist())
+		self.assertEqual(w.get(), v.get())
+		self.assertEqual((w.value, w._time), (4., 9.))
+
+		# A run continued from the previous block
+		v._push(4., 10.)
+		w.push_many([10.], [4.])
+		self.assertEqual(w._x.tolist(), v._x.tolist())
+		self.assertEqual(changed.call_count, 1)
+
+		# Values are converted to the variable type
+		i = data.Variable(int)
+		i.push_many([1, 2], ["3", 4.])
+		self.assertEqual(i._y.tolist(), [3, 4])
+		self.assertIs(type(i.value), int)
+
+	def test_push_many_random (self):
+		# push_many gives the same window, archive, value and
+		# changes as _push, whatever the state of the window.
+		rng = random.Random(0)
+
+		def _changes (events):
+			def _changed (data):
+				if "times" in data:
+					events.extend(zip(data["times"].tolist(), data["values"].tolist()))
+				else:
+					events.append((data["time"], data["value"]))
+
+			return _changed
+
+		for trial in range(500):
+			v = data.Variable(float)
+			w = data.Variable(float)
+			capacity = rng.choice([4, 4096])
+			length = rng.choice([1, 3, 30])
+			events_v = []
+			events_w = []
+
+			for x in (v, w):
+				x._buffer = buffer.RingBuffer(float, capacity)
+				x._archive.min_delta = 0
+				x._archive._zero = 0
+				x.length = length
+
+			v.on("change", _changes(events_v))
+			w.on("change", _changes(events_w))
+
+			t = 0.
+			for i in range(rng.randint(0, 3)):
+				y = float(rng.choice([1, 2]))
+				v._push(y, t)
+				w._push(y, t)
+
+			for block in range(rng.randint(1, 6)):
+				times = []
+				values = []
+
+				for i in range(rng.randint(1, 8)):
+					t += rng.choice([0, 1, 2])
+					times.append(t)
+					values.append(float(rng.choice([1, 2])))
+
+				for time, value in zip(times, values):
+					v._push(value, time)
+
+				w.push_many(times, values)
+
+			self.assertEqual(w._x.tolist(), v._x.tolist())
+			self.assertEqual(w._y.tolist(), v._y.tolist())
+			self.assertEqual(w.get(), v.get())
+			self.assertEqual((w.value, w._time), (v.value, v._time))
+			self.assertEqual(events_w, events_v)
+
+	def test_push_many_errors (self):
+		v = data.Variable(float)
+		v._push(1., 5)
+
+		self.assertRaises(Exception, v.push_many, [4, 6], [1., 2.])
+		self.assertRaises(Exception, v.push_many, [6, 5.5], [1., 2.])
+		self.assertRaises(ValueError, v.push_many, [6, 7], [1.])
+
+		v.push_many([], [])
+		self.assertEqual(v._x.tolist(), [5])
+
+
+class ArchiveSpillTestCase (unittest.TestCase):
+	def setUp (self):
+		self.a = data.Archive()
+		self.a.threshold_factor = None
+		self.a.chunk_size = 10
+		self.a._zero = 0
+		self.a.spill(self.mktemp(), float)
+
+	def tearDown (self):
+		self.a.close()
+
+	def test_spill (self):
+		for i in range(95):
+			self.a.push(i * 0.5, float(i))
+
+		# Only the unsealed tail remains in memory
+		self.assertEqual(len(self.a._file), 9)
+		self.assertTrue(len(self.a._x) <= self.a.chunk_size)
+
+		# Historical and recent queries
+		self.assertEqual(self.a.get(10, 1), [(10, 20.0), (10.5, 21.0), (11, 22.0)])
+		self.assertEqual(self.a.get(46, 1), [(46, 92.0), (46.5, 93.0), (47, 94.0)])
+		self.assertEqual(self.a.get(44.5, 0.5), [(44.5, 89.0), (45, 90.0)])
+		self.assertEqual(self.a.get(0, 0.2), [(0, 0.0), (0.5, 1.0)])
+		self.assertEqual(len(self.a.get()), 95)
+
+	def test_push_many (self):
+		self.a.push_many(np.arange(95) * 0.5, np.arange(95, dtype = float))
+
+		self.assertEqual(len(self.a._file), 9)
+		self.assertEqual(self.a.get(10, 1), [(10, 20.0), (10.5, 21.0), (11, 22.0)])
+		self.assertEqual(len(self.a.get()), 95)
+
+	def test_push_many_threshold (self):
+		# push_many keeps and spills the same points as push,
+		# including local extremes, across blocks of any size.
+		rng = np.random.RandomState(1)
+
+		for trial in range(50):
+			a = data.Archive()
+			b = data.Archive()
+			a.min_delta = b.min_delta = rng.choice([0, 0.5, 2])
+			a.chunk_size = b.chunk_size = 10
+			a._zero = b._zero = 0
+			a.spill(self.mktemp(), float)
+			b.spill(self.mktemp(), float)
+			self.addCleanup(a.close)
+			self.addCleanup(b.close)
+
+			x = np.arange(rng.randint(1, 400)) * 0.5
+			y = np.round(np.cumsum(rng.normal(0, 1, len(x))), 1)
+
+			for t, v in zip(x.tolist(), y.tolist()):
+				a.push(t, v)
+
+			i = 0
+			while i < len(x):
+				n = rng.randint(1, 100)
+				b.push_many(x[i:i + n], y[i:i + n])
+				i += n
+
+			self.assertEqual(b.get(), a.get())
+			self.assertEqual(len(b._file), len(a._file))
+			self.assertEqual(b._x, a._x)
+
+	def test_truncate (self):
+		for i in range(25):
+			self.a.push(i, float(i))
+
+		self.a.truncate()
+		self.assertEqual(len(self.a._file), 0)
+		self.assertEqual(self.a._x, [24])
+
+		# Spilling continues after a truncate
+		self.a._zero = 0
+		for i in range(25, 50):
+			self.a.push(i, float(i))
+
+		self.assertEqual(len(self.a._file), 2)
+		self.assertEqual(self.a.get(26, 1), [(26, 26.0), (27, 27.0)])
+		self.assertEqual(len(self.a.get()), 26)
+
+	def test_close (self):
+		for i in range(25):
+			self.a.push(i, float(i))
+
+		file = self.a._file
+		self.a.close()
+		self.assertIsNone(self.a._file)
+		self.assertTrue(file._fp.closed)
+
+		# The data in memory remain
+		self.assertEqual(self.a.get(), [(20, 20.0), (21, 21.0), (22, 22.0), (23, 23.0), (24, 24.0)])
+
+		# Which is no longer spilled
+		for i in range(25, 50):
+			self.a.push(i, float(i))
+
+		self.assertEqual(len(self.a._x), 30)
+
+
+class ChunkFileTestCase (unittest.TestCase):
+	def test_precision (self):
+		f = chunkfile.ChunkFile(self.mktemp())
+		self.addCleanup(f.close)
+
+		# A day at 10 Hz, as absolute times: times are read back exactly
+		x = 1.7e9 + np.arange(864000) * 0.1
+		y = np.arange(864000, dtype = float)
+		f.append(x, y)
+
+		times, values = f.read()
+		self.assertTrue(np.array_equal(times, x))
+		self.assertTrue(np.array_equal(values, y))
+
+
+class PyramidTestCase (unittest.TestCase):
+	def setUp (self):
+		self.p = pyramid.Pyramid((1, 10))
+
+		# 100 s at 10 Hz, with a single spike
+		for i in range(1000):
+			self.p.push(i * 0.1, 50.0 if i == 555 else float(i % 10))
+
+	def test_levels (self):
+		self.assertEqual(len(self.p.levels[0].t), 99)
+		self.assertEqual(len(self.p.levels[1].t), 9)
+		self.assertEqual(self.p.levels[1].buckets[0][3], 9.0)
+
+	def test_get (self):
+		# 1 s buckets fit
+		points = self.p.get(50, 60, 40)
+		self.assertTrue(len(points) <= 40)
+		self.assertIn((55.5, 50.0), points)
+
+		# Falls back to 10 s buckets
+		points = self.p.get(0, 100, 40)
+		self.assertEqual(len(points), 20)
+		self.assertIn((55.5, 50.0), points)
+
+		means = self.p.get(0, 100, 10, "mean")
+		self.assertEqual(len(means), 10)
+		self.assertEqual(means[0][0], 5)
+
+	def test_archive (self):
+		a = data.Archive()
+		a.threshold_factor = None
+		a._zero = 0
+
+		for i in range(1000):
+			a.push(i * 0.1, float(i % 10))
+
+		self.assertEqual(len(a.get(0, 100)), 1001)
+		self.assertTrue(len(a.get(0, 100, max_points = 100)) <= 100)
+		self.assertEqual(len(a.get(0, 2, max_points = 100)), 21)
+
+		# Without a start time, the whole archive is summarised
+		self.assertEqual(a.get(max_points = 100), a.get(0, 99.9, max_points = 100))
+		self.assertTrue(len(a.get(max_points = 100)) <= 100)
+		self.assertEqual(len(a.get(max_points = 2000)), 1000)
+
+	def test_variable_max_points (self):
+		v = data.Variable(float)
+		v._archive._zero = 0
+		v._archive.min_delta = 0
+		v.push_many(np.arange(10000) * 0.1, np.arange(10000) % 7.)
+
+		self.assertTrue(len(v.get(max_points = 100)) <= 100)
+		self.assertEqual(len(v.get()), len(v._archive.get()))
+
+	def test_limit (self):
+		p = pyramid.Pyramid((1, 10), limit = 50)
+
+		# 1000 s at 10 Hz
+		for i in range(10000):
+			p.push(i * 0.1, float(i % 10))
+
+		# The fine level only keeps recent buckets
+		self.assertTrue(50 <= len(p.levels[0].t) < 100)
+		self.assertEqual(len(p.levels[1].t), 99)
+
+		# Recent periods come from the fine level...
+		points = p.get(950, 960, 100)
+		self.assertEqual(len(points), 22)
+
+		# ... and older ones from the coarser level
+		points = p.get(100, 110, 100)
+		self.assertEqual(points, [(100.0, 0.0), (100.9, 9.0), (110.0, 0.0), (110.9, 9.0)])
+
+	def test_push_many (self):
+		p = pyramid.Pyramid((1, 10))
+		x = np.arange(1000) * 0.1
+		y = np.where(np.arange(1000) == 555, 50.0, np.arange(1000) % 10.)
+
+		# In blocks that do not line up with the buckets
+		for i in range(0, 1000, 37):
+			p.push_many(x[i:i + 37], y[i:i + 37])
+
+		for level, expected in zip(p.levels, self.p.levels):
+			self.assertEqual(level.t, expected.t)
+			self.assertEqual(level.buckets, expected.buckets)
+
+	def test_archive_push_many (self):
+		a = data.Archive()
+		b = data.Archive()
+		a._zero = b._zero = 10
+
+		x = np.arange(1000) * 0.1
+		y = np.sin(x) * 100
+
+		for t, v in zip(x.tolist(), y.tolist()):
+			a.push(t, v)
+
+		b.push_many(x[:500], y[:500])
+		b.push_many(x[500:], y[500:])
+
+		# Points before the reset are ignored
+		self.assertEqual(b.get()[0][0], 10)
+		self.assertEqual(b.get(), a.get())
+		self.assertEqual(b.get(0, 100, max_points = 50), a.get(0, 100, max_points = 50))
+
+
+class RingBufferTestCase (unittest.TestCase):
+	def test_wrap (self):
+		b = buffer.RingBuffer(int, 4)
+		for i in range(6):
+			b.append(float(i), i * 10)
+
+		self.assertEqual(len(b), 4)
+		self.assertEqual(b.times.tolist(), [2, 3, 4, 5])
+		self.assertEqual(b.values.tolist(), [20, 30, 40, 50])
+
+		# The window is a view, not a copy
+		self.assertIsNotNone(b.times.base)
+
+		b.set_last_time(6.0)
+		self.assertEqual(b.times.tolist(), [2, 3, 4, 6])
+
+	def test_extend (self):
+		b = buffer.RingBuffer(int, 4)
+		b.append(0., 0)
+		b.extend(np.array([1., 2., 3., 4.]), np.array([10, 20, 30, 40]))
+
+		self.assertEqual(b.times.tolist(), [1, 2, 3, 4])
+		self.assertEqual(b.values.tolist(), [10, 20, 30, 40])
+
+		# More samples than fit
+		b.extend(np.arange(5., 11.), np.arange(50, 110, 10))
+		self.assertEqual(b.times.tolist(), [7, 8, 9, 10])
+		self.assertEqual(b.values.tolist(), [70, 80, 90, 100])
+
+		b.pop()
+		self.assertEqual(b.times.tolist(), [7, 8, 9])
+
+	def test_reserve (self):
+		b = buffer.RingBuffer(int, 4)
+		for i in range(6):
+			b.append(float(i), i * 10)
+
+		b.reserve(6)
+		self.assertEqual(b.capacity, 8)
+		self.assertEqual(b.times.tolist(), [2, 3, 4, 5])
+
+		for i in range(6, 10):
+			b.append(float(i), i * 10)
+
+		self.assertEqual(b.values.tolist(), [20, 30, 40, 50, 60, 70, 80, 90])
+
+		b.append(10., 100)
+		self.assertEqual(b.times.tolist(), [3, 4, 5, 6, 7, 8, 9, 10])
+
+	def test_drop_before (self):
+		b = buffer.RingBuffer(str, 8)
+		for i in range(5):
+			b.append(float(i), str(i))
+
+		b.drop_before(2.5)
+		self.assertEqual(b.times.tolist(), [2, 3, 4])
+		self.assertEqual(b.values.tolist(), ["2", "3", "4"])
+
+		b.clear()
+		self.assertEqual(len(b), 0)
+
+
 class ExpressionsTestCase (unittest.TestCase):
 	def setUp (self):
 		self.v = data.Variable(int, 2)
@@ -112,3 +556,131 @@ class ExpressionsTestCase (unittest.TestCase):
 
 		self.assertEqual(add.value, 6)
 
+	def test_unary (self):
+		neg = self.v.neg()
+		self.assertEqual(neg.value, -2)
+
+		self.v.set(5)
+		self.assertEqual(neg.value, -5)
+
+	def _variable (self, points):
+		v = data.Variable(int)
+		v._archive.min_delta = 0
+
+		for t, y in points:
+			v._push(y, self.t0 + t)
+
+		return v
+
+	def _points (self, expr):
+		return [(round(x - self.t0, 6), y) for x, y in expr.get_archive()]
+
+	def test_archive (self):
+		self.t0 = data.now() + 1
+		a = self._variable([(0, 1), (2, 3), (3, 4)])
+		b = self._variable([(1, 10), (2, 20), (5, 50)])
+
+		self.assertEqual(self._points(a + b), [
+			(1, 11), (2, 23), (3, 24), (5, 54)
+		])
+		self.assertEqual(self._points(a * 2), [(0, 2), (2, 6), (3, 8)])
+		self.assertEqual(self._points((a - b).neg()), [
+			(1, 9), (2, 17), (3, 16), (5, 46)
+		])
+		self.assertEqual(self._points((a > 2).and_(b)), [
+			(1, False), (2, 20), (3, 20), (5, 50)
+		])
+		self.assertEqual((a + b).at(self.t0 + 3), 24)
+
+	def test_archive_str (self):
+		# Operators that convert to str are applied to each value
+		self.t0 = data.now() + 1
+		a = self._variable([(0, 1), (2, 3)])
+
+		self.assertEqual(self._points("val: " + a), [(0, "val: 1"), (2, "val: 3")])
+		self.assertEqual(self._points(a + ""), [(0, "1"), (2, "3")])
+
+	def test_archive_cache (self):
+		self.t0 = data.now() + 1
+		a = self._variable([(0, 1), (1, 2)])
+		add = (a + 1) * 2
+
+		x, y = add._archive()
+		self.assertIs(add._archive()[1], y)
+		self.assertEqual(self._points(add), [(0, 4), (1, 6)])
+
+		# New data invalidates the stored archive
+		a._push(3, self.t0 + 2)
+		self.assertEqual(self._points(add), [(0, 4), (1, 6), (2, 8)])
+
+
+class LazyExpressionsTestCase (unittest.TestCase):
+	def setUp (self):
+		self.v = data.Variable(int, 2)
+		self.v._archive.min_delta = 0
+
+		self.patcher = patch.object(data.Expression, "lazy", True)
+		self.patcher.start()
+		self.addCleanup(self.patcher.stop)
+
+	def _chain (self, n):
+		expr = self.v
+		for i in range(n):
+			expr = expr + 1
+
+		return expr
+
+	def test_pull (self):
+		expr = self._chain(10)
+		self.assertEqual(expr.value, 12)
+
+		with patch.object(data.Expression, "_update", autospec = True, side_effect = data.Expression._update) as update:
+			for i in range(100):
+				self.v.set(i)
+
+			# Nothing is calculated until the value is read
+			self.assertEqual(update.call_count, 0)
+			self.assertEqual(expr.value, 109)
+
+			# Then each expression is calculated once
+			self.assertEqual(update.call_count, 10)
+			self.assertEqual(expr.value, 109)
+			self.assertEqual(update.call_count, 10)
+
+	def test_version (self):
+		expr = self._chain(2)
+		version = expr.version
+
+		self.v.set(3)
+		self.v.set(4)
+		self.assertEqual(expr.version, version + 1)
+
+		self.assertEqual(expr.value, 6)
+		self.v.set(5)
+		self.assertEqual(expr.version, version + 2)
+
+	def test_listeners (self):
+		inner = self.v + 1
+		outer = inner * 2
+
+		# Lazy expressions are not listeners of each other
+		self.assertEqual(inner.listeners("change"), [])
+
+		changed = Mock()
+		self.v.set(3)
+		outer.on("change", changed)
+
+		# With a listener, changes are calculated and emitted
+		self.v.set(4)
+		self.v.set(5)
+		self.assertEqual(changed.call_count, 2)
+		self.assertEqual(changed.call_args[0][0]["value"], 12)
+
+	def test_not_lazy (self):
+		expr = self.v + 1
+		self.assertTrue(expr.lazy)
+
+		eager = type(expr)(self.v, 1, lazy = False)
+		self.assertFalse(eager.lazy)
+		self.assertIn(eager._changed, self.v.listeners("change"))
+
@@ -0,0 +1,104 @@
+from twisted.trial import unittest
+
+import random
+
+import numpy as np
+
+from .. import data, manipulation
+
+
+class RollingWindowTestCase (unittest.TestCase):
+	def setUp (self):
+		rng = random.Random(1)
+		self.x = [1e9 + i * 0.1 + rng.random() * 0.05 for i in range(500)]
+		self.y = [rng.gauss(0, 10) for i in range(500)]
+
+	def _check (self, window, fn):
+		for i, (x, y) in enumerate(zip(self.x, self.y)):
+			value = window.push(x, y)
+
+			frame = [j for j in range(i + 1) if self.x[j] >= x - window.frame]
+			expected = fn(np.array(self.x)[frame], np.array(self.y)[frame])
+
+			if expected is None:
+				self.assertIsNone(value)
+			else:
+				self.assertAlmostEqual(value, expected, places = 6)
+
+	def test_mean (self):
+		self._check(manipulation.RollingMean(2), lambda x, y: np.mean(y))
+
+	def test_max (self):
+		self._check(manipulation.RollingMax(2), lambda x, y: np.max(y))
+
+	def test_min (self):
+		self._check(manipulation.RollingMin(2), lambda x, y: np.min(y))
+
+	def test_slope (self):
+		self._check(
+			manipulation.RollingSlope(2),
+			lambda x, y: np.polyfit(x - x[0], y, 1)[0] if len(x) > 1 else None
+		)
+
+	def test_weighted_mean (self):
+		window = manipulation.RollingWeightedMean([1, 2, 1])
+
+		self.assertIsNone(window.push(0, 4))
+		self.assertIsNone(window.push(1, 8))
+		self.assertEqual(window.push(2, 4), 6)
+		self.assertEqual(window.push(3, 0), 4)
+
+
+class FramedManipulationTestCase (unittest.TestCase):
+	def setUp (self):
+		self.t0 = data.now() + 1
+		self.v = data.Variable(int)
+		self.v._archive.min_delta = 0
+
+	def _push (self, points):
+		for t, y in points:
+			self.v._push(y, self.t0 + t)
+
+	def test_max (self):
+		m = manipulation.Max(self.v, 2)
+		m._archive.min_delta = 0
+		self._push([(0, 5), (1, 3), (2, 4), (3, 1)])
+
+		self.assertEqual(m.value, 4)
+		self.assertEqual([y for x, y in m.get()], [5, 4])
+
+	def test_differential (self):
+		d = manipulation.Differential(self.v, 5)
+		self.assertIsNone(d.value)
+
+		self._push([(t, 3 * t) for t in range(10)])
+		self.assertAlmostEqual(d.value, 3)
+
+		d2 = manipulation.SecondDifferential(self.v + 0, 5)
+		self._push([(10 + t, 30 + t * t) for t in range(20)])
+		self.assertAlmostEqual(d2.value, 2)
+
+	def test_smooth (self):
+		s = manipulation.Smooth(self.v, np.array([1, 2, 1]))
+		s._archive.min_delta = 0
+		self._push([(0, 4), (1, 8), (2, 4), (3, 0)])
+
+		self.assertEqual(s.value, 4)
+		self.assertEqual([(round(x - self.t0), y) for x, y in s.get()], [(1, 6), (2, 4)])
+
+	def test_push_many (self):
+		# Each sample of a block reaches the window
+		s = manipulation.Smooth(self.v, np.array([1, 2, 1]))
+		s._archive.min_delta = 0
+		self.v.push_many([self.t0 + t for t in range(4)], [4, 8, 4, 0])
+
+		self.assertEqual([(round(x - self.t0), y) for x, y in s.get()], [(1, 6), (2, 4)])
+
+	def test_truncate (self):
+		m = manipulation.Mean(self.v, 10)
+		self._push([(0, 2), (1, 4)])
+		self.assertEqual(m.value, 3)
+
+		m.truncate()
+		self._push([(2, 10)])
+		self.assertEqual(m.value, 10)
@@ -1,5 +1,6 @@
 # System Imports
 import functools
+import weakref
 
 # Twisted Imports
 from twisted.python import log
@@ -30,24 +31,94 @@ class Event (object):
 	__len__  = getHandlerCount
 
 
+def _weakHandler (emitter, name, function):
+	# Returns a handler that calls {function} through a weak reference.
+	# When {function} is garbage collected the handler is removed from
+	# the emitter. (A closure is much quicker to call than an object.)
+
+	def _remove (ref, emitter = weakref.ref(emitter)):
+		emitter = emitter()
+
+		if emitter is not None:
+			emitter._remove(name, handler)
+
+	# Bound methods are referenced through their object, since a
+	# method object is created on each attribute access.
+	try:
+		obj = weakref.ref(function.__self__, _remove)
+		func = function.__func__
+	except AttributeError:
+		obj = weakref.ref(function, _remove)
+
+		def handler (*args):
+			f = obj()
+
+			if f is not None:
+				f(*args)
+
+		handler.resolve = obj
+	else:
+		def handler (*args):
+			o = obj()
+
+			if o is not None:
+				func(o, *args)
+
+		def resolve ():
+			o = obj()
+			return None if o is None else func.__get__(o)
+
+		handler.resolve = resolve
+
+	handler.weak = True
+	return handler
+
+
+def _same (a, b):
+	# Use is instead of == to avoid equality comparison (this would
+	# create extra expression objects). Bound methods are created on
+	# each attribute access, so compare their object and function.
+	if a is b:
+		return True
+
+	try:
+		return a.__self__ is b.__self__ and a.__func__ is b.__func__
+	except AttributeError:
+		return False
+
+
+def _refers (handler, function):
+	if _same(handler, function):
+		return True
+
+	return getattr(handler, "weak", False) is True and _same(handler.resolve(), function)
+
+
 class EventEmitter (object):
-	def on (self, name, function = None):
+	""" Handlers for each event are kept in a tuple, which is replaced
+	(rather than changed) when handlers are added or removed. emit()
+	therefore needs no copy of the handlers, and a handler may add or
+	remove handlers while an event is being emitted. """
+
+	def on (self, name, function = None, weak = False):
+		""" Call {function} whenever event {name} is emitted. If {weak}
+		is True, only a weak reference to {function} is kept, and the
+		handler is removed when {function} is garbage collected. """
+
 		def _on (function):
 			try:
-				self._events[name]
-			except (TypeError, AttributeError):
-				self._events = {}
-				self._events[name] = []
-			except KeyError:
-				self._events[name] = []
-
-			# Use is instead of in to avoid equality comparison
-			# (this would create extra expression objects).
-			for f in self._events[name]:
-				if function is f:
+				events = self._events
+			except AttributeError:
+				events = self._events = {}
+
+			handlers = events.get(name, ())
+
+			for f in handlers:
+				if _refers(f, function):
 					return function
 
-			self._events[name].append(function)
+			handler = _weakHandler(self, name, function) if weak else function
+			events[name] = handlers + (handler, )
 
 			return function
 
@@ -82,50 +153,59 @@ class EventEmitter (object):
 
 		# If no function is passed, remove all functions
 		elif function is None:
-			try:
-				self._events[name] = []
-			except KeyError:
-				pass
+			self._events.pop(name, None)
 
 		# Remove handler [function] from [name]
 		else:
-			self._events[name].remove(function)
+			handlers = self._events[name]
+
+			for i, f in enumerate(handlers):
+				if _refers(f, function):
+					self._set(name, handlers[:i] + handlers[i + 1:])
+					return
+
+			raise ValueError("Handler is not registered for " + str(name))
+
+	def _remove (self, name, handler):
+		# Remove a particular handler object, if it is still registered.
+		handlers = self._events.get(name, ())
+		self._set(name, tuple(f for f in handlers if f is not handler))
+
+	def _set (self, name, handlers):
+		if len(handlers):
+			self._events[name] = handlers
+		else:
+			self._events.pop(name, None)
 
 	def listeners (self, event):
 		try:
-			return self._events[event]
+			handlers = self._events[event]
 		except (AttributeError, KeyError):
 			return []
 
-	def emit (self, _event, **data):
-		handled = False
+		return [f.resolve() if getattr(f, "weak", False) is True else f for f in handlers]
 
+	def emit (self, _event, **data):
 		try:
-			events = self._events[_event][:]
+			events = self._events
 		except AttributeError:
 			return False # No events defined yet
-		except KeyError:
-			pass
-		else:
-			handled |= bool(len(events))
 
-			for function in events:
-				try:
-					function(data)
-				except:
-					log.err()
+		handlers = events.get(_event, ())
 
-		try:
-			events = self._events["all"][:]
-		except KeyError:
-			pass
-		else:
-			handled |= bool(len(events))
+		for function in handlers:
+			try:
+				function(data)
+			except:
+				log.err()
 
-			for function in events:
-				try:
-					function(_event, data)
-				except:
-					log.err()
+		if "all" not in events:
+			return len(handlers) > 0
+
+		for function in events["all"]:
+			try:
+				function(_event, data)
+			except:
+				log.err()
 
-		return handled
+		return True
@@ -7,7 +7,7 @@ from twisted.logger import Logger
 import logging
 
 # Package Imports
-from .. import util, data
+from .. import util, data, queue
 from ..data.data import BaseVariable
 from ..image.data import Image
 
@@ -307,7 +307,8 @@ class Machine (Component):
 		return defer.succeed(None)
 
 	def _tick (self, fn, interval):
-		c = task.LoopingCall(fn)
+		# Commands sent by polling functions give way to others.
+		c = task.LoopingCall(queue.background(fn))
 		c.start(interval, now = True)
 		self._ticks.append(c)
 
@@ -347,7 +348,8 @@ class Stream (data.Variable):
 			var_value = self.value,
 			var_unit = self.unit
 		)
-	# _push is used internally to add data coming in from the machine.
+	# _push (or push_many, for blocks of samples) is used internally
+	# to add data coming in from the machine.
 
 
 # Discrete (ish) variables
@@ -393,6 +395,27 @@ class Property (Stream):
 
 			data.Variable._push(self, value, time)
 
+	def push_many (self, times, values):
+		# As _push: ignore repeat values, and make step changes.
+		step_times = []
+		step_values = []
+		previous = self.value
+
+		for time, value in zip(times, values):
+			if type(value) != self.type:
+				value = self.type(value)
+
+			if value != previous:
+				if previous is not None:
+					step_times.append(time)
+					step_values.append(previous)
+
+				step_times.append(time)
+				step_values.append(value)
+				previous = value
+
+		data.Variable.push_many(self, step_times, step_values)
+
 	def check (self, value):
 		if self.options is not None and value not in self.options:
 			raise data.errors.InvalidValue(f"{self.alias}: {value!r} is not a valid option. Allowed values: {self.options}")
@@ -405,8 +428,8 @@ class Property (Stream):
 
 		return True
 
-	def get (self, start, interval = None, step = 1):
-		return self._archive.get(start, interval)
+	def get (self, start, interval = None, step = 1, max_points = None):
+		return self._archive.get(start, interval, max_points)
 
 
 class Error (Exception):
@@ -80,6 +80,27 @@ class MutableTestCase (unittest.TestCase):
 			self.p_str.set(value)
 			self.assertEqual(self.p_str.value, value)
 
+	def test_push_many (self):
+		changed = Mock()
+		self.p_int._push(1, 0)
+		self.p_int.on("change", changed)
+
+		self.p_int.push_many([1, 2, 3, 4], [1, "2", 2.5, 3])
+
+		# Repeats are ignored, and changes are steps
+		self.assertEqual(self.p_int._x.tolist(), [0, 2, 2, 4, 4])
+		self.assertEqual(self.p_int._y.tolist(), [1, 1, 2, 2, 3])
+		self.assertEqual(self.p_int.value, 3)
+		self.assertEqual(changed.call_count, 1)
+
+		# Nothing new
+		self.p_int.push_many([5, 6], [3, 3])
+		self.assertEqual(changed.call_count, 1)
+		self.assertEqual(self.p_int._x.tolist(), [0, 2, 2, 4, 4])
+
+		self.p_str.push_many([1, 2], ["a", "b"])
+		self.assertEqual(self.p_str._y.tolist(), ["a", "a", "b"])
+
 	def test_convert (self):
 		for i in range(100):
 			value = random.randint(-100000, 100000)
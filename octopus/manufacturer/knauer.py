@@ -1,6 +1,7 @@
 # Twisted Imports
 from twisted.internet import defer
 from twisted.internet.protocol import Factory
+from twisted.python import log
 
 # System Imports
 from time import time as now
@@ -24,9 +25,7 @@ class K120LineReceiver (QueuedLineReceiver):
 			if r is None \
 			and self._current.line == "S?" \
 			and len(self._buffer) >= 3:
-				line = self._buffer[:3]
-				self._buffer = self._buffer[3:]
-				self.lineReceived(line)
+				self.lineReceived(self._buffer.read(3))
 
 		except AttributeError:
 			pass
@@ -131,8 +130,12 @@ class K120 (Machine):
 				self.status._push("manual-stop")
 
 		def monitor ():
-			self.protocol.write("S?").addCallback(interpretStatus)
-			self.protocol.write("F?").addCallback(interpretFlowrate)
+			# Both are queued at once (so are pipelined if the protocol
+			# allows), but each reply is handled separately.
+			return defer.gatherResults([
+				self.protocol.write("S?").addCallback(interpretStatus).addErrback(log.err),
+				self.protocol.write("F?").addCallback(interpretFlowrate).addErrback(log.err)
+			])
 
 		self._tick(monitor, 1)
 
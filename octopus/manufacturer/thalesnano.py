@@ -210,11 +210,7 @@ class HCube (Machine):
 
 		tries = 0
 		while True:
-			state, code, screen = yield defer.gatherResults([
-				self.protocol.write("GP06?"),
-				self.protocol.write("GP07?"),
-				self.protocol.write("GP08?")
-			])
+			state, code, screen = yield self.protocol.write_many(["GP06?", "GP07?", "GP08?"])
 
 			if state == "1":
 				# already running
@@ -1,6 +1,6 @@
 # Twisted Imports
 from twisted.internet import reactor, defer, task
-from twisted.internet.error import TimeoutError, AlreadyCalled, AlreadyCancelled
+from twisted.internet.error import TimeoutError
 from twisted.protocols.basic import LineOnlyReceiver
 from twisted.python import failure
 from twisted.logger import Logger
@@ -10,7 +10,7 @@ from collections import deque
 import logging
 
 # Package Imports
-from ..queue import AsyncQueue, AsyncQueueRetry
+from ..queue import AsyncQueue, AsyncQueueRetry, LOW, defaultPriority
 
 
 def _IndexGenerator (max):
@@ -22,6 +22,123 @@ def _IndexGenerator (max):
 		i %= max
 
 
+def _waitFor (command):
+	# A Deferred for the reply to a coalesced command.
+	d = defer.Deferred()
+	command.waiters.append(d)
+	return d
+
+
+def _notify (result, waiters):
+	for d in waiters:
+		if isinstance(result, failure.Failure):
+			d.errback(result)
+		else:
+			d.callback(result)
+
+
+# Sent by Brainboxes serial servers (telnet option negotiation).
+_brainboxes_preamble = b'\xff\xfd\x03\xff\xfd\x00\xff\xfd,'
+
+
+class ReceiveBuffer (object):
+	"""
+	A buffer of received bytes, read from the front.
+
+	Data are appended to a bytearray and read from a cursor. The
+	bytes that have been read are only discarded (by moving the rest
+	to the front) once they are the larger part of the buffer, so that
+	each byte is copied a constant number of times however the data
+	are fragmented.
+	"""
+
+	def __init__ (self):
+		self.clear()
+
+	def clear (self):
+		self._data = bytearray()
+		self._start = 0
+		self._scanned = {}
+
+	def __len__ (self):
+		return len(self._data) - self._start
+
+	def __bytes__ (self):
+		return self.peek()
+
+	def __repr__ (self):
+		return "<ReceiveBuffer {!r}>".format(self.peek())
+
+	def append (self, data: bytes):
+		self._data += data
+
+	def find (self, sub: bytes, start = 0):
+		"""
+		Returns the index of {sub} in the buffer, or -1. Searches
+		resume from where the last search for {sub} ended, so the
+		unread data are not scanned again as more data arrive.
+		"""
+
+		begin = self._start + start
+		scanned_from, scanned_to = self._scanned.get(sub, (0, 0))
+
+		# [scanned_from, scanned_to) is known not to contain {sub}
+		if scanned_from <= begin < scanned_to:
+			i = self._data.find(sub, scanned_to)
+		else:
+			i = self._data.find(sub, begin)
+
+		if i < 0:
+			self._scanned[sub] = (begin, max(begin, len(self._data) - len(sub) + 1))
+			return -1
+
+		self._scanned[sub] = (begin, i)
+		return i - self._start
+
+	def startswith (self, prefix: bytes):
+		return self._data.startswith(prefix, self._start)
+
+	def peek (self, length = None, start = 0) -> bytes:
+		"""
+		Returns {length} bytes (or all) from index {start},
+		without removing them from the buffer.
+		"""
+
+		begin = self._start + start
+		end = len(self._data) if length is None else begin + length
+
+		with memoryview(self._data) as view:
+			return bytes(view[begin:end])
+
+	def read (self, length = None) -> bytes:
+		"""
+		Returns and removes {length} bytes (or all) from the front.
+		"""
+
+		data = self.peek(length)
+		self.consume(len(data))
+		return data
+
+	def consume (self, length):
+		"""
+		Removes {length} bytes from the front.
+		"""
+
+		self._start = min(self._start + length, len(self._data))
+
+		if self._start == len(self._data):
+			self.clear()
+		elif self._start > len(self._data) // 2:
+			del self._data[:self._start]
+
+			self._scanned = {
+				sub: (max(0, i - self._start), j - self._start)
+				for sub, (i, j) in self._scanned.items()
+				if j > self._start
+			}
+			self._start = 0
+
+
 class QueuedLineReceiver (LineOnlyReceiver):
 
 	class Command (dict):
@@ -36,17 +153,30 @@ class QueuedLineReceiver (LineOnlyReceiver):
 	max_command_length = 1000
 	log = Logger()
 
+	# The number of commands that may be sent before their replies
+	# are received. Replies are matched to commands in the order that
+	# they were sent, so only use a pipeline > 1 with devices that
+	# reply to every command, in order.
+	pipeline = 1
+
 	def __init__ (self):
 		self.connection_name = "disconnected"
 		self.machine_alias = "machine"
 
-		self.queue = AsyncQueue(self._advance, paused = True)
+		self.queue = AsyncQueue(self._advance, concurrency = self.pipeline, paused = True)
 		self.index = _IndexGenerator(2 ** 16)
 
-		self._current = None
-		self._queue_d = None
-		self._timeout = None
+		self._inflight = deque()
 		self._running = False
+		self._buffer = ReceiveBuffer()
+		self._pending = {}
+
+		# Diagnostics (see metrics())
+		self.commandsSent = 0
+		self.commandsCoalesced = 0
+		self.lastWait = 0
+		self.maxWait = 0
+		self._totalWait = 0
 
 	def connectionMade (self):
 		self.queue.resume()
@@ -54,8 +184,20 @@ class QueuedLineReceiver (LineOnlyReceiver):
 	def connectionLost (self, reason):
 		self.queue.pause()
 
-	def write (self, line, expectReply = True, wait = 0):
-		d = defer.Deferred()
+	def write (self, line, expectReply = True, wait = 0, priority = None, coalesce = None):
+		"""
+		Queue a command, returning a Deferred that fires with the
+		(processed) reply.
+
+		Commands with a higher {priority} (see octopus.queue) are sent
+		first. Commands queued by a machine's polling functions have
+		LOW priority by default, and user or sequence commands NORMAL.
+
+		If {coalesce}, a command that expects a reply and is identical
+		to one already waiting to be sent (at the same or a higher
+		priority) is not sent again: the one reply is returned to both.
+		By default LOW priority commands (polls) are coalesced.
+		"""
 
 		if len(line) > self.max_command_length:
 			raise ValueError(
@@ -68,10 +210,74 @@ class QueuedLineReceiver (LineOnlyReceiver):
 			index = next(self.index),
 			line = line,
 			expectReply = expectReply,
-			wait = float(wait),
-			d = d
+			wait = float(wait)
 		)
-		self.queue.append(command)
+
+		return self._queueCommand(command, priority, coalesce)
+
+	def write_many (self, lines, **kwargs):
+		"""
+		Queue several commands at once (e.g. to poll all of a machine's
+		properties), with the same arguments as write(). Returns a
+		Deferred that fires with the list of replies, or fails with the
+		first failure.
+
+		With a pipeline, the commands are sent without waiting for
+		each reply in turn.
+		"""
+
+		return defer.gatherResults(
+			[self.write(line, **kwargs) for line in lines],
+			consumeErrors = True
+		).addErrback(lambda f: f.value.subFailure)
+
+	@property
+	def _current (self):
+		# The command that the next reply will be for.
+		try:
+			return self._inflight[0][0]
+		except IndexError:
+			return None
+
+	def _queueCommand (self, command, priority = None, coalesce = None):
+		if priority is None:
+			priority = defaultPriority()
+
+		if coalesce is None:
+			coalesce = priority == LOW
+
+		command.priority = priority
+		command.queued = reactor.seconds()
+
+		if coalesce and command.expectReply:
+			key = tuple(
+				(k, command[k]) for k in sorted(command.keys())
+				if k not in ("index", "priority", "queued")
+			)
+			pending = self._pending.get(key)
+
+			if pending is not None and pending.priority <= priority:
+				self.commandsCoalesced += 1
+
+				self.log.debug(
+					"{log_source.machine_alias!s} [{log_source.connection_name!s}] coalesced command {command.line!r} with #{pending.index}",
+					action = 'coalesce',
+					command = command,
+					pending = pending
+				)
+
+				return _waitFor(pending)
+
+			command.key = key
+			command.waiters = []
+			command.d = defer.Deferred().addBoth(_notify, command.waiters)
+			self._pending[key] = command
+			d = _waitFor(command)
+
+		else:
+			d = command.d = defer.Deferred()
+
+		self.queue.append(command, priority)
 
 		self.log.debug(
 			"{log_source.machine_alias!s} [{log_source.connection_name!s}] queued command (#{command.index}) {command.line!r}",
@@ -82,14 +288,39 @@ class QueuedLineReceiver (LineOnlyReceiver):
 
 		return d
 
+	def metrics (self):
+		"""
+		Returns statistics of the command queue, for diagnostics.
+		Wait times are the time (in seconds) from a command being
+		queued to being sent.
+		"""
+
+		return {
+			"queueLength": len(self.queue),
+			"commandsSent": self.commandsSent,
+			"commandsCoalesced": self.commandsCoalesced,
+			"lastWait": self.lastWait,
+			"meanWait": self._totalWait / self.commandsSent if self.commandsSent else 0,
+			"maxWait": self.maxWait,
+		}
+
 	def _advance (self, command):
-		self._current = command
-		self._queue_d = defer.Deferred()
-		
+		queue_d = defer.Deferred()
+
+		if self._pending.get(command.get('key')) is command:
+			del self._pending[command.key]
+
+		wait = reactor.seconds() - command.queued
+		self.commandsSent += 1
+		self.lastWait = wait
+		self.maxWait = max(self.maxWait, wait)
+		self._totalWait += wait
+
 		self.log.debug(
 			"{log_source.machine_alias!s} [{log_source.connection_name!s}] sent command (#{command.index}) {command.line!r}",
 			action = 'send',
-			command = command
+			command = command,
+			wait_time = wait
 		)
 
 		if self.character_delay > 0:
@@ -98,18 +329,21 @@ class QueuedLineReceiver (LineOnlyReceiver):
 			self.transport.write(command.line.encode('ascii') + self.delimiter)
 
 		if command.expectReply:
-			self._timeout = reactor.callLater(
+			timeout = reactor.callLater(
 				(len(command.line) * self.character_delay) + self.timeout,
-				self._timeoutCurrent
+				self._timeoutCommand,
+				command
 			)
 
+			self._inflight.append((command, queue_d, timeout))
+
 		else:
 			# Avoid flooding the network or the device.
 			# 30ms is approximately a round-trip time.
 			reactor.callLater(command.wait, command.d.callback, None)
-			reactor.callLater(max(command.wait, 0.03), self._queue_d.callback, None)
+			reactor.callLater(max(command.wait, 0.03), queue_d.callback, None)
 
-		return self._queue_d
+		return queue_d
 
 	@defer.inlineCallbacks
 	def sendLine (self, line: bytes):
@@ -118,34 +352,47 @@ class QueuedLineReceiver (LineOnlyReceiver):
 			yield task.deferLater(reactor, self.character_delay, lambda: True)
 
 	def dataReceived (self, data: bytes):
-		self._buffer += data
+		buffer = self._buffer
+		buffer.append(data)
 
 		# something weird to do with the brainboxes?
-		if self._buffer[:9] == b'\xff\xfd\x03\xff\xfd\x00\xff\xfd,':
-			self._buffer = self._buffer[9:]
+		if buffer.startswith(_brainboxes_preamble):
+			buffer.consume(len(_brainboxes_preamble))
 
-		return LineOnlyReceiver.dataReceived(self, b"")
+		delimiter = self.delimiter
+
+		while True:
+			idx = buffer.find(delimiter)
+
+			if idx < 0:
+				break
+
+			line = buffer.read(idx)
+			buffer.consume(len(delimiter))
+
+			if self.transport.disconnecting:
+				# Disregard lines after one that closed the connection.
+				return
+
+			if len(line) > self.MAX_LENGTH:
+				return self.lineLengthExceeded(line)
+
+			self.lineReceived(line)
+
+		if len(buffer) > self.MAX_LENGTH:
+			return self.lineLengthExceeded(buffer.read())
 
 	def lineReceived (self, line: bytes):
 		if len(line) == 0:
 			return
 
-		try:
-			self._timeout.cancel()
-
-			command = self._current
-
-			self.log.debug(
-				"{log_source.machine_alias!s} [{log_source.connection_name!s}] received response (#{command.index}) {response!r}",
-				action = 'receive',
-				command = command,
-				response = line
-			)
+		if isinstance(line, bytes):
+			line = line.decode('ascii')
 
-			reactor.callLater(command.wait, command.d.callback, self.processLine(line.decode('ascii')))
-			reactor.callLater(command.wait, self._queue_d.callback, None)
+		try:
+			command, queue_d, timeout = self._inflight.popleft()
 
-		except (AttributeError, AlreadyCalled, AlreadyCancelled):
+		except IndexError:
 			# Either a late response or an unexpected Message
 			self.log.debug(
 				"{log_source.machine_alias!s} [{log_source.connection_name!s}] received unexpected response {response!r}",
@@ -153,32 +400,43 @@ class QueuedLineReceiver (LineOnlyReceiver):
 				response = line
 			)
 
-			return self.unexpectedMessage(line.decode('ascii'))
+			return self.unexpectedMessage(line)
+
+		timeout.cancel()
 
-		finally:
-			self._current = None
-			self._queue_d = None
-			self._timeout = None
+		self.log.debug(
+			"{log_source.machine_alias!s} [{log_source.connection_name!s}] received response (#{command.index}) {response!r}",
+			action = 'receive',
+			command = command,
+			response = line
+		)
+
+		reactor.callLater(command.wait, command.d.callback, self.processLine(line))
+		reactor.callLater(command.wait, queue_d.callback, None)
 
 	def processLine (self, line: str):
 		return line
 
-	def unexpectedMessage (self, line: bytes):
+	def unexpectedMessage (self, line: str):
 		pass
 
-	def _timeoutCurrent (self):
-		try:
-			self.log.error(
-				"{log_source.machine_alias!s} [{log_source.connection_name!s}] command timed out (#{command.index}) {command.line!r}",
-				action = 'timeout',
-				command = self._current
-			)
-			self._current.d.errback(TimeoutError(self._current.line))
-			self._queue_d.errback(TimeoutError(self._current.line))
+	def _timeoutCommand (self, command):
+		for item in self._inflight:
+			if item[0] is command:
+				break
+		else:
+			return
+
+		self._inflight.remove(item)
+		queue_d = item[1]
 
-		except AttributeError:
-			# There is actually no current command
-			pass
+		self.log.error(
+			"{log_source.machine_alias!s} [{log_source.connection_name!s}] command timed out (#{command.index}) {command.line!r}",
+			action = 'timeout',
+			command = command
+		)
+		command.d.errback(TimeoutError(command.line))
+		queue_d.errback(TimeoutError(command.line))
 
 
 class VaryingDelimiterQueuedLineReceiver (QueuedLineReceiver):
@@ -188,7 +446,7 @@ class VaryingDelimiterQueuedLineReceiver (QueuedLineReceiver):
 	length = None
 
 	def write (self, line, expect_reply = True, wait = 0, length = None,
-		start_delimiter = None, end_delimiter = None):
+		start_delimiter = None, end_delimiter = None, priority = None, coalesce = None):
 
 		# length can be a callable, which when passed the
 		# contents of the buffer (excluding start delim), should return either
@@ -217,7 +475,6 @@ class VaryingDelimiterQueuedLineReceiver (QueuedLineReceiver):
 				)
 			)
 
-		d = defer.Deferred()
 		command = self.Command(
 			index = next(self.index),
 			line = line,
@@ -228,12 +485,10 @@ class VaryingDelimiterQueuedLineReceiver (QueuedLineReceiver):
 			endDelimiter = end_delimiter,
 			endDelimiterLength = len(end_delimiter or ''),
 			startDelimiter = start_delimiter,
-			startDelimiterLength = len(start_delimiter or ''),
-			d = d
+			startDelimiterLength = len(start_delimiter or '')
 		)
-		self.queue.append(command)
 
-		return d
+		return self._queueCommand(command, priority, coalesce)
 
 	def dataReceived (self, data: bytes):
 		current = self._current
@@ -247,7 +502,7 @@ class VaryingDelimiterQueuedLineReceiver (QueuedLineReceiver):
 
 			self.unexpectedMessage(data)
 			return
-		
+
 		self.log.debug(
 			"{log_source.machine_alias!s} [{log_source.connection_name!s}] received data (#{command.index}) {response!r}",
 			action = 'receive',
@@ -255,124 +510,122 @@ class VaryingDelimiterQueuedLineReceiver (QueuedLineReceiver):
 			response = data
 		)
 
-		self._buffer += data
+		buffer = self._buffer
+		buffer.append(data)
+
+		# Take as many replies as possible from the buffer. Each
+		# pass either takes a reply, discards data, or waits for more.
+		while current is not None and self._frame(current, buffer):
+			current = self._current
+
+		# something weird to do with the brainboxes?
+		if buffer.startswith(_brainboxes_preamble):
+			buffer.consume(len(_brainboxes_preamble))
+
+	def _frame (self, current, buffer):
+		# Returns True if the buffer should be processed again.
 
 		# If there is a start delimiter, discard any data before the delimiter.
 		if current.startDelimiter is not None:
-			try:
-				idx = self._buffer.index(current.startDelimiter)
-				if idx > 0:
-					self.log.debug(
-						"{log_source.machine_alias!s} [{log_source.connection_name!s}] discard {discard!r} before start delimiter {command.startDelimiter!r}",
-						action = 'discard',
-						command = current,
-						discard = self._buffer[:idx],
-						buffer = self._buffer
-					)
-
-					self._buffer = self._buffer[idx:]
+			idx = buffer.find(current.startDelimiter)
+
+			if idx != 0:
+				# Keep any part of the delimiter at the end of the buffer
+				if idx < 0:
+					idx = max(0, len(buffer) - current.startDelimiterLength + 1)
 
-			except ValueError:
-				# Haven't received a start delimiter yet
 				self.log.debug(
 					"{log_source.machine_alias!s} [{log_source.connection_name!s}] discard {discard!r} before start delimiter {command.startDelimiter!r}",
 					action = 'discard',
 					command = current,
-					discard = self._buffer,
-					buffer = self._buffer
+					discard = buffer.peek(idx)
 				)
 
-				self._buffer = ''
-				return
+				buffer.consume(idx)
+
+				if len(buffer) < current.startDelimiterLength:
+					# Haven't received a start delimiter yet
+					return False
 
 		# If the length needs to be calculated, try to do so.
 		if current.length is None and current.lengthFn is not None:
 			try:
-				length = current.lengthFn(self._buffer[current.startDelimiterLength:])
-
-				if length is not None:
-					current.length = length
+				length = current.lengthFn(buffer.peek(start = current.startDelimiterLength))
 
 			except ValueError:
-				self._buffer = self._buffer[1:]
-				return self.dataReceived(b'')
+				buffer.consume(1)
+				return True
+
+			if length is None:
+				return False
+
+			current.length = length
 
 		# If a length was specified, attempt to return this many characters.
 		if current.length is not None:
 			start = current.startDelimiterLength
 			end = current.startDelimiterLength + current.length
 
-			if len(self._buffer) >= end:
-				line = self._buffer[start:end]
-
-				# Check that the end delimiter is present in the correct place
-				# if not, the start delimiter may have been located too early.
-				# Discard the first character in the buffer and start again
-				if current.endDelimiter is not None \
-				and self._buffer[end:end + current.endDelimiterLength] != current.endDelimiter:
-					self.log.debug(
-						"{log_source.machine_alias!s} [{log_source.connection_name!s}] Wrong end delimiter. Discard first char of {buffer!r}",
-						action = 'discard',
-						command = current,
-						discard = self._buffer[0],
-						buffer = self._buffer
-					)
-
-					self._buffer = self._buffer[1:]
-
-					# In this case the length would need to be calculated again
-					if current.lengthFn is not None:
-						current.length = None
-
-				# Remove the message from the buffer and return it.
-				else:
-					self.log.debug(
-						"{log_source.machine_alias!s} [{log_source.connection_name!s}] received (#{command.index}) {line!r}",
-						action = 'receive',
-						command = current,
-						response = line
-					)
-
-					self._buffer = self._buffer[end + current.endDelimiterLength:]
-					self.lineReceived(line.decode('ascii'))
-
-			elif self.debug:
+			if len(buffer) < end + current.endDelimiterLength:
 				self.log.debug(
 					"{log_source.machine_alias!s} [{log_source.connection_name!s}] waiting for length {command.length!r}",
 					action = 'waiting',
+					command = current
+				)
+
+				return False
+
+			# Check that the end delimiter is present in the correct place
+			# if not, the start delimiter may have been located too early.
+			# Discard the first character in the buffer and start again
+			if current.endDelimiter is not None \
+			and buffer.peek(current.endDelimiterLength, end) != current.endDelimiter:
+				self.log.debug(
+					"{log_source.machine_alias!s} [{log_source.connection_name!s}] Wrong end delimiter. Discard first char",
+					action = 'discard',
 					command = current,
-					buffer = self._buffer
+					discard = buffer.peek(1)
 				)
 
+				buffer.consume(1)
+
+				# In this case the length would need to be calculated again
+				if current.lengthFn is not None:
+					current.length = None
+
+				return True
+
+			# Remove the message from the buffer and return it.
+			line = buffer.peek(current.length, start)
+			buffer.consume(end + current.endDelimiterLength)
 
 		# If no length was specified, look for the end delimiter
 		elif current.endDelimiter is not None \
 		and current.lengthFn is None:
-			try:
-				# Select data up to the end delimiter
-				idx = self._buffer.index(current.endDelimiter)
+			# Select data up to the end delimiter
+			idx = buffer.find(current.endDelimiter, current.startDelimiterLength)
 
-			except ValueError:
+			if idx < 0:
 				# Haven't received an end delimiter yet
 				self.log.debug(
 					"{log_source.machine_alias!s} [{log_source.connection_name!s}] waiting for end delimiter {command.endDelimiter!r}",
-					command = current,
-					buffer = self._buffer
+					command = current
 				)
-				
-				return
 
-			line = self._buffer[current.startDelimiterLength:idx]
-			self._buffer = self._buffer[idx + current.endDelimiterLength:]
+				return False
 
-			self.log.debug(
-				"{log_source.machine_alias!s} [{log_source.connection_name!s}] received (#{command.index}) {line!r}",
-				command = current,
-				response = line
-			)
+			line = buffer.peek(idx - current.startDelimiterLength, current.startDelimiterLength)
+			buffer.consume(idx + current.endDelimiterLength)
 
-			self.lineReceived(line.decode('ascii'))
+		else:
+			return False
 
-		# something weird to do with the brainboxes?
-		if self._buffer[:9] == b'\xff\xfd\x03\xff\xfd\x00\xff\xfd,':
-			self._buffer = self._buffer[9:]
+		self.log.debug(
+			"{log_source.machine_alias!s} [{log_source.connection_name!s}] received (#{command.index}) {line!r}",
+			action = 'receive',
+			command = current,
+			line = line
+		)
+
+		self.lineReceived(line)
+		return True
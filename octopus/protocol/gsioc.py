@@ -10,6 +10,9 @@ from time import time as now
 from math import floor
 import logging
 
+# NumPy
+import numpy as np
+
 # Package Imports
 from ..machine import Stream
 from ..transport.gsioc import Slave
@@ -458,16 +461,21 @@ class FIFOStream (Stream):
 			raise
 
 		count = len(values)
+
+		if count == 0:
+			return
+
 		expected_timespan = (now() - current_time - (round_trip_time / 2))
 
 		if not -1 < (expected_timespan / sample_interval) - count < 2:
 			sample_interval = (0.75 * (expected_timespan / count)) + (0.25 * self.sample_interval)
 
-		for value in values:
-			current_time += sample_interval
-			self._push(_20b_to_float(value) * factor, current_time)
+		self.push_many(
+			current_time + sample_interval * np.arange(1, count + 1),
+			_20b_to_float(values) * factor
+		)
 
-		self._current_20b_value = values[-1]
+		self._current_20b_value = int(values[-1])
 
 	def reset (self, protocol, sample_interval):
 		# Convert sample interval in s to sample rate in 0.01 Hz
@@ -586,7 +594,7 @@ class FIFOStream (Stream):
 #
 
 def _20b_to_float (value):
-	# value is a 20-bit floating-point number
+	# value is a 20-bit floating-point number (or an array of them)
 
 	# Most significant 4 bits are a binary exponent from 6 to -7
 	exponent = value >> 16
@@ -597,6 +605,9 @@ def _20b_to_float (value):
 	m_2c = mantissa - ((mantissa >> 15) << 16)
 	e_2c = exponent - ((exponent >> 3) << 4)
 
+	if isinstance(value, np.ndarray):
+		return np.ldexp(m_2c.astype(np.float64), e_2c)
+
 	return m_2c * (2 ** e_2c)
 
 
@@ -612,58 +623,107 @@ def _float_to_20b (value):
 	raise NotImplemented
 
 
-def _add (value, diff):
-	# Add / subtract a small difference (< 25 in the decompression algorithm)
-	# maintaining 2's complement in the lower 16 bits.
+def _decode_tables ():
+	# For each code: the number of values it gives, and the change
+	# from the prior value for each of them (see above).
+	counts = np.zeros(256, dtype = np.int64)
+	deltas = np.zeros((256, 3), dtype = np.int64)
 
-	# See _20b_to_float
-	exponent = value >> 16
-	mantissa = value - (exponent << 16)
+	for code in range(36, 52):
+		counts[code] = code - 35
+
+	for code in range(52, 79):
+		counts[code] = 3
+		deltas[code] = (
+			((code - 52) // 9) - 1,
+			(((code - 52) // 3) % 3) - 1,
+			((code - 52) % 3) - 1
+		)
+
+	for code in range(79, 116):
+		counts[code] = 1
+		deltas[code, 0] = code - 97
+
+	# Absolute values
+	counts[116:120] = 1
 
-	new_value = mantissa + diff
-	if new_value < 0:
-		new_value += 65536
+	return counts, deltas
 
-	return new_value + (exponent << 16)
+_counts, _deltas = _decode_tables()
 
 
 def _decompress (compressed_data, current_value = None):
-	chars = iterstr(compressed_data)
-	values = []
-
-	try:
-		while 1:
-			code = ord(next(chars))
-
-			if 35 < code < 52:
-				values.extend([current_value] * (code - 35))
-			elif 51 < code < 79:
-				value_1 = _add(current_value, ((code - 52) / 9) - 1)
-				value_2 = _add(value_1, (((code - 52) / 3) % 3) - 1)
-				current_value = _add(value_2, ((code - 52) % 3) - 1)
-				values.extend((value_1, value_2, current_value))
-			elif 78 < code < 116:
-				current_value = _add(current_value, code - 97)
-				values.append(current_value)
-			elif 115 < code < 120:
-				code3 = ord(next(chars))
-				code2 = ord(next(chars))
-				code4 = ord(next(chars))
-				current_value = \
-					((code - 116) * 262114) + \
-					((code2 - 36) * 4096) + \
-					((code3 - 36) * 64) + \
-					((code4 - 36))
-				values.append(current_value)
-			elif code == 124:
-				return
-
-	except TypeError:
-		# Called with current_value = None without first having been zeroed.
-		raise
-
-	except StopIteration:
-		return values
+	"""
+	Decode a compressed 506C data stream into an array of 20-bit
+	values (see above). {current_value} is the last value of the
+	previous stream, needed if this one does not start with an
+	absolute value.
+
+	The whole stream is decoded with array operations: the number of
+	values given by each code and their changes come from lookup
+	tables, and each value is the most recent absolute value plus the
+	cumulative sum of the changes since it.
+	"""
+
+	codes = np.frombuffer(compressed_data.encode('latin-1'), dtype = np.uint8)
+
+	# An absolute value code is followed by three data bytes.
+	absolute = (codes >= 116) & (codes < 120)
+	data_bytes = np.zeros(len(codes) + 3, dtype = bool)
+
+	for i in (1, 2, 3):
+		data_bytes[i:i + len(codes)] |= absolute
+
+	ops = np.flatnonzero(~data_bytes[:len(codes)])
+
+	# "No value available": nothing follows.
+	end = np.flatnonzero(codes[ops] == 124)
+	if len(end):
+		ops = ops[:end[0]]
+
+	# Ignore an absolute value that is cut short.
+	ops = ops[~absolute[ops] | (ops + 3 < len(codes))]
+	op_codes = codes[ops]
+
+	# Expand each code into its values.
+	counts = _counts[op_codes]
+	total = int(counts.sum())
+
+	if total == 0:
+		return np.zeros(0, dtype = np.int64)
+
+	op_of = np.repeat(np.arange(len(ops)), counts)
+	k = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+	changes = _deltas[op_codes[op_of], np.minimum(k, 2)]
+
+	# Absolute values start a new segment.
+	is_absolute = absolute[ops[op_of]]
+	abs_ops = ops[op_of[is_absolute]]
+	abs_values = \
+		((codes[abs_ops].astype(np.int64) - 116) << 18) + \
+		((codes[abs_ops + 1].astype(np.int64) - 36) << 12) + \
+		((codes[abs_ops + 2].astype(np.int64) - 36) << 6) + \
+		(codes[abs_ops + 3].astype(np.int64) - 36)
+
+	segment = np.cumsum(is_absolute)
+
+	if segment[0] == 0:
+		if current_value is None:
+			# Called with current_value = None without first having been zeroed.
+			raise TypeError("No current value")
+
+		abs_values = np.concatenate(([current_value], abs_values))
+	else:
+		segment -= 1
+
+	# Changes are to the 16-bit 2's complement mantissa only.
+	base = abs_values[segment]
+	cumulative = np.cumsum(changes)
+	start = np.flatnonzero(np.diff(segment, prepend = -1))
+	offset = cumulative[start] - changes[start]
+	since = cumulative - np.repeat(offset, np.diff(np.append(start, total)))
+
+	return (base & ~0xFFFF) | ((base + since) & 0xFFFF)
 
 
 def _encode_single (twenty_bit_number):
@@ -0,0 +1,90 @@
+"""
+Benchmarks for the framing of received data by QueuedLineReceiver
+and VaryingDelimiterQueuedLineReceiver: randomised replies, with
+noise, fed in random fragments.
+
+Run with: python -m octopus.protocol.test.bench_basic
+"""
+
+# System Imports
+import random
+import time
+
+# Twisted Imports
+from twisted.internet.testing import StringTransport
+
+# Package Imports
+from .. import basic
+from .test_basic import _fragments
+
+
+class _Protocol (basic.VaryingDelimiterQueuedLineReceiver):
+	start_delimiter = b"<"
+	end_delimiter = b">\r"
+
+
+def _report (name, size, seconds):
+	print("{:<48s} {:>10,.1f} MB/s".format(name, size / seconds / 1e6))
+
+
+def _replies (rng, n, length = 20):
+	chars = b"0123456789ABCDEF"
+	return [bytes(rng.choice(chars) for i in range(length)) for j in range(n)]
+
+
+def _bench (name, protocol, stream, replies, rng):
+	# Replies are matched to the current command, which is set
+	# directly to leave out the command queue.
+	protocol.makeConnection(StringTransport())
+	protocol.lineReceived = lambda line: None
+
+	start = getattr(protocol, "start_delimiter", None)
+	end = getattr(protocol, "end_delimiter", None)
+
+	command = protocol.Command(
+		index = 0, line = "Q", expectReply = True, wait = 0,
+		length = None, lengthFn = None,
+		startDelimiter = start, startDelimiterLength = len(start or b""),
+		endDelimiter = end, endDelimiterLength = len(end or b"")
+	)
+	protocol._inflight.append((command, None, None))
+
+	fragments = list(_fragments(stream, rng))
+
+	t = time.perf_counter()
+
+	for fragment in fragments:
+		protocol.dataReceived(fragment)
+
+	_report(name, len(stream), time.perf_counter() - t)
+
+
+def bench_lines (n = 20000):
+	rng = random.Random(0)
+	replies = _replies(rng, n)
+	stream = b"".join(r + b"\r\n" for r in replies)
+
+	_bench("lines", basic.QueuedLineReceiver(), stream, replies, rng)
+
+
+def bench_delimited (n = 20000, noise = 0):
+	rng = random.Random(0)
+	replies = _replies(rng, n)
+	stream = b"".join(bytes(rng.choice(b"xyz") for i in range(noise)) + b"<" + r + b">\r" for r in replies)
+
+	_bench("start / end delimiters, {:d} bytes noise".format(noise), _Protocol(), stream, replies, rng)
+
+
+def bench_noise (size = 1000000):
+	# A chatty instrument: no start delimiter at all.
+	rng = random.Random(0)
+	stream = bytes(rng.choice(b"xyz") for i in range(size))
+
+	_bench("noise only", _Protocol(), stream, [], rng)
+
+
+if __name__ == "__main__":
+	bench_lines()
+	bench_delimited()
+	bench_delimited(noise = 100)
+	bench_noise()
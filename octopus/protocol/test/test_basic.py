@@ -0,0 +1,340 @@
+from twisted.internet import task
+from twisted.internet.error import TimeoutError
+from twisted.internet.testing import StringTransport
+from twisted.trial import unittest
+
+from unittest.mock import patch
+
+from collections import deque
+import gc
+import random
+
+from .. import basic
+from ... import queue
+
+
+class _ProtocolMixin (object):
+	pipeline = 1
+
+	def setUp (self):
+		self.clock = task.Clock()
+
+		for module in (basic, queue):
+			patcher = patch.object(module, "reactor", self.clock)
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+		self.protocol = type("Protocol", (basic.QueuedLineReceiver, ), {
+			"pipeline": self.pipeline
+		})()
+		self.transport = StringTransport()
+		self.protocol.makeConnection(self.transport)
+
+	def _flush (self):
+		self.clock.advance(0)
+
+	def _sent (self):
+		lines = self.transport.value().split(self.protocol.delimiter)[:-1]
+		self.transport.clear()
+		return [line.decode('ascii') for line in lines]
+
+	def _reply (self, line):
+		self.protocol.dataReceived(line.encode('ascii') + self.protocol.delimiter)
+		self._flush()
+
+
+class QueuedLineReceiverTestCase (_ProtocolMixin, unittest.TestCase):
+	def test_write (self):
+		d = self.protocol.write("A?")
+		self._flush()
+		self.assertEqual(self._sent(), ["A?"])
+
+		self._reply("1")
+		self.assertEqual(self.successResultOf(d), "1")
+
+	def test_priority (self):
+		self.protocol.write("X")
+		self._flush()
+		self._sent()
+
+		polls = [self.protocol.write(line, priority = queue.LOW) for line in ("S?", "F?")]
+		setpoint = self.protocol.write("F10")
+
+		self._reply("done")
+		self.assertEqual(self._sent(), ["F10"])
+		self._reply("OK")
+		self.assertEqual(self._sent(), ["S?"])
+		self._reply("0")
+		self.assertEqual(self._sent(), ["F?"])
+		self._reply("10")
+
+		self.assertEqual(self.successResultOf(setpoint), "OK")
+		self.assertEqual([self.successResultOf(d) for d in polls], ["0", "10"])
+
+	def test_coalesce (self):
+		self.protocol.write("X")
+		self._flush()
+		self._sent()
+
+		polls = [self.protocol.write("S?", priority = queue.LOW) for i in range(3)]
+		other = self.protocol.write("F?", priority = queue.LOW)
+		self.assertEqual(len(self.protocol.queue), 2)
+
+		self._reply("done")
+		self.assertEqual(self._sent(), ["S?"])
+		self._reply("5")
+
+		self.assertEqual([self.successResultOf(d) for d in polls], ["5", "5", "5"])
+		self.assertNoResult(other)
+		self.assertEqual(self.protocol.metrics()["commandsCoalesced"], 2)
+
+		# Once sent, a new poll is queued again
+		self.protocol.write("S?", priority = queue.LOW)
+		self.assertEqual(len(self.protocol.queue), 1)
+
+	def test_coalesce_timeout (self):
+		polls = [self.protocol.write("S?", priority = queue.LOW) for i in range(2)]
+		self._flush()
+		self.clock.advance(self.protocol.timeout)
+
+		for d in polls:
+			self.failureResultOf(d, TimeoutError)
+
+		# The queue's own Deferred for the command is not handled
+		gc.collect()
+		self.flushLoggedErrors(TimeoutError)
+
+	def test_not_coalesced (self):
+		self.protocol.write("X")
+		self._flush()
+
+		# Only polls are coalesced by default
+		self.protocol.write("F10")
+		self.protocol.write("F10")
+		self.assertEqual(len(self.protocol.queue), 2)
+
+	def test_wait_time (self):
+		self.protocol.write("A?")
+		self.protocol.write("B?")
+		self._flush()
+
+		self.clock.advance(0.5)
+		self._reply("1")
+
+		metrics = self.protocol.metrics()
+		self.assertEqual(metrics["commandsSent"], 2)
+		self.assertEqual(metrics["lastWait"], 0.5)
+		self.assertEqual(metrics["maxWait"], 0.5)
+		self.assertEqual(metrics["meanWait"], 0.25)
+
+
+class PipelineTestCase (_ProtocolMixin, unittest.TestCase):
+	pipeline = 3
+
+	def test_pipeline (self):
+		ds = [self.protocol.write(line) for line in ("A?", "B?", "C?", "D?")]
+		self._flush()
+
+		# Up to {pipeline} commands are sent before a reply
+		self.assertEqual(self._sent(), ["A?", "B?", "C?"])
+
+		self._reply("1")
+		self._flush()
+		self.assertEqual(self._sent(), ["D?"])
+
+		for reply in ("2", "3", "4"):
+			self._reply(reply)
+
+		self.assertEqual([self.successResultOf(d) for d in ds], ["1", "2", "3", "4"])
+		self.assertIsNone(self.protocol._current)
+
+	def test_write_many (self):
+		d = self.protocol.write_many(["A?", "B?"])
+		self._flush()
+		self.assertEqual(self._sent(), ["A?", "B?"])
+
+		self.protocol.dataReceived(b"1\r\n2\r\n")
+		self._flush()
+		self.assertEqual(self.successResultOf(d), ["1", "2"])
+
+	def test_write_many_timeout (self):
+		d = self.protocol.write_many(["A?", "B?"])
+		self._flush()
+		self._reply("1")
+		self.clock.advance(self.protocol.timeout)
+
+		self.failureResultOf(d, TimeoutError)
+
+		gc.collect()
+		self.flushLoggedErrors(TimeoutError)
+
+	def test_timeout (self):
+		a = self.protocol.write("A?")
+		b = self.protocol.write("B?")
+		self._flush()
+
+		self.clock.advance(self.protocol.timeout)
+		self.failureResultOf(a, TimeoutError)
+		self.failureResultOf(b, TimeoutError)
+
+		# A late reply is unexpected
+		self._reply("1")
+		self.assertEqual(self.protocol._inflight, deque())
+
+		gc.collect()
+		self.flushLoggedErrors(TimeoutError)
+
+
+class ReceiveBufferTestCase (unittest.TestCase):
+	def setUp (self):
+		self.buffer = basic.ReceiveBuffer()
+
+	def test_read (self):
+		self.buffer.append(b"hello ")
+		self.buffer.append(b"world")
+
+		self.assertEqual(len(self.buffer), 11)
+		self.assertEqual(self.buffer.peek(5), b"hello")
+		self.assertEqual(self.buffer.read(6), b"hello ")
+		self.assertEqual(self.buffer.peek(2, 1), b"or")
+		self.assertTrue(self.buffer.startswith(b"wor"))
+		self.assertEqual(bytes(self.buffer), b"world")
+		self.assertEqual(self.buffer.read(), b"world")
+		self.assertEqual(len(self.buffer), 0)
+
+	def test_find (self):
+		self.buffer.append(b"abc")
+		self.assertEqual(self.buffer.find(b"\r\n"), -1)
+
+		self.buffer.append(b"\r")
+		self.assertEqual(self.buffer.find(b"\r\n"), -1)
+
+		self.buffer.append(b"\nde\r\n")
+		self.assertEqual(self.buffer.find(b"\r\n"), 3)
+		self.assertEqual(self.buffer.find(b"\r\n", 4), 7)
+
+		self.buffer.consume(5)
+		self.assertEqual(self.buffer.find(b"\r\n"), 2)
+
+	def test_compact (self):
+		data = b"".join(b"%03d" % i for i in range(100))
+
+		for i in range(100):
+			self.buffer.append(data[i * 3:i * 3 + 3])
+			self.assertEqual(self.buffer.find(b"x"), -1)
+			self.assertEqual(self.buffer.read(2), data[i * 2:i * 2 + 2])
+
+		# The data that have been read are discarded
+		self.assertEqual(bytes(self.buffer), data[200:])
+		self.assertLess(len(self.buffer._data), 2 * len(self.buffer) + 3)
+
+		self.buffer.append(b"x")
+		self.assertEqual(self.buffer.find(b"x"), 100)
+
+
+def _fragments (data, rng):
+	# Split {data} into randomly sized pieces, including single bytes.
+	i = 0
+
+	while i < len(data):
+		n = rng.choice((1, 1, 2, 3, rng.randint(1, 64)))
+		yield data[i:i + n]
+		i += n
+
+
+class _DelimitedProtocol (basic.VaryingDelimiterQueuedLineReceiver):
+	start_delimiter = b"<"
+	end_delimiter = b">\r"
+
+
+class FramingFuzzTestCase (_ProtocolMixin, unittest.TestCase):
+	"""
+	Feeds randomised, fragmented streams of replies (with noise
+	where the framing allows it) through the framers.
+	"""
+
+	# All commands are sent before the replies arrive.
+	pipeline = 100
+	seeds = range(20)
+
+	def _replies (self, rng, n):
+		chars = b"0123456789ABCDEFabcdef?:. "
+		return [bytes(rng.choice(chars) for i in range(rng.randint(0, 20))) for j in range(n)]
+
+	def _feed (self, protocol, replies, stream, rng, **kwargs):
+		protocol.makeConnection(StringTransport())
+		ds = [protocol.write("Q", **kwargs) for reply in replies]
+		self._flush()
+
+		for fragment in _fragments(stream, rng):
+			protocol.dataReceived(fragment)
+
+		self._flush()
+		return [self.successResultOf(d) for d in ds]
+
+	def _protocol (self, cls):
+		return type("Protocol", (cls, ), { "pipeline": self.pipeline })()
+
+	def test_lines (self):
+		for seed in self.seeds:
+			rng = random.Random(seed)
+			replies = [r for r in self._replies(rng, 50) if r]
+			stream = b"".join(r + b"\r\n" for r in replies)
+
+			protocol = self._protocol(basic.QueuedLineReceiver)
+			self.assertEqual(
+				self._feed(protocol, replies, stream, rng),
+				[r.decode('ascii') for r in replies]
+			)
+
+	def test_end_delimiter (self):
+		for seed in self.seeds:
+			rng = random.Random(seed)
+			replies = [r for r in self._replies(rng, 50) if r]
+
+			# Noise before each start delimiter is discarded
+			stream = b"".join(
+				bytes(rng.choice(b"xyz>\r") for i in range(rng.randint(0, 5))) + b"<" + r + b">\r"
+				for r in replies
+			)
+
+			protocol = self._protocol(_DelimitedProtocol)
+			self.assertEqual(
+				self._feed(protocol, replies, stream, rng),
+				[r.decode('ascii') for r in replies]
+			)
+
+	def test_length (self):
+		for seed in self.seeds:
+			rng = random.Random(seed)
+			replies = [r.ljust(8, b".")[:8] for r in self._replies(rng, 50)]
+			stream = b"".join(b"<z<" + r + b">\r" for r in replies)
+
+			protocol = self._protocol(_DelimitedProtocol)
+			self.assertEqual(
+				self._feed(protocol, replies, stream, rng, length = 8),
+				[r.decode('ascii') for r in replies]
+			)
+
+	def test_length_function (self):
+		# The length is given by a prefix. A "<" in the noise is found
+		# as a start delimiter; an invalid length means it is discarded.
+		def length (buffer):
+			if len(buffer) < 2:
+				return None
+
+			if not buffer[:2].isdigit():
+				raise ValueError
+
+			return int(buffer[:2]) + 2
+
+		for seed in self.seeds:
+			rng = random.Random(seed)
+			replies = [b"%02d" % len(r) + r for r in self._replies(rng, 50)]
+			stream = b"".join(b"<x" + b"<" + r + b">\r" for r in replies)
+
+			protocol = self._protocol(_DelimitedProtocol)
+			self.assertEqual(
+				self._feed(protocol, replies, stream, rng, length = length),
+				[r.decode('ascii') for r in replies]
+			)
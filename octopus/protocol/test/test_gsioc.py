@@ -0,0 +1,82 @@
+from twisted.trial import unittest
+
+from unittest.mock import Mock, patch
+
+import numpy as np
+
+from .. import gsioc
+
+
+class DecompressTestCase (unittest.TestCase):
+	def test_absolute (self):
+		for value in (0, 1, 64, 4096, 262143, 262144, 2 ** 20 - 1):
+			result = gsioc._decompress(gsioc._encode_single(value))
+			self.assertEqual(result.tolist(), [value])
+
+	def test_changes (self):
+		start = gsioc._encode_single(1000)
+
+		# Repeats
+		self.assertEqual(gsioc._decompress(start + chr(38)).tolist(), [1000] * 4)
+
+		# Three changes of -1, 0 or +1
+		self.assertEqual(gsioc._decompress(start + chr(52)).tolist(), [1000, 999, 998, 997])
+		self.assertEqual(gsioc._decompress(start + chr(78)).tolist(), [1000, 1001, 1002, 1003])
+		self.assertEqual(gsioc._decompress(start + chr(61)).tolist(), [1000, 1000, 999, 998])
+
+		# Single change
+		self.assertEqual(gsioc._decompress(start + chr(79) + chr(115)).tolist(), [1000, 982, 1000])
+
+		# Continued from a previous stream
+		self.assertEqual(gsioc._decompress(chr(98) + chr(37), 1000).tolist(), [1001, 1001, 1001])
+
+		# Absolute values restart the sequence
+		self.assertEqual(
+			gsioc._decompress(chr(100) + gsioc._encode_single(5) + chr(96), 1000).tolist(),
+			[1003, 5, 4]
+		)
+
+		# No value available
+		self.assertEqual(gsioc._decompress("|").tolist(), [])
+		self.assertEqual(gsioc._decompress(chr(98) + "|" + chr(98), 1000).tolist(), [1001])
+
+	def test_wrap (self):
+		# Changes wrap within the 16-bit mantissa, keeping the exponent.
+		value = (3 << 16) + 0xFFFF
+		self.assertEqual(gsioc._decompress(chr(98), value).tolist(), [3 << 16])
+		self.assertEqual(gsioc._decompress(chr(96), 3 << 16).tolist(), [value])
+
+	def test_no_current_value (self):
+		self.assertRaises(TypeError, gsioc._decompress, chr(98))
+
+	def test_to_float (self):
+		values = np.array([0, 1, 0xFFFF, (1 << 16) + 3, (0xF << 16) + 8])
+		self.assertEqual(
+			gsioc._20b_to_float(values).tolist(),
+			[gsioc._20b_to_float(int(v)) for v in values]
+		)
+
+
+class FIFOStreamTestCase (unittest.TestCase):
+	def setUp (self):
+		self.stream = gsioc.FIFOStream(1, "Stream", float, factor = 2)
+		self.stream.time_zero = 100.
+		self.stream.sample_interval = 0.5
+		self.stream._current_20b_value = None
+
+	@patch.object(gsioc, "now", return_value = 101.5)
+	def test_update (self, now):
+		changed = Mock()
+		self.stream.on("change", changed)
+
+		self.stream._update(gsioc._encode_single(10) + chr(98) + chr(36), 0)
+
+		self.assertEqual(self.stream._x.tolist(), [100.5, 101, 101.5])
+		self.assertEqual(self.stream._y.tolist(), [20., 22., 22.])
+		self.assertEqual(self.stream._current_20b_value, 11)
+
+		# One event for the block
+		changed.assert_called_once()
+		event = changed.call_args[0][0]
+		self.assertEqual((event["time"], event["value"]), (101.5, 22.))
+		self.assertEqual(event["values"].tolist(), [20., 22., 22.])
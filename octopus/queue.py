@@ -3,12 +3,47 @@ from twisted.internet import reactor, defer
 
 # System Imports
 from collections import deque
+import contextvars
 import functools
 
 # Sibling Imports
 from .events import Event
 
 
+# Priority classes of queued tasks. Tasks are taken from the
+# highest priority class first, and in order within a class.
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+_priorities = (HIGH, NORMAL, LOW)
+_defaultPriority = contextvars.ContextVar("defaultPriority", default = NORMAL)
+
+
+def defaultPriority ():
+	"""
+	The priority of tasks appended without a priority: LOW while
+	running a function wrapped by background(), otherwise NORMAL.
+	"""
+
+	return _defaultPriority.get()
+
+
+def background (fn):
+	"""
+	Returns a function that runs {fn} (e.g. a machine's polling
+	function) such that tasks it queues have LOW priority by default.
+	"""
+
+	@functools.wraps(fn)
+	def run (*args, **kwargs):
+		context = contextvars.copy_context()
+		context.run(_defaultPriority.set, LOW)
+		return context.run(fn, *args, **kwargs)
+
+	return run
+
+
 class AsyncQueue (object):
 	@property
 	def running (self):
@@ -19,7 +54,7 @@ class AsyncQueue (object):
 		return self._current
 
 	def __init__ (self, worker, concurrency = 1, paused = False):
-		self._tasks = deque()
+		self._tasks = tuple(deque() for p in _priorities)
 		self._worker = worker
 		self._workers = 0
 		self._concurrency = concurrency
@@ -35,51 +70,68 @@ class AsyncQueue (object):
 		self._paused -= 1
 		self._process()
 
-	def append (self, data):
+	def append (self, data, priority = None):
+		if priority is None:
+			priority = defaultPriority()
+
 		task = _AsyncQueueTask(data)
-		self._tasks.append(task)
+		self._tasks[priority].append(task)
 		reactor.callLater(0, self._process)
 		return task.d
 
-	def appendleft (self, data):
+	def appendleft (self, data, priority = None):
+		if priority is None:
+			priority = defaultPriority()
+
 		task = _AsyncQueueTask(data)
-		self._tasks.appendleft(task)
+		self._tasks[priority].appendleft(task)
 		reactor.callLater(0, self._process)
 		return task.d
 
-	def _process (self):
-		if not self._paused and self._workers < self._concurrency:
-			def run (task):
-				worker_d = defer.maybeDeferred(self._worker, task.data)
-				worker_d.addCallbacks(success, error)
-
-			def success (result):
-				task.d.callback(result)
-				next()
+	def _next (self):
+		for tasks in self._tasks:
+			if tasks:
+				return tasks.popleft()
 
-			def error (reason):
-				if reason.type is AsyncQueueRetry:
-					run(task)
-				else:
-					task.d.errback(reason)
-					next()
-
-			def next ():
-				self._workers -= 1
-				self._current.discard(task)
-				reactor.callLater(0, self._process)
+		raise IndexError
 
+	def _process (self):
+		while not self._paused and self._workers < self._concurrency:
 			try:
-				task = self._tasks.popleft()
+				task = self._next()
 			except IndexError:
 				self.drained()
+				break
 			else:
-				self._workers += 1
-				self._current.add(task)
+				self._run(task)
+
+	def _run (self, task):
+		def run (task):
+			worker_d = defer.maybeDeferred(self._worker, task.data)
+			worker_d.addCallbacks(success, error)
+
+		def success (result):
+			task.d.callback(result)
+			next()
+
+		def error (reason):
+			if reason.type is AsyncQueueRetry:
 				run(task)
+			else:
+				task.d.errback(reason)
+				next()
+
+		def next ():
+			self._workers -= 1
+			self._current.discard(task)
+			reactor.callLater(0, self._process)
+
+		self._workers += 1
+		self._current.add(task)
+		run(task)
 
 	def __len__ (self):
-		return len(self._tasks)
+		return sum(len(tasks) for tasks in self._tasks)
 
 
 class AsyncQueueRetry (Exception):
@@ -418,5 +418,26 @@ class Variable (data_Variable):
 
 			data_Variable._push(self, value, time)
 
-	def get (self, start, interval = None, step = 1):
-		return self._archive.get(start, interval)
+	def push_many (self, times, values):
+		# As _push: ignore repeat values, and make step changes.
+		step_times = []
+		step_values = []
+		previous = self.value
+
+		for time, value in zip(times, values):
+			if type(value) != self.type:
+				value = self.type(value)
+
+			if value != previous:
+				if previous is not None:
+					step_times.append(time)
+					step_values.append(previous)
+
+				step_times.append(time)
+				step_values.append(value)
+				previous = value
+
+		data_Variable.push_many(self, step_times, step_values)
+
+	def get (self, start, interval = None, step = 1, max_points = None):
+		return self._archive.get(start, interval, max_points)
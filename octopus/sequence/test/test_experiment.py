@@ -0,0 +1,37 @@
+from twisted.trial import unittest
+
+import random
+
+from .. import experiment
+
+
+class VariableTestCase (unittest.TestCase):
+	def test_push_many (self):
+		# push_many stores the same steps as _push for each sample
+		rng = random.Random(0)
+
+		for trial in range(100):
+			type = rng.choice([int, float, str])
+			v = experiment.Variable("v", type)
+			w = experiment.Variable("w", type)
+			v._archive._zero = w._archive._zero = 0
+
+			t = 0.
+			for block in range(rng.randint(1, 5)):
+				times = []
+				values = []
+
+				for i in range(rng.randint(0, 8)):
+					t += rng.choice([0, 1, 2])
+					times.append(t)
+					values.append(rng.choice([1, 2, "3"]))
+
+				for time, value in zip(times, values):
+					v._push(value, time)
+
+				w.push_many(times, values)
+
+			self.assertEqual(w.get(0, t), v.get(0, t))
+			self.assertEqual(w._archive._x, v._archive._x)
+			self.assertEqual(w._archive._y, v._archive._y)
+			self.assertEqual(w.value, v.value)
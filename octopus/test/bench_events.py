@@ -0,0 +1,56 @@
+"""
+Micro-benchmarks for octopus.events.
+
+Run with: python -m octopus.test.bench_events
+"""
+
+# System Imports
+import timeit
+
+# Package Imports
+from ..events import EventEmitter
+
+
+def _report (name, number, seconds):
+	print("{:<40s} {:>12,.0f} emits/s".format(name, number / seconds))
+
+
+class _Handler (object):
+	def __call__ (self, data):
+		pass
+
+	def method (self, data):
+		pass
+
+
+def bench_emit (handlers, number = 200000, all = False, weak = False):
+	emitter = EventEmitter()
+	objects = [_Handler() for i in range(handlers)]
+
+	# A handler for another event, so that the emitter is set up
+	emitter.on("other", lambda data: None)
+
+	for h in objects:
+		emitter.on("change", h.method, weak = weak)
+
+	if all:
+		emitter.on("all", lambda event, data: None)
+
+	def emit ():
+		emitter.emit("change", value = 1, time = 0)
+
+	name = "emit ({:d} handler{:s}{:s}{:s})".format(
+		handlers,
+		"" if handlers == 1 else "s",
+		", weak" if weak else "",
+		", + all" if all else ""
+	)
+	_report(name, number, min(timeit.repeat(emit, number = number, repeat = 5)))
+
+
+if __name__ == "__main__":
+	for handlers in (0, 1, 10):
+		bench_emit(handlers)
+
+	bench_emit(1, all = True)
+	bench_emit(10, weak = True)
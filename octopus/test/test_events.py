@@ -0,0 +1,112 @@
+from twisted.trial import unittest
+
+from unittest.mock import Mock
+
+import gc
+
+from ..events import EventEmitter
+
+
+class _Handler (object):
+	def __init__ (self):
+		self.calls = []
+
+	def method (self, data):
+		self.calls.append(data)
+
+
+class EventEmitterTestCase (unittest.TestCase):
+	def setUp (self):
+		self.emitter = EventEmitter()
+
+	def test_emit (self):
+		self.assertFalse(self.emitter.emit("change", value = 1))
+
+		handler = Mock()
+		self.emitter.on("change", handler)
+		self.emitter.on("change", handler)
+
+		self.assertTrue(self.emitter.emit("change", value = 1))
+		handler.assert_called_once_with({ "value": 1 })
+
+		self.assertFalse(self.emitter.emit("other"))
+
+	def test_all (self):
+		handler = Mock()
+		self.emitter.on("all", handler)
+
+		self.assertTrue(self.emitter.emit("change", value = 1))
+		handler.assert_called_once_with("change", { "value": 1 })
+
+	def test_off (self):
+		handler = _Handler()
+		self.emitter.on("change", handler.method)
+		self.emitter.off("change", handler.method)
+
+		self.emitter.emit("change", value = 1)
+		self.assertEqual(handler.calls, [])
+		self.assertEqual(self.emitter.listeners("change"), [])
+
+		self.assertRaises(KeyError, self.emitter.off, "other", handler.method)
+
+		self.emitter.on("change", Mock())
+		self.assertRaises(ValueError, self.emitter.off, "change", handler.method)
+
+	def test_once (self):
+		handler = Mock()
+		self.emitter.once("change", handler)
+
+		self.emitter.emit("change", value = 1)
+		self.emitter.emit("change", value = 2)
+		handler.assert_called_once_with({ "value": 1 })
+
+	def test_change_during_emit (self):
+		calls = []
+		second = lambda data: calls.append("second")
+
+		def first (data):
+			calls.append("first")
+			self.emitter.off("change", first)
+			self.emitter.on("change", second)
+
+		self.emitter.on("change", first)
+
+		# Handlers added or removed during an emit take effect
+		# from the next emit.
+		self.emitter.emit("change")
+		self.assertEqual(calls, ["first"])
+
+		self.emitter.emit("change")
+		self.assertEqual(calls, ["first", "second"])
+
+	def test_error (self):
+		handler = Mock()
+		self.emitter.on("change", Mock(side_effect = Exception("test")))
+		self.emitter.on("change", handler)
+
+		self.emitter.emit("change")
+		self.assertEqual(len(self.flushLoggedErrors(Exception)), 1)
+		self.assertTrue(handler.called)
+
+	def test_weak (self):
+		handler = _Handler()
+		function = Mock()
+
+		self.emitter.on("change", handler.method, weak = True)
+		self.emitter.on("change", function, weak = True)
+		self.assertEqual(self.emitter.listeners("change"), [handler.method, function])
+
+		self.emitter.emit("change", value = 1)
+		self.assertEqual(handler.calls, [{ "value": 1 }])
+		self.assertEqual(function.call_count, 1)
+
+		# Weak handlers can be removed explicitly...
+		self.emitter.off("change", function)
+		self.assertEqual(self.emitter.listeners("change"), [handler.method])
+
+		# ... and are removed when collected
+		del handler
+		gc.collect()
+
+		self.assertEqual(self.emitter.listeners("change"), [])
+		self.assertFalse(self.emitter.emit("change", value = 2))
@@ -0,0 +1,57 @@
+from twisted.internet import task
+from twisted.trial import unittest
+
+from unittest.mock import patch
+
+from .. import queue
+
+
+class AsyncQueueTestCase (unittest.TestCase):
+	def setUp (self):
+		self.clock = task.Clock()
+		patcher = patch.object(queue, "reactor", self.clock)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+		self.done = []
+		self.queue = queue.AsyncQueue(self.done.append, paused = True)
+
+	def _process (self):
+		self.queue.resume()
+
+		while self.clock.getDelayedCalls():
+			self.clock.advance(0)
+
+	def test_fifo (self):
+		for i in range(5):
+			self.queue.append(i)
+
+		self.assertEqual(len(self.queue), 5)
+		self._process()
+		self.assertEqual(self.done, [0, 1, 2, 3, 4])
+
+	def test_priority (self):
+		self.queue.append("poll 1", queue.LOW)
+		self.queue.append("set 1")
+		self.queue.append("poll 2", queue.LOW)
+		self.queue.append("set 2", queue.NORMAL)
+		self.queue.append("stop", queue.HIGH)
+		self.queue.appendleft("set 0")
+
+		self._process()
+		self.assertEqual(self.done, ["stop", "set 0", "set 1", "set 2", "poll 1", "poll 2"])
+
+	def test_background (self):
+		self.assertEqual(queue.defaultPriority(), queue.NORMAL)
+
+		@queue.background
+		def poll (data):
+			self.assertEqual(queue.defaultPriority(), queue.LOW)
+			self.queue.append(data)
+
+		poll("poll")
+		self.queue.append("set")
+		self.assertEqual(queue.defaultPriority(), queue.NORMAL)
+
+		self._process()
+		self.assertEqual(self.done, ["set", "poll"])